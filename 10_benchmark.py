@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+🦜 WOODPECKER DETECTOR - BENCHMARKS
+Repeatable timings for every audio hot path
+
+Inputs are deterministic: synthetic drumming/noise from
+1_download_dataset_DEMO.py (fixed seed) plus clips cut from static/sounds.
+
+Usage:
+    python 10_benchmark.py run --output bench.json
+    python 10_benchmark.py run --only onset,ws --quick
+    python 10_benchmark.py compare baseline.json bench.json
+    python 10_benchmark.py run --output bench.json --baseline baseline.json
+"""
+import argparse
+import base64
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import soundfile as sf
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# ===== CONFIG =====
+SAMPLE_RATE = 22050
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOUNDS_DIR = "static/sounds"
+SEED = 0
+DEMO_CHUNKS = 8              # Synthetic drumming + noise chunks each
+SOUND_CHUNKS = 8             # 1 s clips cut from static/sounds
+WS_FRAME_SAMPLES = 8000      # Samples per WebSocket audio frame (as sent by the client)
+WARMUP_CALLS = 3
+ALLOC_CALLS = 10             # Calls traced by tracemalloc (separate from the timed pass)
+REGRESSION_TOLERANCE = 0.10  # compare: flag p50 / alloc growth above 10 %
+MIN_DELTA_MS = 0.05          # compare: ignore timing changes smaller than this
+
+# Server scripts (loaded by file path, they are not importable module names)
+MODULES = {
+    "train": "2_train_model.py",
+    "demo": "1_download_dataset_DEMO.py",
+    "onset": "7_FINAL_PRO.py",
+    "cnn": "5_main_app_FIXED.py",
+    "birdnet": "8_FINAL_PRO-birdnet.py",
+}
+
+class Skip(Exception):
+    """Benchmark can't run in this environment (missing model, dependency, ...)"""
+
+# ===== INPUTS =====
+class Context:
+    """Lazily loaded modules and the shared deterministic inputs"""
+
+    def __init__(self):
+        self._modules = {}
+        self._tmpdir = tempfile.TemporaryDirectory(prefix="woodpecker-bench-")
+        self.chunks = self._make_chunks()
+        self.wav_paths = self._write_wavs()
+        self.mp3_paths = self._sound_files()
+
+    def module(self, key):
+        if key not in self._modules:
+            try:
+                spec = importlib.util.spec_from_file_location(f"bench_{key}", os.path.join(BASE_DIR, MODULES[key]))
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            except ImportError as e:
+                raise Skip(f"{MODULES[key]}: {e}")
+            # Per-chunk INFO logs would dominate the timings
+            logging.getLogger(module.__name__).setLevel(logging.WARNING)
+            self._modules[key] = module
+        return self._modules[key]
+
+    def _sound_files(self):
+        files = []
+        if os.path.isdir(SOUNDS_DIR):
+            for root, _, names in sorted(os.walk(SOUNDS_DIR)):
+                files.extend(os.path.join(root, n) for n in sorted(names) if n.endswith(".mp3"))
+        return files
+
+    def _make_chunks(self):
+        """1 s float32 chunks: DEMO drumming, DEMO noise, static/sounds clips"""
+        demo = self.module("demo")
+        np.random.seed(SEED)  # DEMO generators use the global RNG
+        chunks = [demo.generate_drumming_sound(1.0) for _ in range(DEMO_CHUNKS)]
+        chunks += [demo.generate_noise_sound(1.0) for _ in range(DEMO_CHUNKS)]
+
+        import librosa
+        for path in self._sound_files():
+            if len(chunks) >= 2 * DEMO_CHUNKS + SOUND_CHUNKS:
+                break
+            y, _ = librosa.load(path, sr=SAMPLE_RATE, duration=1.0)
+            chunks.append(np.pad(y, (0, max(0, SAMPLE_RATE - len(y)))))
+
+        return [c.astype(np.float32) for c in chunks]
+
+    def _write_wavs(self):
+        paths = []
+        for i, chunk in enumerate(self.chunks[:2 * DEMO_CHUNKS]):
+            path = os.path.join(self._tmpdir.name, f"demo_{i:02d}.wav")
+            sf.write(path, chunk, SAMPLE_RATE)
+            paths.append(path)
+        return paths
+
+    def close(self):
+        self._tmpdir.cleanup()
+
+def cycle(items):
+    """Endless round-robin over items (each call gets the next input)"""
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+    return next_item
+
+def to_int16_bytes(audio_float32):
+    return (np.clip(audio_float32, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+# ===== BENCHMARKS =====
+# name -> (factory, iterations). A factory returns (call, audio_seconds_per_call, close)
+BENCHMARKS = {}
+
+def benchmark(name, iterations):
+    def register(factory):
+        BENCHMARKS[name] = (factory, iterations)
+        return factory
+    return register
+
+@benchmark("train.preprocess_audio", iterations=50)
+def bench_preprocess_audio(ctx):
+    train = ctx.module("train")
+    paths = ctx.wav_paths + ctx.mp3_paths
+    next_path = cycle(paths)
+    return lambda: train.preprocess_audio(next_path()), 1.0, None
+
+@benchmark("onset.detect_drumming_onset", iterations=300)
+def bench_detect_drumming_onset(ctx):
+    onset = ctx.module("onset")
+    next_chunk = cycle([np.clip(c * 15.0, -1.0, 1.0) for c in ctx.chunks])
+    return lambda: onset.detect_drumming_onset(next_chunk()), 1.0, None
+
+@benchmark("onset.analyze_audio", iterations=300)
+def bench_analyze_audio(ctx):
+    onset = ctx.module("onset")
+    next_chunk = cycle([np.clip(c * 15.0, -1.0, 1.0) for c in ctx.chunks])
+    return lambda: onset.analyze_audio(next_chunk()), 1.0, None
+
+@benchmark("onset.analyze_audio_streaming", iterations=300)
+def bench_analyze_audio_streaming(ctx):
+    onset = ctx.module("onset")
+    detector = onset.StreamingOnsetDetector()
+    next_chunk = cycle([np.clip(c * 15.0, -1.0, 1.0) for c in ctx.chunks])
+    return lambda: onset.analyze_audio(next_chunk(), detector), 1.0, None
+
+@benchmark("cnn.process_audio_chunk", iterations=100)
+def bench_process_audio_chunk(ctx):
+    cnn = ctx.module("cnn")
+    if cnn.model is None:
+        raise Skip(f"model not loaded ({cnn.MODEL_PATH})")
+    next_chunk = cycle(ctx.chunks)
+    return lambda: cnn.process_audio_chunk(next_chunk()), 1.0, None
+
+@benchmark("birdnet.analyze_with_birdnet", iterations=20)
+def bench_analyze_with_birdnet(ctx):
+    birdnet = ctx.module("birdnet")
+    if birdnet.get_analyzer() is None:
+        raise Skip("BirdNET analyzer not available")
+    # BirdNET works on 3 s windows
+    windows = [np.clip(np.concatenate(ctx.chunks[i:i + 3]) * 15.0, -1.0, 1.0)
+               for i in range(0, len(ctx.chunks) - 2, 3)]
+    next_window = cycle(windows)
+    devnull = open(os.devnull, "w")
+
+    def call():
+        # birdnetlib prints progress to stdout on every analysis
+        with contextlib.redirect_stdout(devnull):
+            return birdnet.analyze_with_birdnet(next_window())
+    return call, 3.0, devnull.close
+
+@benchmark("ingest.json_base64", iterations=2000)
+def bench_ingest_json_base64(ctx):
+    """Server side of the legacy path: JSON text -> base64 -> int16 -> float32"""
+    messages = [json.dumps({"type": "audio", "audio": base64.b64encode(to_int16_bytes(c[:WS_FRAME_SAMPLES])).decode()})
+                for c in ctx.chunks]
+    next_message = cycle(messages)
+
+    def call():
+        message = json.loads(next_message())
+        audio_int16 = np.frombuffer(base64.b64decode(message["audio"]), dtype=np.int16)
+        return audio_int16.astype(np.float32) / 32768.0
+    return call, WS_FRAME_SAMPLES / SAMPLE_RATE, None
+
+@benchmark("ingest.binary_frame", iterations=2000)
+def bench_ingest_binary_frame(ctx):
+    onset = ctx.module("onset")
+    frames = [onset.FRAME_HEADER.pack(onset.FRAME_MAGIC, onset.FRAME_VERSION, 1, i, SAMPLE_RATE)
+              + to_int16_bytes(c[:WS_FRAME_SAMPLES]) for i, c in enumerate(ctx.chunks)]
+    next_frame = cycle(frames)
+    return lambda: onset.decode_audio_frame(next_frame()), WS_FRAME_SAMPLES / SAMPLE_RATE, None
+
+def _ws_session(ctx):
+    """One in-process client + WebSocket session on the 7_FINAL_PRO app"""
+    from fastapi.testclient import TestClient
+
+    onset = ctx.module("onset")
+    stack = contextlib.ExitStack()
+    # A single TestClient keeps one event loop for the whole benchmark
+    client = stack.enter_context(TestClient(onset.app))
+    ws = stack.enter_context(client.websocket_connect("/ws"))
+    return onset, ws, stack.close
+
+@benchmark("ws.roundtrip_binary", iterations=200)
+def bench_ws_roundtrip_binary(ctx):
+    onset, ws, close = _ws_session(ctx)
+    frames = [onset.FRAME_HEADER.pack(onset.FRAME_MAGIC, onset.FRAME_VERSION, 1, i, SAMPLE_RATE)
+              + to_int16_bytes(c[:WS_FRAME_SAMPLES]) for i, c in enumerate(ctx.chunks)]
+    next_frame = cycle(frames)
+
+    def call():
+        ws.send_bytes(next_frame())
+        return ws.receive_text()
+    return call, WS_FRAME_SAMPLES / SAMPLE_RATE, close
+
+@benchmark("ws.roundtrip_json", iterations=200)
+def bench_ws_roundtrip_json(ctx):
+    _, ws, close = _ws_session(ctx)
+    messages = [json.dumps({"type": "audio", "audio": base64.b64encode(to_int16_bytes(c[:WS_FRAME_SAMPLES])).decode()})
+                for c in ctx.chunks]
+    next_message = cycle(messages)
+
+    def call():
+        ws.send_text(next_message())
+        return ws.receive_text()
+    return call, WS_FRAME_SAMPLES / SAMPLE_RATE, close
+
+# ===== MEASUREMENT =====
+def measure(call, iterations, audio_seconds):
+    """Timed pass (no tracing), then a short tracemalloc pass for allocations"""
+    for _ in range(WARMUP_CALLS):
+        call()
+
+    times = np.empty(iterations)
+    for i in range(iterations):
+        started = time.perf_counter_ns()
+        call()
+        times[i] = time.perf_counter_ns() - started
+    times_ms = times / 1e6
+
+    tracemalloc.start()
+    peaks = []
+    before_all = tracemalloc.get_traced_memory()[0]
+    for _ in range(ALLOC_CALLS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - before_all
+    tracemalloc.stop()
+
+    mean_s = float(times_ms.mean()) / 1000
+    return {
+        "iterations": iterations,
+        "mean_ms": round(float(times_ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(times_ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(times_ms, 99)), 4),
+        "min_ms": round(float(times_ms.min()), 4),
+        "max_ms": round(float(times_ms.max()), 4),
+        "stdev_ms": round(float(times_ms.std()), 4),
+        "ops_per_s": round(1.0 / mean_s, 2) if mean_s else None,
+        "realtime_x": round(audio_seconds / mean_s, 1) if mean_s and audio_seconds else None,
+        "alloc_peak_kb": round(max(peaks) / 1024, 1),
+        "alloc_retained_kb_per_call": round(retained / ALLOC_CALLS / 1024, 2),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(only=None, scale=1.0):
+    # Server scripts use relative paths (model file, static/)
+    os.chdir(BASE_DIR)
+    ctx = Context()
+    results = {}
+
+    try:
+        for name, (factory, iterations) in BENCHMARKS.items():
+            if only and not any(name == o or name.startswith(o + ".") for o in only):
+                continue
+
+            iterations = max(5, int(iterations * scale))
+            try:
+                call, audio_seconds, close = factory(ctx)
+            except Skip as e:
+                print(f"⏭️  {name:34s} skipped: {e}")
+                results[name] = {"skipped": str(e)}
+                continue
+
+            try:
+                stats = measure(call, iterations, audio_seconds)
+            finally:
+                if close:
+                    close()
+
+            results[name] = stats
+            realtime = f"{stats['realtime_x']:>8.1f}x rt" if stats["realtime_x"] else ""
+            print(f"⏱️  {name:34s} p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+                  f"{realtime}  peak {stats['alloc_peak_kb']:8.1f} KB")
+    finally:
+        ctx.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": SEED,
+            "scale": scale,
+        },
+        "benchmarks": results,
+    }
+
+# ===== COMPARE =====
+def compare(baseline, current, tolerance=REGRESSION_TOLERANCE):
+    """Print a comparison table, return the list of regressed benchmark names"""
+    regressions = []
+    base_results = baseline["benchmarks"]
+    print(f"\n{'benchmark':36s} {'base p50':>10s} {'new p50':>10s} {'Δ':>8s}   {'base KB':>9s} {'new KB':>9s}")
+    print("-" * 92)
+
+    for name, new in current["benchmarks"].items():
+        old = base_results.get(name)
+        if "skipped" in new:
+            print(f"{name:36s} {'':>10s} {'skipped':>10s}")
+            continue
+        if not old or "skipped" in old:
+            print(f"{name:36s} {'—':>10s} {new['p50_ms']:10.3f} {'new':>8s}")
+            continue
+
+        change = new["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        slower = change > tolerance and new["p50_ms"] - old["p50_ms"] > MIN_DELTA_MS
+        more_memory = (new["alloc_peak_kb"] > old["alloc_peak_kb"] * (1 + tolerance)
+                       and new["alloc_peak_kb"] - old["alloc_peak_kb"] > 64)
+        mark = "❌" if slower or more_memory else ("🚀" if change < -tolerance else "  ")
+        if slower or more_memory:
+            regressions.append(name)
+
+        print(f"{name:36s} {old['p50_ms']:10.3f} {new['p50_ms']:10.3f} {change*100:+7.1f}% "
+              f"  {old['alloc_peak_kb']:9.1f} {new['alloc_peak_kb']:9.1f} {mark}")
+
+    for name in base_results:
+        if name not in current["benchmarks"]:
+            print(f"{name:36s} {'(not run)':>10s}")
+
+    print()
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) over {tolerance*100:.0f}%: {', '.join(regressions)}")
+    else:
+        print(f"✅ No regressions over {tolerance*100:.0f}%")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Woodpecker Detector - benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="run benchmarks and write JSON results")
+    run_parser.add_argument("--output", default="bench.json")
+    run_parser.add_argument("--only", help="comma-separated names or groups (e.g. onset,ws)")
+    run_parser.add_argument("--scale", type=float, default=1.0, help="iteration count multiplier")
+    run_parser.add_argument("--quick", action="store_true", help="same as --scale 0.2")
+    run_parser.add_argument("--baseline", help="compare against this results file afterwards")
+    run_parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+
+    cmp_parser = sub.add_parser("compare", help="flag regressions of CURRENT against BASELINE")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("current")
+    cmp_parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+
+    sub.add_parser("list", help="list benchmark names")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        return 1 if compare(baseline, current, args.tolerance) else 0
+
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    only = [o.strip() for o in args.only.split(",")] if args.only else None
+
+    results = run(only, 0.2 if args.quick else args.scale)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results → {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            return 1 if compare(json.load(f), results, args.tolerance) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+🦜 WOODPECKER DETECTOR - WEBSOCKET LOAD TEST
+How many simultaneous phones can a server sustain?
+
+Opens N concurrent clients against /ws that replay real audio (static/sounds
+or a dataset folder) in 8000-sample frames at real-time pace (or faster with
+--speed), using the same messages as the embedded HTML client: binary int16
+frames with the 12-byte "WP" header plus a JSON ping every 4 s (--format json
+sends the legacy base64 messages instead). Replies are matched to frames by
+seq, so latency is end-to-end: send -> decode -> analysis -> reply.
+
+Reported per load level: sustained replies/s vs. offered chunks/s, latency
+percentiles, lag growth (slope of latency over time - positive means the
+server falls further behind every second) and unanswered frames. --ramp
+doubles the number of clients until the server saturates.
+
+Usage:
+    python 11_load_test.py --serve 7_FINAL_PRO.py --clients 8
+    python 11_load_test.py --serve 8_FINAL_PRO-birdnet.py --ramp --max-clients 32
+    python 11_load_test.py --url ws://127.0.0.1:8000/ws --ramp --speed 4 --output load.json
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import json
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+import numpy as np
+import librosa
+import websockets
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+# ===== CONFIG =====
+SAMPLE_RATE = 22050
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOUNDS_DIR = "static/sounds"
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg")
+MAX_SOURCE_SECONDS = 300.0   # Audio decoded into the replay pool
+CHUNK_SAMPLES = 8000         # Samples per frame (as sent by the HTML client)
+PING_INTERVAL = 4.0          # Keep-alive ping like the HTML client
+STEP_DURATION = 20.0         # Seconds per load level
+WARMUP_SECONDS = 3.0         # Latencies of frames sent earlier in a level are ignored
+DRAIN_TIMEOUT = 5.0          # Wait for late replies after the last frame
+SERVER_START_TIMEOUT = 120.0 # --serve: model / BirdNET loading can be slow
+
+# Saturation: the server no longer keeps up with the offered load
+SATURATION_THROUGHPUT = 0.95  # Replies/s below 95 % of offered chunks/s
+SATURATION_LAG_GROWTH = 10.0  # Latency grows faster than 10 ms per second
+SATURATION_P99 = 1.0          # Or p99 latency above 1 s
+
+# Binary audio frame: 12-byte header + raw PCM (little-endian)
+#   magic "WP" | version u8 | format u8 | seq u32 | sample_rate u32
+FRAME_HEADER = struct.Struct("<2sBBII")
+FRAME_MAGIC = b"WP"
+FRAME_VERSION = 1
+FRAME_FORMAT_INT16 = 1
+
+# ===== AUDIO =====
+
+def find_audio_files(source):
+    files = []
+    for root, _, names in os.walk(source):
+        files.extend(os.path.join(root, name) for name in names if name.lower().endswith(AUDIO_EXTENSIONS))
+    return sorted(files)
+
+def load_replay_chunks(source, max_seconds=MAX_SOURCE_SECONDS):
+    """Decode audio files into int16 chunks of CHUNK_SAMPLES (partial tails dropped)"""
+    files = find_audio_files(source)
+    if not files:
+        raise SystemExit(f"❌ No audio files in {source}")
+
+    chunks = []
+    total = 0.0
+    for path in files:
+        try:
+            audio, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+        except Exception as e:
+            logger.warning(f"⚠️ Skipping {path}: {e}")
+            continue
+
+        # Same conversion as the browser client: float * 32768 clipped to int16
+        pcm = np.clip(audio * 32768.0, -32768, 32767).astype("<i2")
+        n = len(pcm) // CHUNK_SAMPLES
+        chunks.extend(pcm[i * CHUNK_SAMPLES:(i + 1) * CHUNK_SAMPLES] for i in range(n))
+        total += len(audio) / SAMPLE_RATE
+        if total >= max_seconds:
+            break
+
+    if not chunks:
+        raise SystemExit(f"❌ No file in {source} is longer than one chunk")
+    logger.info(f"🎵 Replay pool: {len(chunks)} chunks ({len(chunks) * CHUNK_SAMPLES / SAMPLE_RATE:.0f} s) "
+                f"from {len(files)} files")
+    return chunks
+
+def encode_payloads(chunks, fmt):
+    """Pre-encode chunk payloads once so clients only add the header"""
+    if fmt == "json":
+        return [base64.b64encode(chunk.tobytes()).decode("ascii") for chunk in chunks]
+    return [chunk.tobytes() for chunk in chunks]
+
+# ===== CLIENT =====
+
+class ClientStats:
+    def __init__(self):
+        self.sent = 0
+        self.replies = 0
+        self.samples = []    # (send time, latency) after warm-up
+        self.received = []   # Reply arrival times (relative to the level start)
+        self.send_lag = []   # How late the client itself sent each frame
+        self.unanswered = 0
+        self.error = None
+
+async def run_client(url, payloads, fmt, start_index, speed, started, duration, stats):
+    """Replay frames at (speed x) real-time and match replies by seq"""
+    period = CHUNK_SAMPLES / SAMPLE_RATE / speed
+    warmup_end = started + WARMUP_SECONDS
+    pending = collections.OrderedDict()  # seq -> send time
+
+    async def receive(ws):
+        async for message in ws:
+            if isinstance(message, bytes):
+                continue
+            reply = json.loads(message)
+            if "chunk" not in reply or not pending:
+                continue  # pong / timeout
+
+            if fmt == "json":
+                # Legacy messages carry no seq; a session answers in order
+                _, sent_at = pending.popitem(last=False)
+            else:
+                sent_at = pending.pop(reply.get("seq"), None)
+                if sent_at is None:
+                    continue
+            stats.replies += 1
+            stats.received.append(time.perf_counter() - started)
+            if sent_at >= warmup_end:
+                stats.samples.append((sent_at - started, time.perf_counter() - sent_at))
+
+    try:
+        async with websockets.connect(url, max_size=None, ping_interval=None) as ws:
+            receiver = asyncio.create_task(receive(ws))
+            next_ping = time.perf_counter()
+            seq = 0
+
+            while True:
+                # Absolute schedule: a slow send does not push later frames back
+                due = started + seq * period
+                if due - started >= duration:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                now = time.perf_counter()
+                stats.send_lag.append(max(0.0, now - due))
+
+                if now >= next_ping:
+                    await ws.send(json.dumps({"type": "ping"}))
+                    next_ping = now + PING_INTERVAL
+
+                payload = payloads[(start_index + seq) % len(payloads)]
+                pending[seq] = time.perf_counter()
+                if fmt == "json":
+                    await ws.send(json.dumps({"type": "audio", "audio": payload}))
+                else:
+                    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, FRAME_FORMAT_INT16, seq, SAMPLE_RATE)
+                    await ws.send(header + payload)
+                stats.sent += 1
+                seq += 1
+
+            # Give in-flight frames a chance to come back
+            drain_until = time.perf_counter() + DRAIN_TIMEOUT
+            while pending and time.perf_counter() < drain_until:
+                await asyncio.sleep(0.05)
+            stats.unanswered = len(pending)
+            receiver.cancel()
+
+    except Exception as e:
+        stats.error = f"{type(e).__name__}: {e}"
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if len(values) else None
+
+async def run_level(url, payloads, fmt, clients, speed, duration, rng):
+    """Run one load level, returns its summary dict"""
+    stats = [ClientStats() for _ in range(clients)]
+    started = time.perf_counter() + 0.5  # Let all clients connect first
+    offsets = rng.integers(0, len(payloads), size=clients)
+
+    await asyncio.gather(*(
+        run_client(url, payloads, fmt, int(offset), speed, started, duration, s)
+        for offset, s in zip(offsets, stats)
+    ))
+
+    # Sustained rate: replies arriving between warm-up and the last scheduled frame
+    measured = duration - WARMUP_SECONDS
+    arrivals = np.array([t for s in stats for t in s.received])
+    sustained = np.count_nonzero((arrivals >= WARMUP_SECONDS) & (arrivals < duration)) / measured
+    samples = [sample for s in stats for sample in s.samples]
+    latencies = np.array([latency for _, latency in samples])
+    send_lag = np.array([lag for s in stats for lag in s.send_lag])
+
+    # Lag growth: slope of latency over send time (seconds per second)
+    lag_growth = None
+    if len(samples) >= 2:
+        times = np.array([t for t, _ in samples])
+        if np.ptp(times) > 0:
+            lag_growth = round(float(np.polyfit(times, latencies, 1)[0]) * 1000, 2)
+
+    offered = clients * SAMPLE_RATE / CHUNK_SAMPLES * speed
+    errors = [s.error for s in stats if s.error]
+
+    summary = {
+        "clients": clients,
+        "offered_chunks_per_s": round(offered, 2),
+        "sustained_chunks_per_s": round(sustained, 2),
+        "sent": sum(s.sent for s in stats),
+        "replies": sum(s.replies for s in stats),
+        "unanswered": sum(s.unanswered for s in stats),
+        "latency_ms": {
+            "p50": percentile_ms(latencies, 50),
+            "p95": percentile_ms(latencies, 95),
+            "p99": percentile_ms(latencies, 99),
+            "max": percentile_ms(latencies, 100),
+        },
+        "lag_growth_ms_per_s": lag_growth,
+        "client_send_lag_ms_p99": percentile_ms(send_lag, 99),
+        "errors": errors,
+    }
+    summary["saturated"] = is_saturated(summary)
+    return summary
+
+def is_saturated(summary):
+    latency = summary["latency_ms"]
+    return bool(
+        summary["errors"]
+        or summary["sustained_chunks_per_s"] < SATURATION_THROUGHPUT * summary["offered_chunks_per_s"]
+        or (summary["lag_growth_ms_per_s"] or 0.0) > SATURATION_LAG_GROWTH
+        or (latency["p99"] is None or latency["p99"] > SATURATION_P99 * 1000)
+    )
+
+def print_level(summary):
+    latency = summary["latency_ms"]
+    logger.info(
+        f"{summary['clients']:>7} {summary['offered_chunks_per_s']:>9.1f} {summary['sustained_chunks_per_s']:>9.1f} "
+        f"{latency['p50'] or 0:>8.1f} {latency['p95'] or 0:>8.1f} {latency['p99'] or 0:>8.1f} "
+        f"{summary['lag_growth_ms_per_s'] or 0:>9.2f} {summary['unanswered']:>6}  "
+        f"{'❌ saturated' if summary['saturated'] else '✅'}"
+    )
+    for error in summary["errors"][:3]:
+        logger.info(f"        ⚠️ {error}")
+
+# ===== LOCAL SERVER =====
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(script, port):
+    """Run a server script's app with uvicorn on 127.0.0.1 (scripts aren't importable by name)"""
+    code = (
+        "import importlib.util, sys, uvicorn\n"
+        f"spec = importlib.util.spec_from_file_location('server', {script!r})\n"
+        "module = importlib.util.module_from_spec(spec)\n"
+        "spec.loader.exec_module(module)\n"
+        f"uvicorn.run(module.app, host='127.0.0.1', port={port}, log_level='warning')\n"
+    )
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=BASE_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ {script} exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/status", timeout=1.0)
+            return process
+        except OSError:
+            time.sleep(0.5)
+
+    process.terminate()
+    raise SystemExit(f"❌ {script} did not start within {SERVER_START_TIMEOUT:.0f} s")
+
+# ===== MAIN =====
+
+async def run(args, payloads):
+    rng = np.random.default_rng(args.seed)
+    levels = []
+    clients = 1 if args.ramp else args.clients
+
+    logger.info(f"\n🎯 {args.url}  speed={args.speed}x  format={args.format}  {args.duration:.0f} s per level")
+    logger.info(f"{'clients':>7} {'offered/s':>9} {'chunks/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                f"{'lag ms/s':>9} {'lost':>6}")
+
+    while True:
+        summary = await run_level(args.url, payloads, args.format, clients, args.speed, args.duration, rng)
+        levels.append(summary)
+        print_level(summary)
+
+        if not args.ramp or summary["saturated"] or clients >= args.max_clients:
+            break
+        clients = min(clients * 2, args.max_clients)
+
+    sustained = [level["clients"] for level in levels if not level["saturated"]]
+    saturated = [level["clients"] for level in levels if level["saturated"]]
+    return {
+        "url": args.url,
+        "speed": args.speed,
+        "format": args.format,
+        "duration_per_level": args.duration,
+        "timestamp": datetime.now().isoformat(),
+        "levels": levels,
+        "max_sustained_clients": max(sustained) if sustained else 0,
+        "saturation_clients": min(saturated) if saturated else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket load test for the woodpecker detector servers")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws", help="WebSocket endpoint")
+    parser.add_argument("--serve", metavar="SCRIPT",
+                        help="Start SCRIPT (e.g. 7_FINAL_PRO.py) on a free local port and test it")
+    parser.add_argument("--source", default=SOUNDS_DIR, help="Folder with audio to replay (static/sounds or dataset/)")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients (without --ramp)")
+    parser.add_argument("--ramp", action="store_true", help="Double clients until the server saturates")
+    parser.add_argument("--max-clients", type=int, default=256, help="Upper bound for --ramp")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed (1.0 = real time)")
+    parser.add_argument("--duration", type=float, default=STEP_DURATION, help="Seconds per load level")
+    parser.add_argument("--format", choices=["binary", "json"], default="binary",
+                        help="binary frames (current client) or legacy base64 JSON")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for per-client replay offsets")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.duration <= WARMUP_SECONDS:
+        parser.error(f"--duration must be longer than the {WARMUP_SECONDS:.0f} s warm-up")
+
+    source = args.source if os.path.isabs(args.source) else os.path.join(BASE_DIR, args.source)
+    payloads = encode_payloads(load_replay_chunks(source), args.format)
+
+    server = None
+    if args.serve:
+        port = free_port()
+        logger.info(f"🚀 Starting {args.serve} on 127.0.0.1:{port}")
+        server = start_server(args.serve, port)
+        args.url = f"ws://127.0.0.1:{port}/ws"
+
+    try:
+        report = asyncio.run(run(args, payloads))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if report["saturation_clients"]:
+        logger.info(f"\n📈 Saturation at {report['saturation_clients']} clients, "
+                    f"max sustained: {report['max_sustained_clients']}")
+    else:
+        logger.info(f"\n📈 Not saturated, sustained {report['max_sustained_clients']} clients")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"💾 Report saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -4,87 +4,289 @@ Woodpecker Detector - Dataset Downloader
 Stahuje audio vzorky z Xeno-canto API pro trénink modelu
 """
 import os
+import argparse
 import requests
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
+from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Konfigurace
 DATASET_DIR = "dataset"
 CLASSES = ["woodpecker", "noise"]
 
-def download_from_xeno_canto(query, folder, limit=30):
-    """Stáhne vzorky z Xeno-canto API"""
+# API (lze přesměrovat na lokální testovací server: --api-url / XENO_CANTO_API)
+XENO_CANTO_API = os.environ.get("XENO_CANTO_API", "https://xeno-canto.org/api/2/recordings")
+
+# Stahování
+DOWNLOAD_WORKERS = 8           # Souběžných stahování
+REQUESTS_PER_SECOND = 5.0      # Token bucket - průměrný počet HTTP požadavků za sekundu
+REQUEST_BURST = 10             # Token bucket - maximální nárazový počet požadavků
+CHUNK_SIZE = 64 * 1024         # Stream zápis po 64 KB
+HTTP_RETRIES = 3               # Opakování při 429/5xx a chybách spojení
+MANIFEST_NAME = ".manifest.jsonl"  # Seznam dokončených ID (jeden JSON řádek na soubor)
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` požadavků/s, nárazově až `burst`"""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Počká na volný token"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+class Manifest:
+    """
+    Dokončená ID ve složce třídy. Záznam se přidá až po úplném stažení
+    (přejmenování .part), takže přerušený běh nic nezapočítá navíc.
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.completed = {}
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Useknutý poslední řádek po pádu
+                    self.completed[str(entry["id"])] = entry
+
+    def __contains__(self, rec_id):
+        return str(rec_id) in self.completed
+
+    def __len__(self):
+        return len(self.completed)
+
+    def add(self, rec_id, file_name, size):
+        entry = {"id": str(rec_id), "file": os.path.basename(file_name), "bytes": size}
+        with self._lock:
+            self.completed[entry["id"]] = entry
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+
+def make_session(pool_size=DOWNLOAD_WORKERS):
+    """HTTP session se sdíleným connection poolem a opakováním při 429/5xx"""
+    session = requests.Session()
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "woodpecker-detector/1.0 (dataset downloader)"
+    return session
+
+def iter_recordings(session, query, limiter, api_url=XENO_CANTO_API):
+    """Generátor nahrávek přes všechny stránky výsledků (stránky se čtou líně)"""
+    page = 1
+    num_pages = 1
+
+    while page <= num_pages:
+        limiter.acquire()
+        response = session.get(api_url, params={"query": query, "page": page}, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+
+        if page == 1:
+            print(f"✅ Nalezeno celkem: {int(data.get('numRecordings', 0))} nahrávek "
+                  f"({data.get('numPages', 1)} stránek)")
+
+        num_pages = int(data.get('numPages', 1))
+        yield from data.get('recordings', [])
+        page += 1
+
+def parse_content_range(value):
+    """
+    Content-Range -> (start, total), neznámé části jsou None.
+    "bytes 1000-4999/5000" -> (1000, 5000), "bytes */5000" -> (None, 5000)
+    """
+    unit, _, spec = (value or "").partition(" ")
+    if unit != "bytes":
+        return None, None
+    span, _, total = spec.partition("/")
+    start = span.partition("-")[0]
+    return (int(start) if start.isdigit() else None,
+            int(total) if total.isdigit() else None)
+
+def download_file(session, url, file_name, limiter):
+    """
+    Stáhne url do file_name přes file_name.part. Existující .part se
+    dotáhne HTTP Range požadavkem. Vrací velikost souboru v bajtech.
+    """
+    part_name = file_name + ".part"
+    offset = os.path.getsize(part_name) if os.path.exists(part_name) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    limiter.acquire()
+    restart = None  # Důvod, proč .part zahodit a stáhnout soubor znovu
+    with session.get(url, headers=headers, stream=True, timeout=30) as response:
+        if response.status_code == 416:
+            # Range mimo soubor - .part je kompletní, jen pokud sedí na celkovou velikost
+            _, total = parse_content_range(response.headers.get("Content-Range"))
+            if total is not None and total == offset:
+                os.replace(part_name, file_name)
+                return offset
+            restart = f"{offset} B, server hlásí {total} B"
+        else:
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                mode = 'ab'
+                # Content-Range: bytes 1000-4999/5000
+                start, expected = parse_content_range(response.headers.get("Content-Range"))
+                if start != offset:
+                    # Odpověď nenavazuje na .part - připojení by soubor poškodilo
+                    restart = f"Range od {start} místo {offset}"
+            else:
+                # Server Range ignoroval - stahujeme od začátku
+                mode = 'wb'
+                offset = 0
+                length = response.headers.get("Content-Length")
+                expected = int(length) if length and length.isdigit() else None
+
+            if restart is None:
+                with open(part_name, mode) as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+
+    if restart is not None:
+        print(f"  ⚠️ {os.path.basename(part_name)}: {restart} - stahuji znovu")
+        os.remove(part_name)
+        return download_file(session, url, file_name, limiter)
+
+    size = os.path.getsize(part_name)
+    if expected is not None and size != expected:
+        raise IOError(f"neúplné stažení ({size}/{expected} B) - dotáhne se při dalším běhu")
+
+    os.replace(part_name, file_name)
+    return size
+
+def download_from_xeno_canto(query, folder, limit=30, api_url=XENO_CANTO_API,
+                             workers=DOWNLOAD_WORKERS, session=None, limiter=None):
+    """
+    Stáhne vzorky z Xeno-canto API (všechny stránky výsledků, souběžně).
+    limit = kolik nahrávek má složka obsahovat (None = všechny nalezené).
+    """
     print(f"\n{'='*60}")
     print(f"🔍 Hledám: {query}")
     print(f"{'='*60}")
 
     os.makedirs(folder, exist_ok=True)
 
-    api_url = f"https://xeno-canto.org/api/2/recordings?query={query}"
-
-    try:
-        print(f"📡 Připojuji se k API...")
-        response = requests.get(api_url, timeout=10)
-        data = response.json()
-    except Exception as e:
-        print(f"❌ Chyba připojení: {e}")
-        return
-
-    num_recordings = int(data.get('numRecordings', 0))
-    print(f"✅ Nalezeno celkem: {num_recordings} nahrávek")
+    session = session or make_session(workers)
+    limiter = limiter or TokenBucket()
+    manifest = Manifest(folder)
 
-    if num_recordings == 0:
-        print("⚠️  Žádné nahrávky nenalezeny!")
-        return
+    print(f"📡 Připojuji se k API...")
+    recordings = iter_recordings(session, query, limiter, api_url)
 
     count = 0
     skipped = 0
+    failed = 0
+    downloaded_bytes = 0
+    start = time.time()
+    pending = {}
 
-    for rec in data.get('recordings', []):
-        if count >= limit:
-            break
-
-        file_url = rec.get('file', '')
-        file_id = rec.get('id', 'unknown')
-        file_name = os.path.join(folder, f"{file_id}.mp3")
+    def has_room():
+        return limit is None or skipped + count + len(pending) < limit
 
-        # Stahování pouze pokud soubor neexistuje
-        if os.path.exists(file_name):
-            skipped += 1
-            continue
+    def submit_next(executor):
+        """Zařadí další nahrávku, která ještě není stažená. False = došly výsledky."""
+        nonlocal skipped
+        for rec in recordings:
+            file_id = rec.get('id', 'unknown')
+            file_name = os.path.join(folder, f"{file_id}.mp3")
 
-        species = rec.get('en', 'Unknown')
-        rec_type = rec.get('type', 'N/A')
-        quality = rec.get('q', '?')
+            # Stažené soubory přeskočíme (a doplníme do manifestu soubory ze starších běhů)
+            if file_id in manifest or os.path.exists(file_name):
+                if file_id not in manifest:
+                    manifest.add(file_id, file_name, os.path.getsize(file_name))
+                skipped += 1
+                if not has_room():
+                    return False
+                continue
 
-        print(f"\n📥 [{count+1}/{limit}] {species} ({rec_type}) [Q:{quality}]")
-        print(f"   🔗 {file_url[:60]}...")
+            # Xeno-canto vrací i URL bez schématu ("//xeno-canto.org/...")
+            file_url = urljoin(api_url, rec.get('file', ''))
+            if not rec.get('file'):
+                continue
 
-        try:
-            # Stažení souboru
-            audio_response = requests.get(file_url, timeout=30)
-            audio_response.raise_for_status()
+            future = executor.submit(download_file, session, file_url, file_name, limiter)
+            pending[future] = (rec, file_name)
+            return True
+        return False
 
-            with open(file_name, 'wb') as f:
-                f.write(audio_response.content)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        exhausted = False
+        while True:
+            # Fronta drží max. 2×workers rozpracovaných souborů
+            while not exhausted and len(pending) < workers * 2 and has_room():
+                try:
+                    exhausted = not submit_next(executor)
+                except (requests.RequestException, ValueError) as e:
+                    # Chyba API (stránka výsledků) - rozpracované soubory dokončíme
+                    print(f"❌ Chyba připojení: {e}")
+                    exhausted = True
 
-            file_size = os.path.getsize(file_name) / 1024  # KB
-            print(f"   ✅ Uloženo: {file_size:.1f} KB")
+            if not pending:
+                break
 
-            count += 1
-            time.sleep(0.5)  # Rate limiting
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rec, file_name = pending.pop(future)
+                file_id = rec.get('id', 'unknown')
+                species = rec.get('en', 'Unknown')
+                rec_type = rec.get('type', 'N/A')
+                quality = rec.get('q', '?')
+                try:
+                    size = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"   ❌ {file_id}: chyba stahování: {e}")
+                    continue
 
-        except Exception as e:
-            print(f"   ❌ Chyba stahování: {e}")
+                manifest.add(file_id, file_name, size)
+                count += 1
+                downloaded_bytes += size
+                progress = f"{skipped + count}/{limit}" if limit else f"{skipped + count}"
+                print(f"📥 [{progress}] {species} ({rec_type}) [Q:{quality}] "
+                      f"✅ {file_id}.mp3 {size / 1024:.1f} KB")
 
+    elapsed = time.time() - start
     print(f"\n{'='*60}")
-    print(f"✅ Staženo: {count} souborů")
+    print(f"✅ Staženo: {count} souborů ({downloaded_bytes / 1024 / 1024:.1f} MB za {elapsed:.1f}s)")
     if skipped > 0:
         print(f"⏭️  Přeskočeno (již existuje): {skipped}")
+    if failed > 0:
+        print(f"⚠️  Chyby: {failed} (nedokončené .part soubory se dotáhnou při dalším běhu)")
     print(f"{'='*60}")
 
-def main():
+def main(limit=50, api_url=XENO_CANTO_API, workers=DOWNLOAD_WORKERS, rate=REQUESTS_PER_SECOND):
     print("""
     ╔══════════════════════════════════════════════════════════╗
     ║         🦜 WOODPECKER DETECTOR - DATASET LOADER          ║
@@ -92,13 +294,17 @@ def main():
     ╚══════════════════════════════════════════════════════════╝
     """)
 
+    # Sdílená session a rate limiter pro obě fáze
+    session = make_session(workers)
+    limiter = TokenBucket(rate, REQUEST_BURST)
+
     # 1. Stáhneme Datla (hledáme specificky "drumming")
     # Používáme rod Dendrocopos (Strakapoud), který je v ČR běžný
     print("\n🎯 FÁZE 1: Stahování zvuků datlů (bubnování)")
     download_from_xeno_canto(
         "gen:Dendrocopos type:drumming q:A",
         os.path.join(DATASET_DIR, "woodpecker"),
-        limit=50
+        limit=limit, api_url=api_url, workers=workers, session=session, limiter=limiter
     )
 
     # 2. Stáhneme "Šum lesa" (negativní vzorky)
@@ -106,7 +312,7 @@ def main():
     download_from_xeno_canto(
         "gen:Parus type:song q:A",
         os.path.join(DATASET_DIR, "noise"),
-        limit=50
+        limit=limit, api_url=api_url, workers=workers, session=session, limiter=limiter
     )
 
     # Statistika
@@ -128,4 +334,15 @@ def main():
     """)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Woodpecker Detector - Dataset Downloader")
+    parser.add_argument("--limit", type=int, default=50,
+                        help="počet nahrávek na třídu (0 = všechny nalezené)")
+    parser.add_argument("--api-url", default=XENO_CANTO_API,
+                        help=f"URL Xeno-canto API (default {XENO_CANTO_API})")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS,
+                        help=f"souběžných stahování (default {DOWNLOAD_WORKERS})")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND,
+                        help=f"max. HTTP požadavků za sekundu (default {REQUESTS_PER_SECOND})")
+    args = parser.parse_args()
+
+    main(limit=args.limit or None, api_url=args.api_url, workers=args.workers, rate=args.rate)
@@ -4,11 +4,17 @@ Woodpecker Detector - AI Model Trainer
 Trénuje CNN model pro rozpoznávání klepání datla
 """
 import os
+import argparse
+import hashlib
+import itertools
+import time
 import numpy as np
 import librosa
 import tensorflow as tf
 from sklearn.model_selection import train_test_split
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import json
 from datetime import datetime
 
@@ -17,9 +23,30 @@ DATASET_DIR = "dataset"
 SAMPLE_RATE = 22050
 DURATION = 1.0  # Délka vzorku v sekundách
 N_MELS = 64
+FMAX = 8000
 MODEL_PATH = "woodpecker_model.keras"
 METADATA_PATH = "model_metadata.json"
 
+# TFLite export (post-training kvantizace pro edge servery)
+TFLITE_FP16_PATH = "woodpecker_model_fp16.tflite"
+TFLITE_INT8_PATH = "woodpecker_model_int8.tflite"
+TFLITE_CALIBRATION_SAMPLES = 200  # Počet trénovacích spektrogramů pro kalibraci int8
+
+# Cache spektrogramů (klíč = hash obsahu souboru + parametry předzpracování)
+FEATURE_CACHE_DIR = "cache/features"
+
+# Paralelní předzpracování (dekódování MP3 přes všechna jádra)
+PREPROCESS_WORKERS = os.cpu_count() or 1
+
+# Streaming trénink z celých nahrávek (--streaming)
+AUDIO_CACHE_DIR = "cache/audio"      # Dekódované nahrávky (float32 .npy, čtené přes mmap)
+MAX_RECORDING_DURATION = 300.0       # Delší nahrávky se ořežou (s)
+CROPS_PER_RECORDING = 64             # Náhodných výřezů z jedné nahrávky za epochu
+EVAL_CROP_HOP = 0.5                  # Posun klouzavého okna pro testovací výřezy (s)
+SHUFFLE_BUFFER = 2048                # Spektrogramů v shuffle bufferu
+STREAM_BATCH_SIZE = 32
+HOP_LENGTH = 512                     # librosa default pro melspectrogram
+
 def preprocess_audio(file_path):
     """Převede audio soubor na mel-spektrogram"""
     try:
@@ -33,33 +60,154 @@ def preprocess_audio(file_path):
         else:
             y = y[:target_length]
 
-        # Mel-Spectrogram
-        mel_spec = librosa.feature.melspectrogram(
-            y=y,
-            sr=sr,
-            n_mels=N_MELS,
-            fmax=8000
-        )
+        return melspectrogram(y, sr)
 
-        # Logaritmická škála
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    except Exception as e:
+        print(f"❌ Chyba u {file_path}: {e}")
+        return None
 
-        # Normalizace 0-1
-        mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (mel_spec_db.max() - mel_spec_db.min() + 1e-8)
+def melspectrogram(y, sr=SAMPLE_RATE):
+    """Normalizovaný log mel-spektrogram (N_MELS, frames, 1) z 1s okna"""
+    # Mel-Spectrogram
+    mel_spec = librosa.feature.melspectrogram(
+        y=y,
+        sr=sr,
+        n_mels=N_MELS,
+        fmax=FMAX
+    )
 
-        return mel_spec_norm[..., np.newaxis]  # Přidání kanálu
+    # Logaritmická škála
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+
+    # Normalizace 0-1
+    mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (mel_spec_db.max() - mel_spec_db.min() + 1e-8)
+
+    return mel_spec_norm[..., np.newaxis]  # Přidání kanálu
+
+def content_hash(file_path, params):
+    """SHA-1 z parametrů zpracování a obsahu souboru"""
+    h = hashlib.sha1()
+    h.update(json.dumps(params, sort_keys=True).encode())
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def feature_cache_key(file_path):
+    """Klíč cache spektrogramu"""
+    params = {"sample_rate": SAMPLE_RATE, "duration": DURATION, "n_mels": N_MELS, "fmax": FMAX}
+    return content_hash(file_path, params)
+
+def save_npy_atomic(path, array):
+    """Zapíše .npy přes dočasný soubor - přerušený běh nenechá půlku souboru"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path[:-len(".npy")] + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def load_features(file_path, use_cache=True):
+    """
+    Vrátí (spektrogram, z_cache). Z cache se čte memory-mapped .npy,
+    dekódují se jen nové nebo změněné soubory.
+    """
+    if not use_cache:
+        return preprocess_audio(file_path), False
 
-    except Exception as e:
+    try:
+        key = feature_cache_key(file_path)
+    except OSError as e:
         print(f"❌ Chyba u {file_path}: {e}")
-        return None
+        return None, False
 
-def load_dataset():
-    """Načte a zpracuje všechny audio soubory"""
-    X = []
-    y = []
-    labels = {"noise": 0, "woodpecker": 1}
+    cache_path = os.path.join(FEATURE_CACHE_DIR, key[:2], f"{key}.npy")
+    if os.path.exists(cache_path):
+        try:
+            return np.load(cache_path, mmap_mode='r'), True
+        except (OSError, ValueError):
+            pass  # Poškozený záznam - spočítáme znovu
 
-    print("\n📂 Načítám a zpracovávám audio soubory...")
+    spec = preprocess_audio(file_path)
+    if spec is not None:
+        save_npy_atomic(cache_path, spec.astype(np.float32))
+
+    return spec, False
+
+def _load_features_task(file_path, use_cache):
+    """Úloha pro worker proces - chyba jednoho souboru neshodí celý běh"""
+    try:
+        spec, cached = load_features(file_path, use_cache)
+    except Exception as e:
+        print(f"❌ Chyba u {file_path}: {e}")
+        return None, False
+
+    # memmap z cache převedeme na běžné pole (posílá se zpět do hlavního procesu)
+    return (np.array(spec) if spec is not None else None), cached
+
+def decode_recording(file_path, use_cache=True):
+    """
+    Dekóduje celou nahrávku do AUDIO_CACHE_DIR (float32 mono .npy).
+    Vrací (cesta, počet vzorků, z_cache); bez cache se soubor dekóduje znovu.
+    """
+    params = {"sample_rate": SAMPLE_RATE, "max_duration": MAX_RECORDING_DURATION}
+    key = content_hash(file_path, params)
+    cache_path = os.path.join(AUDIO_CACHE_DIR, key[:2], f"{key}.npy")
+
+    if use_cache and os.path.exists(cache_path):
+        try:
+            return cache_path, len(np.load(cache_path, mmap_mode='r')), True
+        except (OSError, ValueError):
+            pass  # Poškozený záznam - dekódujeme znovu
+
+    y, _ = librosa.load(file_path, sr=SAMPLE_RATE, duration=MAX_RECORDING_DURATION)
+    save_npy_atomic(cache_path, y.astype(np.float32))
+    return cache_path, len(y), False
+
+def _decode_recording_task(file_path, use_cache):
+    """Úloha pro worker proces - vrací (None, 0, False) při chybě"""
+    try:
+        return decode_recording(file_path, use_cache)
+    except Exception as e:
+        print(f"❌ Chyba u {file_path}: {e}")
+        return None, 0, False
+
+def load_features_parallel(paths, use_cache=True, workers=PREPROCESS_WORKERS,
+                           task=_load_features_task):
+    """
+    Zpracuje soubory v process poolu (task = spektrogram nebo celá nahrávka).
+    Výsledky jsou ve stejném pořadí jako paths, takže labely
+    i train_test_split zůstávají deterministické.
+    """
+    results = [None] * len(paths)
+    report_every = max(1, len(paths) // 20)
+
+    if workers > 1 and len(paths) > 1:
+        chunksize = max(1, len(paths) // (workers * 4))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                mapped = executor.map(task, paths, itertools.repeat(use_cache),
+                                      chunksize=chunksize)
+                for i, result in enumerate(mapped):
+                    results[i] = result
+                    if i % report_every == 0:
+                        print(f"   Zpracováno: {i}/{len(paths)} ({workers} procesů)", end='\r')
+        except BrokenProcessPool as e:
+            print(f"\n⚠️  Worker proces spadl ({e}) - zbytek zpracuji sériově")
+
+    # Sériově: workers=1, nebo co nestihl spadlý pool
+    for i, path in enumerate(paths):
+        if results[i] is None:
+            results[i] = task(path, use_cache)
+            if i % report_every == 0:
+                print(f"   Zpracováno: {i}/{len(paths)}", end='\r')
+
+    print(f"   ✅ Zpracováno: {len(paths)}/{len(paths)}")
+    return results
+
+def list_dataset_files():
+    """Vrátí (cesty, labely) všech audio souborů datasetu"""
+    labels = {"noise": 0, "woodpecker": 1}
+    paths = []
+    path_labels = []
 
     for label_name, label_idx in labels.items():
         dir_path = os.path.join(DATASET_DIR, label_name)
@@ -68,24 +216,164 @@ def load_dataset():
             print(f"⚠️  Složka {dir_path} neexistuje!")
             continue
 
-        files = [f for f in os.listdir(dir_path) if f.endswith(('.mp3', '.wav'))]
+        # Seřazeno - pořadí nezávisí na souborovém systému
+        files = sorted(f for f in os.listdir(dir_path) if f.endswith(('.mp3', '.wav')))
         print(f"\n{'='*60}")
         print(f"🏷️  Třída: {label_name.upper()} (Label: {label_idx})")
         print(f"📁 Souborů: {len(files)}")
 
-        for i, fname in enumerate(files):
-            if i % 10 == 0:
-                print(f"   Zpracováno: {i}/{len(files)}", end='\r')
+        paths.extend(os.path.join(dir_path, fname) for fname in files)
+        path_labels.extend([label_idx] * len(files))
+
+    print(f"\n{'='*60}")
+    return paths, path_labels
+
+def load_dataset(use_cache=True, workers=PREPROCESS_WORKERS):
+    """Načte a zpracuje všechny audio soubory"""
+    X = []
+    y = []
+
+    print("\n📂 Načítám a zpracovávám audio soubory...")
 
-            spec = preprocess_audio(os.path.join(dir_path, fname))
-            if spec is not None:
-                X.append(spec)
-                y.append(label_idx)
+    paths, path_labels = list_dataset_files()
+    results = load_features_parallel(paths, use_cache, workers)
 
-        print(f"   ✅ Zpracováno: {len(files)}/{len(files)}")
+    cache_hits = 0
+    for (spec, cached), label_idx in zip(results, path_labels):
+        if spec is not None:
+            X.append(spec)
+            y.append(label_idx)
+            cache_hits += cached
+
+    if use_cache:
+        print(f"\n💾 Feature cache: {cache_hits}/{len(X)} z cache, {len(X) - cache_hits} dekódováno")
 
     return np.array(X), np.array(y)
 
+def load_recordings(use_cache=True, workers=PREPROCESS_WORKERS):
+    """Dekóduje celé nahrávky do audio cache. Vrací [(cesta, vzorků)] a labely."""
+    print("\n📂 Dekóduji celé nahrávky...")
+
+    paths, path_labels = list_dataset_files()
+    results = load_features_parallel(paths, use_cache, workers, task=_decode_recording_task)
+
+    recordings = []
+    labels = []
+    cache_hits = 0
+    for (cache_path, n_samples, cached), label_idx in zip(results, path_labels):
+        if cache_path is not None and n_samples > 0:
+            recordings.append((cache_path, n_samples))
+            labels.append(label_idx)
+            cache_hits += cached
+
+    total_s = sum(n for _, n in recordings) / SAMPLE_RATE
+    print(f"\n💾 Audio cache: {cache_hits}/{len(recordings)} z cache, "
+          f"{len(recordings) - cache_hits} dekódováno ({total_s/60:.1f} min audia)")
+
+    return recordings, np.array(labels)
+
+def _crop(audio, start, target_length):
+    """Výřez délky target_length (doplněný nulami u krátkých nahrávek)"""
+    crop = np.array(audio[start:start + target_length], dtype=np.float32)
+    if len(crop) < target_length:
+        crop = np.pad(crop, (0, target_length - len(crop)))
+    return crop
+
+def random_crops(recordings, labels, crops_per_recording, rng):
+    """Generátor náhodných 1s výřezů - nahrávky promíchané, audio čtené přes mmap"""
+    target_length = int(SAMPLE_RATE * DURATION)
+    audio = [np.load(path, mmap_mode='r') for path, _ in recordings]
+
+    for j in rng.permutation(len(recordings) * crops_per_recording):
+        i = j // crops_per_recording
+        start = rng.integers(0, max(len(audio[i]) - target_length, 0) + 1)
+        yield _crop(audio[i], start, target_length), np.float32(labels[i])
+
+def sliding_crops(recordings, labels, hop=EVAL_CROP_HOP):
+    """Generátor výřezů klouzavým oknem (deterministický - pro evaluaci)"""
+    target_length = int(SAMPLE_RATE * DURATION)
+    hop_length = int(SAMPLE_RATE * hop)
+
+    for (path, n_samples), label in zip(recordings, labels):
+        audio = np.load(path, mmap_mode='r')
+        for start in range(0, max(n_samples - target_length, 0) + 1, hop_length):
+            yield _crop(audio, start, target_length), np.float32(label)
+
+def count_sliding_crops(recordings, hop=EVAL_CROP_HOP):
+    """Počet výřezů, které vrátí sliding_crops"""
+    target_length = int(SAMPLE_RATE * DURATION)
+    hop_length = int(SAMPLE_RATE * hop)
+    return sum(max(n - target_length, 0) // hop_length + 1 for _, n in recordings)
+
+def crop_dataset(generator_fn, training):
+    """
+    tf.data pipeline: výřezy → paralelní mel-spektrogram → shuffle → batch → prefetch.
+    V paměti je jen shuffle buffer a několik batchů, ne celý dataset.
+    """
+    target_length = int(SAMPLE_RATE * DURATION)
+    spec_shape = (N_MELS, 1 + target_length // HOP_LENGTH, 1)
+
+    def to_features(crop, label):
+        spec = tf.numpy_function(lambda a: melspectrogram(a).astype(np.float32), [crop], tf.float32)
+        spec.set_shape(spec_shape)
+        return spec, label
+
+    ds = tf.data.Dataset.from_generator(
+        generator_fn,
+        output_signature=(tf.TensorSpec((target_length,), tf.float32),
+                          tf.TensorSpec((), tf.float32))
+    )
+    ds = ds.map(to_features, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+    if training:
+        ds = ds.shuffle(SHUFFLE_BUFFER)
+    return ds.batch(STREAM_BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+class InputStallMeter(tf.keras.callbacks.Callback):
+    """
+    Měří, kolik času trénink čekal na vstupní pipeline.
+
+    Keras volá next() na tf.data uvnitř grafu, takže to z callbacku změřit
+    nejde - dataset proto obalíme Python generátorem (batches) a měříme čas
+    strávený v next(). Při vysokém podílu je úzkým hrdlem data loader,
+    při nízkém model.
+    """
+
+    def __init__(self, dataset):
+        super().__init__()
+        self._iterator = iter(dataset.repeat())
+        self._stall = 0.0
+        self._epoch_start = 0.0
+        self._last_batch_end = 0.0
+        self.epochs = []
+
+    def batches(self):
+        while True:
+            t0 = time.perf_counter()
+            batch = next(self._iterator)
+            self._stall += time.perf_counter() - t0
+            yield batch
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._stall = 0.0
+        self._epoch_start = self._last_batch_end = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._last_batch_end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Jen trénovací část epochy - validace se nepočítá
+        train_s = self._last_batch_end - self._epoch_start
+        share = self._stall / train_s if train_s > 0 else 0.0
+        self.epochs.append({
+            "epoch": epoch + 1,
+            "train_seconds": round(train_s, 2),
+            "input_stall_seconds": round(self._stall, 2),
+            "input_stall_share": round(share, 3)
+        })
+        bottleneck = "data loader" if share > 0.2 else "model"
+        print(f"   ⏱️  Čekání na data: {self._stall:.1f}s z {train_s:.1f}s "
+              f"({share*100:.0f}%) → úzké hrdlo: {bottleneck}")
+
 def create_model(input_shape):
     """Vytvoří CNN model"""
     model = tf.keras.models.Sequential([
@@ -125,7 +413,130 @@ def create_model(input_shape):
 
     return model
 
-def main():
+def training_callbacks():
+    """Early stopping + snížení learning rate při stagnaci"""
+    return [
+        tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss',
+            patience=5,
+            restore_best_weights=True
+        ),
+        tf.keras.callbacks.ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=3,
+            min_lr=0.00001
+        )
+    ]
+
+def tflite_predict(model_content, X):
+    """Spustí TFLite model nad X a vrátí pravděpodobnosti (float)"""
+    interpreter = tf.lite.Interpreter(model_content=model_content)
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+
+    interpreter.resize_tensor_input(input_details["index"], X.shape)
+    interpreter.allocate_tensors()
+
+    x = X.astype(np.float32)
+    scale, zero_point = input_details["quantization"]
+    if input_details["dtype"] != np.float32 and scale:
+        info = np.iinfo(input_details["dtype"])
+        x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(input_details["dtype"])
+
+    interpreter.set_tensor(input_details["index"], x)
+    interpreter.invoke()
+    out = interpreter.get_tensor(output_details["index"])
+
+    scale, zero_point = output_details["quantization"]
+    if output_details["dtype"] != np.float32 and scale:
+        out = (out.astype(np.float32) - zero_point) * scale
+
+    return out[:, 0]
+
+def export_tflite(model, X_calib, X_test, y_test):
+    """Exportuje float16 a int8 TFLite modely a porovná přesnost s Keras modelem"""
+    print(f"\n{'='*60}")
+    print("📦 TFLITE EXPORT")
+    print(f"{'='*60}")
+
+    # float16 - poloviční velikost, výpočet stále ve float32
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    fp16_model = converter.convert()
+
+    # int8 - plná celočíselná kvantizace, kalibrace na trénovacích spektrogramech
+    calib = X_calib[:TFLITE_CALIBRATION_SAMPLES].astype(np.float32)
+
+    def representative_dataset():
+        for spec in calib:
+            yield [spec[np.newaxis]]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    int8_model = converter.convert()
+
+    # Porovnání přesnosti na testovacím splitu
+    keras_probs = model.predict(X_test, verbose=0)[:, 0]
+    keras_acc = float(np.mean((keras_probs > 0.5) == y_test))
+    print(f"\n   Keras:        acc={keras_acc*100:.2f}%")
+
+    report = {"keras_test_accuracy": keras_acc}
+    for name, path, content in [("fp16", TFLITE_FP16_PATH, fp16_model),
+                                ("int8", TFLITE_INT8_PATH, int8_model)]:
+        with open(path, 'wb') as f:
+            f.write(content)
+
+        probs = tflite_predict(content, X_test)
+        acc = float(np.mean((probs > 0.5) == y_test))
+        max_diff = float(np.max(np.abs(probs - keras_probs))) if len(probs) else 0.0
+        size_kb = len(content) / 1024
+
+        print(f"   TFLite {name}:  acc={acc*100:.2f}% "
+              f"(Δ {(acc - keras_acc)*100:+.2f} p.b., max |Δp|={max_diff:.4f}), "
+              f"{size_kb:.0f} KB → {path}")
+
+        report[name] = {
+            "path": path,
+            "size_kb": round(size_kb, 1),
+            "test_accuracy": acc,
+            "accuracy_delta": acc - keras_acc,
+            "max_probability_delta": max_diff
+        }
+
+    return report
+
+def export_only(use_cache=True, workers=PREPROCESS_WORKERS):
+    """Exportuje TFLite z již natrénovaného modelu (bez tréninku)"""
+    # Data načítáme před modelem - worker procesy se forkují bez běžícího TF runtime
+    X, y = load_dataset(use_cache, workers)
+    if len(X) == 0:
+        print("\n❌ Žádná data pro kalibraci! Spusť nejprve 1_download_dataset.py")
+        return
+
+    model = tf.keras.models.load_model(MODEL_PATH)
+
+    # Stejný split jako při tréninku (random_state=42)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+
+    report = export_tflite(model, X_train, X_test, y_test)
+
+    metadata = {}
+    if os.path.exists(METADATA_PATH):
+        with open(METADATA_PATH) as f:
+            metadata = json.load(f)
+    metadata["tflite"] = report
+    with open(METADATA_PATH, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+def main(use_cache=True, workers=PREPROCESS_WORKERS):
     print("""
     ╔══════════════════════════════════════════════════════════╗
     ║          🧠 WOODPECKER DETECTOR - AI TRAINER             ║
@@ -134,7 +545,7 @@ def main():
     """)
 
     # Načtení dat
-    X, y = load_dataset()
+    X, y = load_dataset(use_cache, workers)
 
     if len(X) == 0:
         print("\n❌ Žádná data k tréninku! Spusť nejprve 1_download_dataset.py")
@@ -164,20 +575,7 @@ def main():
     print("\n📋 Architektura modelu:")
     model.summary()
 
-    # Callbacks
-    callbacks = [
-        tf.keras.callbacks.EarlyStopping(
-            monitor='val_loss',
-            patience=5,
-            restore_best_weights=True
-        ),
-        tf.keras.callbacks.ReduceLROnPlateau(
-            monitor='val_loss',
-            factor=0.5,
-            patience=3,
-            min_lr=0.00001
-        )
-    ]
+    callbacks = training_callbacks()
 
     # Trénink
     print(f"\n{'='*60}")
@@ -209,6 +607,9 @@ def main():
     print(f"\n💾 Ukládám model...")
     model.save(MODEL_PATH)
 
+    # TFLite export (float16 + int8)
+    tflite_report = export_tflite(model, X_train, X_test, y_test)
+
     # Metadata
     metadata = {
         "created": datetime.now().isoformat(),
@@ -221,7 +622,139 @@ def main():
         "test_accuracy": float(test_acc),
         "test_precision": float(test_prec),
         "test_recall": float(test_rec),
-        "epochs_trained": len(history.history['loss'])
+        "epochs_trained": len(history.history['loss']),
+        "tflite": tflite_report
+    }
+
+    with open(METADATA_PATH, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"""
+    ╔══════════════════════════════════════════════════════════╗
+    ║                   ✅ TRÉNINK DOKONČEN                    ║
+    ╠══════════════════════════════════════════════════════════╣
+    ║  💾 Model:        {MODEL_PATH}                  ║
+    ║  📄 Metadata:     {METADATA_PATH}            ║
+    ║  🎯 Přesnost:     {test_acc*100:.1f}%                                   ║
+    ╚══════════════════════════════════════════════════════════╝
+
+    Další krok: uvicorn 3_main_app:app --host 0.0.0.0 --port 8000
+    """)
+
+def main_streaming(use_cache=True, workers=PREPROCESS_WORKERS):
+    """Trénink na mnoha 1s výřezech z celých nahrávek (tf.data streaming)"""
+    print("""
+    ╔══════════════════════════════════════════════════════════╗
+    ║      🧠 WOODPECKER DETECTOR - AI TRAINER (STREAMING)     ║
+    ║        Trénink na výřezech z celých nahrávek            ║
+    ╚══════════════════════════════════════════════════════════╝
+    """)
+
+    # Dekódování před prvním TF výpočtem - worker procesy se forkují bez TF runtime
+    recordings, labels = load_recordings(use_cache, workers)
+
+    if len(recordings) < 2:
+        print("\n❌ Žádná data k tréninku! Spusť nejprve 1_download_dataset.py")
+        return
+
+    # Split podle nahrávek - výřezy jedné nahrávky nesmí být v train i test
+    train_idx, test_idx = train_test_split(
+        np.arange(len(recordings)), test_size=0.2, random_state=42, stratify=labels
+    )
+    train_recs = [recordings[i] for i in train_idx]
+    test_recs = [recordings[i] for i in test_idx]
+    train_labels, test_labels = labels[train_idx], labels[test_idx]
+
+    crops_per_epoch = len(train_recs) * CROPS_PER_RECORDING
+    steps_per_epoch = -(-crops_per_epoch // STREAM_BATCH_SIZE)
+    test_crops = count_sliding_crops(test_recs)
+
+    print(f"\n{'='*60}")
+    print(f"📊 Dataset statistika:")
+    print(f"   Nahrávek: {len(recordings)} (datli: {np.sum(labels == 1)}, šum: {np.sum(labels == 0)})")
+    print(f"\n✂️  Rozdělení podle nahrávek:")
+    print(f"   Train: {len(train_recs)} nahrávek → {crops_per_epoch} náhodných výřezů/epochu")
+    print(f"   Test:  {len(test_recs)} nahrávek → {test_crops} výřezů (hop {EVAL_CROP_HOP}s)")
+    print(f"{'='*60}")
+
+    # Nový náhodný výběr výřezů v každé epoše (rng sdílený mezi voláními generátoru)
+    rng = np.random.default_rng(42)
+    train_ds = crop_dataset(
+        lambda: random_crops(train_recs, train_labels, CROPS_PER_RECORDING, rng), training=True
+    )
+    test_ds = crop_dataset(lambda: sliding_crops(test_recs, test_labels), training=False)
+
+    stall_meter = InputStallMeter(train_ds)
+
+    # Vytvoření modelu
+    print(f"\n🏗️  Vytvářím CNN model...")
+    input_shape = train_ds.element_spec[0].shape[1:]
+    model = create_model(input_shape)
+
+    print("\n📋 Architektura modelu:")
+    model.summary()
+
+    # Trénink
+    print(f"\n{'='*60}")
+    print("🚀 ZAHAJUJI TRÉNINK...")
+    print(f"{'='*60}\n")
+
+    history = model.fit(
+        stall_meter.batches(),
+        steps_per_epoch=steps_per_epoch,
+        epochs=25,
+        validation_data=test_ds,
+        callbacks=training_callbacks() + [stall_meter],
+        verbose=1
+    )
+
+    # Evaluace
+    print(f"\n{'='*60}")
+    print("📊 FINÁLNÍ EVALUACE")
+    print(f"{'='*60}")
+
+    test_loss, test_acc, test_prec, test_rec = model.evaluate(test_ds, verbose=0)
+
+    print(f"\n✅ Test Accuracy:  {test_acc*100:.2f}%")
+    print(f"✅ Test Precision: {test_prec*100:.2f}%")
+    print(f"✅ Test Recall:    {test_rec*100:.2f}%")
+    print(f"✅ Test Loss:      {test_loss:.4f}")
+
+    stall_total = sum(e["input_stall_seconds"] for e in stall_meter.epochs)
+    train_total = sum(e["train_seconds"] for e in stall_meter.epochs)
+    print(f"⏱️  Čekání na data celkem: {stall_total:.1f}s z {train_total:.1f}s")
+
+    # Uložení modelu
+    print(f"\n💾 Ukládám model...")
+    model.save(MODEL_PATH)
+
+    # TFLite export - kalibrace z trénovacích výřezů, porovnání na testovacích
+    calib_batches = -(-TFLITE_CALIBRATION_SAMPLES // STREAM_BATCH_SIZE)
+    X_calib = np.concatenate([x.numpy() for x, _ in train_ds.take(calib_batches)])
+    X_test = np.concatenate([x.numpy() for x, _ in test_ds])
+    y_test = np.concatenate([y.numpy() for _, y in test_ds])
+    tflite_report = export_tflite(model, X_calib, X_test, y_test)
+
+    # Metadata
+    metadata = {
+        "created": datetime.now().isoformat(),
+        "pipeline": "streaming",
+        "sample_rate": SAMPLE_RATE,
+        "duration": DURATION,
+        "n_mels": N_MELS,
+        "input_shape": list(input_shape),
+        "training_recordings": len(train_recs),
+        "test_recordings": len(test_recs),
+        "training_samples": int(crops_per_epoch),
+        "test_samples": int(test_crops),
+        "crops_per_recording": CROPS_PER_RECORDING,
+        "eval_crop_hop": EVAL_CROP_HOP,
+        "test_accuracy": float(test_acc),
+        "test_precision": float(test_prec),
+        "test_recall": float(test_rec),
+        "epochs_trained": len(history.history['loss']),
+        "input_stall": stall_meter.epochs,
+        "tflite": tflite_report
     }
 
     with open(METADATA_PATH, 'w') as f:
@@ -240,4 +773,20 @@ def main():
     """)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Woodpecker Detector - AI Model Trainer")
+    parser.add_argument("--export-only", action="store_true",
+                        help="pouze exportovat TFLite z existujícího woodpecker_model.keras")
+    parser.add_argument("--streaming", action="store_true",
+                        help=f"trénovat na {CROPS_PER_RECORDING} náhodných výřezech z každé celé nahrávky (tf.data)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"nepoužívat cache spektrogramů ({FEATURE_CACHE_DIR}) / znovu dekódovat {AUDIO_CACHE_DIR}")
+    parser.add_argument("--workers", type=int, default=PREPROCESS_WORKERS,
+                        help=f"počet procesů pro předzpracování (default {PREPROCESS_WORKERS}, 1 = sériově)")
+    args = parser.parse_args()
+
+    if args.export_only:
+        export_only(use_cache=not args.no_cache, workers=args.workers)
+    elif args.streaming:
+        main_streaming(use_cache=not args.no_cache, workers=args.workers)
+    else:
+        main(use_cache=not args.no_cache, workers=args.workers)
@@ -9,6 +9,7 @@ import sounddevice as sd
 import tensorflow as tf
 import asyncio
 import json
+import time
 from datetime import datetime
 from fastapi import FastAPI, WebSocket
 from fastapi.responses import HTMLResponse
@@ -26,16 +27,51 @@ DURATION = 1.0
 N_MELS = 64
 CONFIDENCE_THRESHOLD = 0.75  # 75% jistota pro alarm
 
-# Načtení modelu
+# Keras serving: tf.function s pevnou signaturou místo model.predict
+# (bez data adapteru a callbacků při každém volání)
+MODEL_INPUT_SHAPE = (N_MELS, 44, 1)  # Mel pásma × snímky 1s okna × kanál
+MODEL_JIT_COMPILE = False            # True = XLA kompilace
+
+class CompiledModel:
+    """Keras model jako tf.function s pevnou vstupní signaturou a rozhraním model.predict(x, verbose=0)"""
+
+    def __init__(self, keras_model, jit_compile=MODEL_JIT_COMPILE):
+        self.keras_model = keras_model
+        # Jen forward pass, žádný Python control flow k převodu (autograph=False)
+        self.serve = tf.function(
+            self._forward,
+            input_signature=[tf.TensorSpec((None,) + MODEL_INPUT_SHAPE, tf.float32)],
+            jit_compile=jit_compile,
+            autograph=False
+        )
+
+    def _forward(self, x):
+        return self.keras_model(x, training=False)
+
+    def predict(self, x, verbose=0):
+        return self.serve(np.asarray(x, dtype=np.float32)).numpy()
+
+# Načtení modelu (server je "ready" až po zahřátí - první chunk pak netrasuje graf)
 logger.info(f"🧠 Načítám AI model: {MODEL_PATH}")
+model_ready = False
 try:
-    model = tf.keras.models.load_model(MODEL_PATH)
+    model = CompiledModel(tf.keras.models.load_model(MODEL_PATH))
     logger.info("✅ Model načten")
 except Exception as e:
     logger.error(f"❌ Chyba načtení modelu: {e}")
     logger.error("⚠️  Spusť nejprve: python 2_train_model.py")
     model = None
 
+if model is not None:
+    # Neúspěšné zahřátí model nezahazuje - jen zůstane "ready": False
+    try:
+        started = time.perf_counter()
+        model.predict(np.zeros((1,) + MODEL_INPUT_SHAPE, dtype=np.float32), verbose=0)
+        logger.info(f"🔥 Model zahřátý za {time.perf_counter() - started:.2f} s")
+        model_ready = True
+    except Exception as e:
+        logger.warning(f"⚠️ Zahřátí modelu selhalo: {e}")
+
 app = FastAPI(title="Woodpecker Detector API")
 
 # Mount static files
@@ -341,6 +377,7 @@ async def status():
     """API endpoint pro kontrolu stavu"""
     return {
         "status": "running",
+        "ready": model_ready,
         "model_loaded": model is not None,
         "sample_rate": SAMPLE_RATE,
         "threshold": CONFIDENCE_THRESHOLD
@@ -5,16 +5,19 @@ FastAPI server s audio streamingem z prohlížeče klienta
 """
 import numpy as np
 import librosa
-import tensorflow as tf
 import asyncio
 import json
 import os
 import random
 import base64
+import bisect
+import struct
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import logging
 
@@ -30,15 +33,133 @@ N_MELS = 64
 CONFIDENCE_THRESHOLD = 0.50  # Sníženo z 0.75 pro vyšší citlivost
 SOUNDS_DIR = "static/sounds"
 
-# Načtení modelu
-logger.info(f"🧠 Načítám AI model: {MODEL_PATH}")
+# Runtime modelu: "keras" | "tflite-fp16" | "tflite-int8" (export: 2_train_model.py)
+MODEL_RUNTIME = "keras"
+TFLITE_MODEL_PATHS = {
+    "tflite-fp16": "woodpecker_model_fp16.tflite",
+    "tflite-int8": "woodpecker_model_int8.tflite"
+}
+TFLITE_NUM_THREADS = 2
+
+# Keras serving: tf.function s pevnou signaturou místo model.predict
+# (bez data adapteru a callbacků při každém volání)
+MODEL_INPUT_SHAPE = (N_MELS, 44, 1)  # Mel pásma × snímky 1s okna × kanál
+MODEL_JIT_COMPILE = False            # True = XLA (kompiluje se zvlášť pro každou velikost batche)
+
+# Micro-batching inference (jeden forward pass pro všechny klienty)
+BATCH_MAX_SIZE = 16          # Max spektrogramů v jednom batchi
+BATCH_DEADLINE_MS = 10.0     # Max čekání na naplnění batche (ms)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+BATCH_WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# Metriky (/metrics, Prometheus text format)
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRICS_STAGES = ("decode", "features", "inference", "send")  # inference = jeden batch forward pass
+
+# Binární audio frame: 12B hlavička + raw PCM (little-endian)
+#   magic "WP" | verze u8 | formát u8 | seq u32 | sample_rate u32
+FRAME_HEADER = struct.Struct("<2sBBII")
+FRAME_MAGIC = b"WP"
+FRAME_VERSION = 1
+FRAME_FORMATS = {1: np.int16, 2: np.float32}
+FRAME_SAMPLE_RATES = (8000, 192000)  # Povolený rozsah sample_rate v hlavičce (Hz)
+
+class TFLiteModel:
+    """TFLite interpreter s rozhraním model.predict(x, verbose=0) jako Keras"""
+
+    def __init__(self, path, num_threads=TFLITE_NUM_THREADS):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input["shape"][0])
+        self.lock = threading.Lock()  # Interpreter není thread-safe
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+
+        # int8 model: kvantizace vstupu podle kalibrace
+        scale, zero_point = self.input["quantization"]
+        if self.input["dtype"] != np.float32 and scale:
+            info = np.iinfo(self.input["dtype"])
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(self.input["dtype"])
+
+        with self.lock:
+            if x.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], x.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = x.shape[0]
+
+            self.interpreter.set_tensor(self.input["index"], x)
+            self.interpreter.invoke()
+            out = self.interpreter.get_tensor(self.output["index"])
+
+        scale, zero_point = self.output["quantization"]
+        if self.output["dtype"] != np.float32 and scale:
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+class CompiledModel:
+    """Keras model jako tf.function s pevnou vstupní signaturou a rozhraním model.predict(x, verbose=0)"""
+
+    def __init__(self, keras_model, jit_compile=MODEL_JIT_COMPILE):
+        import tensorflow as tf
+        self.keras_model = keras_model
+        # Jen forward pass, žádný Python control flow k převodu (autograph=False)
+        self.serve = tf.function(
+            self._forward,
+            input_signature=[tf.TensorSpec((None,) + MODEL_INPUT_SHAPE, tf.float32)],
+            jit_compile=jit_compile,
+            autograph=False
+        )
+
+    def _forward(self, x):
+        return self.keras_model(x, training=False)
+
+    def predict(self, x, verbose=0):
+        return self.serve(np.asarray(x, dtype=np.float32)).numpy()
+
+def load_model():
+    """Načte model podle MODEL_RUNTIME (TensorFlow se importuje jen pro Keras)"""
+    if MODEL_RUNTIME == "keras":
+        import tensorflow as tf
+        return CompiledModel(tf.keras.models.load_model(MODEL_PATH))
+    return TFLiteModel(TFLITE_MODEL_PATHS[MODEL_RUNTIME])
+
+def warm_up_model(model, batch_sizes):
+    """Tracing/kompilace a alokace proběhnou před prvním chunkem, ne při něm"""
+    started = time.perf_counter()
+    for batch_size in batch_sizes:
+        model.predict(np.zeros((batch_size,) + MODEL_INPUT_SHAPE, dtype=np.float32), verbose=0)
+    logger.info(f"🔥 Model zahřátý za {time.perf_counter() - started:.2f} s (batche {batch_sizes})")
+
+# Načtení modelu (server je "ready" až po zahřátí)
+logger.info(f"🧠 Načítám AI model: {MODEL_PATH} (runtime: {MODEL_RUNTIME})")
+model_ready = False
 try:
-    model = tf.keras.models.load_model(MODEL_PATH)
+    model = load_model()
     logger.info("✅ Model načten")
 except Exception as e:
     logger.error(f"❌ Chyba načtení modelu: {e}")
     model = None
 
+if model is not None:
+    # Neúspěšné zahřátí model nezahazuje - jen zůstane "ready": False
+    try:
+        warm_up_model(model, (1, BATCH_MAX_SIZE))
+        model_ready = True
+    except Exception as e:
+        logger.warning(f"⚠️ Zahřátí modelu selhalo: {e}")
+
 app = FastAPI(title="Woodpecker Detector v3")
 
 # Mount static files
@@ -79,39 +200,47 @@ async def status():
     categories = get_sound_categories()
     return {
         "status": "running",
+        "ready": model_ready,
         "model_loaded": model is not None,
+        "model_runtime": MODEL_RUNTIME,
         "sample_rate": SAMPLE_RATE,
         "threshold": CONFIDENCE_THRESHOLD,
         "sound_categories": list(categories.keys()),
-        "total_sounds": sum(len(files) for files in categories.values())
+        "total_sounds": sum(len(files) for files in categories.values()),
+        "batching": batcher.stats()
     }
 
 # --- AUDIO PROCESSING ---
+def compute_mel_spectrogram(audio_float32):
+    """Převede audio chunk na normalizovaný mel-spektrogram (N_MELS, 44)"""
+    # Padding nebo trim na správnou délku
+    target_length = int(SAMPLE_RATE * DURATION)
+    if len(audio_float32) < target_length:
+        audio_float32 = np.pad(audio_float32, (0, target_length - len(audio_float32)))
+    else:
+        audio_float32 = audio_float32[:target_length]
+
+    # Mel-spectrogram
+    mel_spec = librosa.feature.melspectrogram(
+        y=audio_float32,
+        sr=SAMPLE_RATE,
+        n_mels=N_MELS,
+        fmax=8000
+    )
+
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (
+        mel_spec_db.max() - mel_spec_db.min() + 1e-8
+    )
+    return mel_spec_norm.astype(np.float32)
+
 def process_audio_chunk(audio_float32):
     """Převede audio chunk na predikci"""
     try:
         if model is None:
             return 0.0
 
-        # Padding nebo trim na správnou délku
-        target_length = int(SAMPLE_RATE * DURATION)
-        if len(audio_float32) < target_length:
-            audio_float32 = np.pad(audio_float32, (0, target_length - len(audio_float32)))
-        else:
-            audio_float32 = audio_float32[:target_length]
-
-        # Mel-spectrogram
-        mel_spec = librosa.feature.melspectrogram(
-            y=audio_float32,
-            sr=SAMPLE_RATE,
-            n_mels=N_MELS,
-            fmax=8000
-        )
-
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-        mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (
-            mel_spec_db.max() - mel_spec_db.min() + 1e-8
-        )
+        mel_spec_norm = compute_mel_spectrogram(audio_float32)
 
         # Predikce
         model_input = mel_spec_norm[np.newaxis, ..., np.newaxis]
@@ -124,6 +253,231 @@ def process_audio_chunk(audio_float32):
         logger.error(f"❌ Chyba zpracování: {e}")
         return 0.0
 
+def decode_audio_frame(frame):
+    """Rozparsuje binární audio frame -> (seq, sample_rate, audio_float32)"""
+    if len(frame) < FRAME_HEADER.size:
+        raise ValueError(f"frame too short ({len(frame)} bytes)")
+
+    magic, version, fmt, seq, sample_rate = FRAME_HEADER.unpack_from(frame)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"bad header (magic={magic!r}, version={version})")
+
+    dtype = FRAME_FORMATS.get(fmt)
+    if dtype is None:
+        raise ValueError(f"unknown sample format {fmt}")
+
+    low, high = FRAME_SAMPLE_RATES
+    if not low <= sample_rate <= high:
+        raise ValueError(f"sample rate {sample_rate} Hz outside {low}-{high} Hz")
+
+    payload = len(frame) - FRAME_HEADER.size
+    itemsize = np.dtype(dtype).itemsize
+    if payload == 0:
+        raise ValueError("empty payload (header only)")
+    if payload % itemsize:
+        raise ValueError(f"payload of {payload} bytes is not a whole number of {itemsize}-byte samples")
+
+    pcm = np.frombuffer(frame, dtype=dtype, offset=FRAME_HEADER.size)
+    if dtype is np.int16:
+        return seq, sample_rate, pcm.astype(np.float32) / 32768.0
+    return seq, sample_rate, pcm.astype(np.float32)
+
+class Histogram:
+    """Histogram s pevnými hranicemi bucketů (hodnota <= hranice)"""
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # poslední bucket = +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self):
+        buckets = {str(b): c for b, c in zip(self.buckets, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "buckets": buckets,
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0
+        }
+
+# ===== METRIKY =====
+# Zapisují se a vykreslují jen na event loopu, takže stačí obyčejné
+# atributy a předalokované seznamy - bez zámků a bez alokací.
+
+class Counter:
+    """Monotónní čítač"""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+stage_latency = {stage: Histogram() for stage in METRICS_STAGES}
+chunks_total = Counter()
+detections_total = Counter()
+dropped_frames_total = Counter()  # Neplatné framy a mezery v seq
+errors_total = Counter()          # Chyby zpracování a WebSocketu
+active_sessions = set()
+
+def render_metrics():
+    """Všechny metriky v Prometheus text formátu (verze 0.0.4)"""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("woodpecker_stage_seconds", "histogram", "Latence jednotlivých kroků zpracování (inference za batch).")
+    for stage, hist in stage_latency.items():
+        cumulative = 0
+        for i, count in enumerate(hist.counts):
+            cumulative += count
+            le = repr(hist.buckets[i]) if i < len(hist.buckets) else "+Inf"
+            lines.append(f'woodpecker_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+        lines.append(f'woodpecker_stage_seconds_sum{{stage="{stage}"}} {hist.total!r}')
+        lines.append(f'woodpecker_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+    family("woodpecker_batch_size", "histogram", "Počet spektrogramů v jednom forward passu.")
+    cumulative = 0
+    for i, count in enumerate(batcher.batch_sizes.counts):
+        cumulative += count
+        le = repr(batcher.batch_sizes.buckets[i]) if i < len(batcher.batch_sizes.buckets) else "+Inf"
+        lines.append(f'woodpecker_batch_size_bucket{{le="{le}"}} {cumulative}')
+    lines.append(f"woodpecker_batch_size_sum {batcher.batch_sizes.total!r}")
+    lines.append(f"woodpecker_batch_size_count {batcher.batch_sizes.count}")
+
+    for name, counter, help_text in (
+        ("woodpecker_chunks_total", chunks_total, "Přijaté audio chunky."),
+        ("woodpecker_detections_total", detections_total, "Chunky s pravděpodobností nad prahem."),
+        ("woodpecker_dropped_frames_total", dropped_frames_total, "Neplatné audio framy a framy chybějící v řadě seq."),
+        ("woodpecker_errors_total", errors_total, "Chyby zpracování chunku, batch predikce a WebSocketu."),
+    ):
+        family(name, "counter", help_text)
+        lines.append(f"{name} {counter.value}")
+
+    family("woodpecker_active_sessions", "gauge", "Připojení WebSocket klienti.")
+    lines.append(f"woodpecker_active_sessions {len(active_sessions)}")
+
+    family("woodpecker_batch_queue_depth", "gauge", "Spektrogramy čekající ve frontě InferenceBatcheru.")
+    lines.append(f"woodpecker_batch_queue_depth {batcher.stats()['queue_depth']}")
+
+    return "\n".join(lines) + "\n"
+
+class InferenceBatcher:
+    """Sbírá spektrogramy ze všech klientů a posílá je do modelu po dávkách.
+
+    Batch se odešle, když je plný (max_batch_size) nebo když nejstarší
+    spektrogram čeká déle než deadline_ms. Každý klient dostane výsledek
+    přes svůj future.
+    """
+
+    def __init__(self, max_batch_size=BATCH_MAX_SIZE, deadline_ms=BATCH_DEADLINE_MS):
+        self.max_batch_size = max_batch_size
+        self.deadline = deadline_ms / 1000.0
+        self.queue = None
+        self.task = None
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_ms = Histogram(BATCH_WAIT_BUCKETS_MS)
+
+    async def predict(self, mel_spec_norm):
+        """Zařadí spektrogram do fronty a počká na pravděpodobnost"""
+        if self.task is None or self.task.done():
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((mel_spec_norm, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        """Počká na první položku, pak sbírá do plného batche nebo deadline"""
+        batch = [await self.queue.get()]
+        flush_at = batch[0][2] + self.deadline
+
+        while len(batch) < self.max_batch_size:
+            timeout = flush_at - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Co už ve frontě čeká, jde taky (bez dalšího čekání)
+        while len(batch) < self.max_batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            started = time.perf_counter()
+            self.batch_sizes.observe(len(batch))
+            for _, _, enqueued in batch:
+                self.wait_ms.observe((started - enqueued) * 1000.0)
+
+            try:
+                model_input = np.stack([spec for spec, _, _ in batch])[..., np.newaxis]
+                # Forward pass mimo event loop, ať ostatní klienti můžou posílat data
+                prediction = await loop.run_in_executor(
+                    None, lambda: model.predict(model_input, verbose=0)
+                )
+                probs = [float(p[0]) for p in prediction]
+                stage_latency["inference"].observe(time.perf_counter() - started)
+            except Exception as e:
+                logger.error(f"❌ Chyba batch predikce ({len(batch)} vzorků): {e}")
+                errors_total.inc(len(batch))
+                probs = [0.0] * len(batch)
+
+            for (_, future, _), prob in zip(batch, probs):
+                if not future.done():
+                    future.set_result(prob)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "deadline_ms": self.deadline * 1000.0,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_ms": self.wait_ms.snapshot()
+        }
+
+batcher = InferenceBatcher()
+
+async def process_audio_chunk_batched(audio_float32):
+    """Jako process_audio_chunk, ale predikce jde přes společný InferenceBatcher"""
+    try:
+        if model is None:
+            return 0.0
+
+        # Mel spektrogram (STFT + mel banka, jednotky ms) mimo event loop, jako forward pass
+        started = time.perf_counter()
+        mel_spec_norm = await asyncio.get_running_loop().run_in_executor(
+            None, compute_mel_spectrogram, audio_float32
+        )
+        stage_latency["features"].observe(time.perf_counter() - started)
+        return await batcher.predict(mel_spec_norm)
+
+    except Exception as e:
+        logger.error(f"❌ Chyba zpracování: {e}")
+        errors_total.inc()
+        return 0.0
+
+@app.get("/metrics")
+async def metrics():
+    # async: vykresluje se na event loopu, takže nikdy nezávodí s handlery
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint - přijímá audio z prohlížeče"""
@@ -131,29 +485,61 @@ async def websocket_endpoint(websocket: WebSocket):
     logger.info("📱 Nový klient připojen")
 
     chunk_counter = 0
+    last_seq = None
+    session_id = id(websocket)
+    active_sessions.add(session_id)
 
     try:
         while True:
-            # Přijmi data z klienta
-            data = await websocket.receive_text()
-            message = json.loads(data)
-
-            if message.get("type") == "audio":
+            # Přijmi data z klienta (binární frame nebo starý JSON)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            audio_float32 = None
+            seq = None
+
+            if message.get("bytes") is not None:
+                # Binární frame - raw PCM bez base64/JSON
+                decode_started = time.perf_counter()
+                try:
+                    seq, frame_rate, audio_float32 = decode_audio_frame(message["bytes"])
+                except ValueError as e:
+                    logger.warning(f"⚠️ Neplatný audio frame: {e}")
+                    dropped_frames_total.inc()
+                    continue
+
+                if frame_rate != SAMPLE_RATE:
+                    audio_float32 = librosa.resample(audio_float32, orig_sr=frame_rate, target_sr=SAMPLE_RATE)
+                stage_latency["decode"].observe(time.perf_counter() - decode_started)
+
+                if last_seq is not None and seq > last_seq + 1:
+                    dropped_frames_total.inc(seq - last_seq - 1)  # Ztracené framy
+                last_seq = seq
+            else:
+                message = json.loads(message["text"])
+
+                if message.get("type") == "audio":
+                    # Base64 dekódování (starší klienti)
+                    decode_started = time.perf_counter()
+                    audio_b64 = message.get("audio")
+                    audio_bytes = base64.b64decode(audio_b64)
+
+                    # Převod na float32 array
+                    audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
+                    audio_float32 = audio_int16.astype(np.float32) / 32768.0
+                    stage_latency["decode"].observe(time.perf_counter() - decode_started)
+
+            if audio_float32 is not None:
                 chunk_counter += 1
+                chunks_total.inc()
 
-                # Base64 dekódování
-                audio_b64 = message.get("audio")
-                audio_bytes = base64.b64decode(audio_b64)
-
-                # Převod na float32 array
-                audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
-                audio_float32 = audio_int16.astype(np.float32) / 32768.0
-
-                # Zpracování AI modelem
-                prob = process_audio_chunk(audio_float32)
+                # Zpracování AI modelem (batch přes všechny klienty)
+                prob = await process_audio_chunk_batched(audio_float32)
                 detected = prob > CONFIDENCE_THRESHOLD
 
                 if detected:
+                    detections_total.inc()
                     logger.info(f"🦜 DATEL DETEKOVÁN! (Confidence: {prob*100:.1f}%)")
 
                 # Log každých 10 chunků
@@ -161,17 +547,24 @@ async def websocket_endpoint(websocket: WebSocket):
                     logger.info(f"📊 Chunk #{chunk_counter}, Confidence: {prob*100:.1f}%")
 
                 # Odešli výsledek
+                send_started = time.perf_counter()
                 await websocket.send_text(json.dumps({
                     "detected": detected,
                     "probability": prob,
+                    "seq": seq,
                     "timestamp": datetime.now().isoformat()
                 }))
+                stage_latency["send"].observe(time.perf_counter() - send_started)
 
             await asyncio.sleep(0.001)
 
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         logger.error(f"❌ WebSocket chyba: {e}")
+        errors_total.inc()
     finally:
+        active_sessions.discard(session_id)
         logger.info("📱 Klient odpojen")
 
 # --- HTML INTERFACE ---
@@ -389,6 +782,22 @@ HTML_INTERFACE = """
         let chunkCounter = 0;
         const COOLDOWN_MS = 3000;
 
+        // Binární audio frame: 12B hlavička + raw int16 PCM (viz decode_audio_frame)
+        const FRAME_HEADER_SIZE = 12;
+        const FRAME_FORMAT_INT16 = 1;
+        let frameSeq = 0;
+
+        function writeFrameHeader(frame, sampleRate) {
+            const view = new DataView(frame);
+            view.setUint8(0, 0x57);  // 'W'
+            view.setUint8(1, 0x50);  // 'P'
+            view.setUint8(2, 1);     // verze
+            view.setUint8(3, FRAME_FORMAT_INT16);
+            view.setUint32(4, frameSeq, true);
+            view.setUint32(8, sampleRate, true);
+            frameSeq = (frameSeq + 1) >>> 0;
+        }
+
         // Check if getUserMedia is available
         if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
             document.getElementById('https-warning').style.display = 'block';
@@ -520,21 +929,16 @@ HTML_INTERFACE = """
                         const audioChunk = audioBuffer.slice(0, targetLength);
                         audioBuffer = audioBuffer.slice(targetLength);
 
-                        // Convert Float32Array to Int16Array
-                        const int16 = new Int16Array(audioChunk.length);
+                        // Float32 -> Int16 přímo do payloadu frame
+                        const frame = new ArrayBuffer(FRAME_HEADER_SIZE + audioChunk.length * 2);
+                        const int16 = new Int16Array(frame, FRAME_HEADER_SIZE, audioChunk.length);
                         for (let i = 0; i < audioChunk.length; i++) {
                             int16[i] = Math.max(-32768, Math.min(32767, audioChunk[i] * 32768));
                         }
+                        writeFrameHeader(frame, audioContext.sampleRate);
 
-                        // Convert to base64
-                        const bytes = new Uint8Array(int16.buffer);
-                        const b64 = btoa(String.fromCharCode.apply(null, bytes));
-
-                        // Send to server
-                        ws.send(JSON.stringify({
-                            type: "audio",
-                            audio: b64
-                        }));
+                        // Send to server (binární frame, bez base64)
+                        ws.send(frame);
 
                         chunkCounter++;
                         chunksSent.innerText = chunkCounter;
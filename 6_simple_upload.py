@@ -5,12 +5,18 @@ Upload audio file for analysis (works on any device without getUserMedia)
 """
 import numpy as np
 import librosa
-import tensorflow as tf
 import os
 import random
 import io
+import shutil
+import tempfile
+import threading
+import time
 from datetime import datetime
+import soundfile as sf
+import soxr
 from fastapi import FastAPI, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 import logging
@@ -26,15 +32,120 @@ N_MELS = 64
 CONFIDENCE_THRESHOLD = 0.50
 SOUNDS_DIR = "static/sounds"
 
-# Load model
-logger.info(f"🧠 Loading AI model: {MODEL_PATH}")
+# Model runtime: "keras" | "tflite-fp16" | "tflite-int8" (export: 2_train_model.py)
+MODEL_RUNTIME = "keras"
+TFLITE_MODEL_PATHS = {
+    "tflite-fp16": "woodpecker_model_fp16.tflite",
+    "tflite-int8": "woodpecker_model_int8.tflite"
+}
+TFLITE_NUM_THREADS = 2
+
+# Keras serving: tf.function with a fixed input signature instead of model.predict
+# (no data adapter or callback machinery per call)
+MODEL_INPUT_SHAPE = (N_MELS, 44, 1)  # Mel bands x frames of a 1 s window x channel
+MODEL_JIT_COMPILE = False            # True = XLA (compiled separately for each batch size)
+
+# Full-length analysis (POST /api/analyze?mode=full)
+ANALYZE_HOP = 1.0               # Window hop in seconds (1.0 = no overlap)
+ANALYZE_BATCH_SIZE = 32         # Max windows per model.predict call
+ANALYZE_MEMORY_LIMIT_MB = 32    # Decode/window working memory, independent of upload size
+
+class TFLiteModel:
+    """TFLite interpreter with the same model.predict(x, verbose=0) interface as Keras"""
+
+    def __init__(self, path, num_threads=TFLITE_NUM_THREADS):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input["shape"][0])
+        self.lock = threading.Lock()  # Interpreter is not thread-safe
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+
+        # int8 model: quantize input using calibration params
+        scale, zero_point = self.input["quantization"]
+        if self.input["dtype"] != np.float32 and scale:
+            info = np.iinfo(self.input["dtype"])
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(self.input["dtype"])
+
+        with self.lock:
+            if x.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], x.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = x.shape[0]
+
+            self.interpreter.set_tensor(self.input["index"], x)
+            self.interpreter.invoke()
+            out = self.interpreter.get_tensor(self.output["index"])
+
+        scale, zero_point = self.output["quantization"]
+        if self.output["dtype"] != np.float32 and scale:
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+class CompiledModel:
+    """Keras model as a tf.function with a fixed input signature and the model.predict(x, verbose=0) interface"""
+
+    def __init__(self, keras_model, jit_compile=MODEL_JIT_COMPILE):
+        import tensorflow as tf
+        self.keras_model = keras_model
+        # Plain forward pass, no Python control flow to convert (autograph=False)
+        self.serve = tf.function(
+            self._forward,
+            input_signature=[tf.TensorSpec((None,) + MODEL_INPUT_SHAPE, tf.float32)],
+            jit_compile=jit_compile,
+            autograph=False
+        )
+
+    def _forward(self, x):
+        return self.keras_model(x, training=False)
+
+    def predict(self, x, verbose=0):
+        return self.serve(np.asarray(x, dtype=np.float32)).numpy()
+
+def load_model():
+    """Load model for MODEL_RUNTIME (TensorFlow is only imported for Keras)"""
+    if MODEL_RUNTIME == "keras":
+        import tensorflow as tf
+        return CompiledModel(tf.keras.models.load_model(MODEL_PATH))
+    return TFLiteModel(TFLITE_MODEL_PATHS[MODEL_RUNTIME])
+
+def warm_up_model(model, batch_sizes):
+    """Run tracing/compilation and allocations before the first request, not during it"""
+    started = time.perf_counter()
+    for batch_size in batch_sizes:
+        model.predict(np.zeros((batch_size,) + MODEL_INPUT_SHAPE, dtype=np.float32), verbose=0)
+    logger.info(f"🔥 Model warmed up in {time.perf_counter() - started:.2f} s (batches {batch_sizes})")
+
+# Load model (the server is "ready" only after the warm-up)
+logger.info(f"🧠 Loading AI model: {MODEL_PATH} (runtime: {MODEL_RUNTIME})")
+model_ready = False
 try:
-    model = tf.keras.models.load_model(MODEL_PATH)
+    model = load_model()
     logger.info("✅ Model loaded")
 except Exception as e:
     logger.error(f"❌ Model loading error: {e}")
     model = None
 
+if model is not None:
+    # A failed warm-up keeps the model - it only stays "ready": False
+    try:
+        warm_up_model(model, (1, ANALYZE_BATCH_SIZE))
+        model_ready = True
+    except Exception as e:
+        logger.warning(f"⚠️ Model warm-up failed: {e}")
+
 app = FastAPI(title="Woodpecker Detector - Upload")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -52,6 +163,17 @@ def get_sound_categories():
                 categories[category] = files
     return categories
 
+@app.get("/api/status")
+async def status():
+    return {
+        "status": "running",
+        "ready": model_ready,
+        "model_loaded": model is not None,
+        "model_runtime": MODEL_RUNTIME,
+        "threshold": CONFIDENCE_THRESHOLD,
+        "analyze_memory_limit_mb": ANALYZE_MEMORY_LIMIT_MB
+    }
+
 @app.get("/api/sounds")
 async def list_sounds():
     return get_sound_categories()
@@ -63,36 +185,226 @@ async def serve_sound(category: str, filename: str):
         return {"error": "File not found"}
     return FileResponse(file_path, media_type="audio/mpeg")
 
+def compute_mel_spectrogram(audio_data):
+    """Normalized mel-spectrogram (N_MELS, 44) of one DURATION window"""
+    # Pad or trim
+    target_length = int(SAMPLE_RATE * DURATION)
+    if len(audio_data) < target_length:
+        audio_data = np.pad(audio_data, (0, target_length - len(audio_data)))
+    else:
+        audio_data = audio_data[:target_length]
+
+    # Mel-spectrogram
+    mel_spec = librosa.feature.melspectrogram(
+        y=audio_data,
+        sr=SAMPLE_RATE,
+        n_mels=N_MELS,
+        fmax=8000
+    )
+
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (
+        mel_spec_db.max() - mel_spec_db.min() + 1e-8
+    )
+    return mel_spec_norm.astype(np.float32)
+
+# ===== FULL-LENGTH ANALYSIS =====
+def analysis_batch_size(limit_mb=ANALYZE_MEMORY_LIMIT_MB):
+    """Windows per predict call - pending spectrograms get at most 1/4 of the limit"""
+    per_window = N_MELS * 44 * 4 * 2  # Spectrogram + its copy in the stacked batch
+    return int(max(1, min(ANALYZE_BATCH_SIZE, limit_mb * 1024 * 1024 // 4 // per_window)))
+
+def decode_block_frames(native_sr, channels, limit_mb=ANALYZE_MEMORY_LIMIT_MB):
+    """Frames decoded per read so the decode path stays within 3/4 of the limit"""
+    # Decoded block (read buffer + the copy soundfile yields, all channels) + mono mix
+    # + resampled block, resampler output and window buffer (x2 while concatenating)
+    bytes_per_frame = 8 * channels + 4 + 4 * 4 * SAMPLE_RATE / native_sr
+    budget = limit_mb * 1024 * 1024 * 3 // 4
+    return int(max(native_sr // 10, budget // bytes_per_frame))
+
+def _audioread_blocks(fileobj, filename, limit_mb):
+    """Fallback for formats libsndfile can't read (webm, m4a, ...): decode via ffmpeg"""
+    import audioread
+
+    # audioread needs a path - copy the spooled upload in chunks, not into RAM
+    suffix = os.path.splitext(filename)[1] or ".audio"
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, tmp, 1024 * 1024)
+        tmp.flush()
+
+        try:
+            with audioread.audio_open(tmp.name) as f:
+                block_len = decode_block_frames(f.samplerate, f.channels, limit_mb) * f.channels
+                pending = []
+                pending_len = 0
+                for buf in f.read_data():
+                    pending.append(np.frombuffer(buf, dtype=np.int16))
+                    pending_len += len(pending[-1])
+                    if pending_len >= block_len:
+                        block = np.concatenate(pending).astype(np.float32) / 32768.0
+                        pending, pending_len = [], 0
+                        yield f.samplerate, block.reshape(-1, f.channels).mean(axis=1)
+                if pending:
+                    block = np.concatenate(pending).astype(np.float32) / 32768.0
+                    yield f.samplerate, block.reshape(-1, f.channels).mean(axis=1)
+        except (audioread.DecodeError, EOFError) as e:
+            # NoBackendError (a DecodeError) has no message: ffmpeg could not read the file either
+            raise ValueError(f"Cannot decode '{filename or 'upload'}' as audio "
+                             f"({type(e).__name__}{': ' + str(e) if str(e) else ''})") from e
+
+def iter_upload_blocks(fileobj, filename="", limit_mb=ANALYZE_MEMORY_LIMIT_MB):
+    """Decode the spooled upload incrementally -> mono float32 blocks at SAMPLE_RATE"""
+    fileobj.seek(0)
+    try:
+        sound = sf.SoundFile(fileobj)
+    except RuntimeError:
+        sound = None
+
+    if sound is not None:
+        def sf_blocks():
+            with sound:
+                mix = np.full(sound.channels, 1.0 / sound.channels, dtype=np.float32)
+                blocksize = decode_block_frames(sound.samplerate, sound.channels, limit_mb)
+                for block in sound.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+                    yield sound.samplerate, block @ mix
+        raw = sf_blocks()
+    else:
+        raw = _audioread_blocks(fileobj, filename, limit_mb)
+
+    # Streaming resampler keeps filter state across blocks (no seams at block edges)
+    resampler = None
+    decoded = 0
+    for sr, block in raw:
+        decoded += len(block)
+        if sr != SAMPLE_RATE:
+            if resampler is None:
+                resampler = soxr.ResampleStream(sr, SAMPLE_RATE, 1, dtype="float32")
+            block = resampler.resample_chunk(block)
+        yield block
+
+    if decoded == 0:
+        raise ValueError(f"'{filename or 'upload'}' contains no audio samples")
+    if resampler is not None:
+        yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+def iter_windows(blocks, window, hop):
+    """Slide a window over a stream of blocks -> (offset_samples, window); tail is zero-padded"""
+    buf = np.zeros(0, dtype=np.float32)
+    buf_offset = 0   # Absolute sample index of buf[0]
+    covered = 0      # Samples covered by windows so far
+
+    for block in blocks:
+        buf = np.concatenate([buf, block]) if len(buf) else block
+        pos = 0
+        while len(buf) - pos >= window:
+            yield buf_offset + pos, buf[pos:pos + window]
+            covered = buf_offset + pos + window
+            pos += hop
+        buf = buf[pos:]
+        buf_offset += pos
+
+    if buf_offset + len(buf) > covered and len(buf):
+        yield buf_offset, np.pad(buf[:window], (0, max(0, window - len(buf))))
+
+def detection_segments(timeline, hop=ANALYZE_HOP):
+    """Merge consecutive windows above the threshold into segments"""
+    segments = []
+    for point in timeline:
+        if point["probability"] <= CONFIDENCE_THRESHOLD:
+            continue
+        end = round(point["offset"] + DURATION, 3)
+        if segments and point["offset"] - segments[-1]["last_offset"] <= hop + 1e-6:
+            seg = segments[-1]
+            seg["end"] = end
+            seg["last_offset"] = point["offset"]
+            seg["probability"] = max(seg["probability"], point["probability"])
+        else:
+            segments.append({"start": point["offset"], "end": end,
+                             "last_offset": point["offset"], "probability": point["probability"]})
+
+    for seg in segments:
+        del seg["last_offset"]
+    return segments
+
+def analyze_full_length(fileobj, filename="", limit_mb=ANALYZE_MEMORY_LIMIT_MB):
+    """Score every window of the upload in batches -> timeline + aggregate verdict"""
+    started = time.perf_counter()
+    window = int(SAMPLE_RATE * DURATION)
+    hop = int(SAMPLE_RATE * ANALYZE_HOP)
+    batch_size = analysis_batch_size(limit_mb)
+
+    timeline = []
+    offsets, specs = [], []
+    n_samples = 0
+
+    def flush():
+        probs = model.predict(np.stack(specs)[..., np.newaxis], verbose=0)[:, 0]
+        timeline.extend({"offset": round(offset / SAMPLE_RATE, 3), "probability": round(float(p), 4)}
+                        for offset, p in zip(offsets, probs))
+        offsets.clear()
+        specs.clear()
+
+    def blocks():
+        nonlocal n_samples
+        for block in iter_upload_blocks(fileobj, filename, limit_mb):
+            n_samples += len(block)
+            yield block
+
+    for offset, audio_window in iter_windows(blocks(), window, hop):
+        offsets.append(offset)
+        specs.append(compute_mel_spectrogram(audio_window))
+        if len(specs) >= batch_size:
+            flush()
+    if specs:
+        flush()
+
+    probs = np.array([point["probability"] for point in timeline])
+    detections = int(np.sum(probs > CONFIDENCE_THRESHOLD))
+
+    return {
+        "mode": "full",
+        "detected": detections > 0,
+        "probability": float(probs.max()) if len(probs) else 0.0,
+        "mean_probability": float(probs.mean()) if len(probs) else 0.0,
+        "duration": round(n_samples / SAMPLE_RATE, 3),
+        "windows": len(timeline),
+        "detections": detections,
+        "segments": detection_segments(timeline),
+        "timeline": timeline,
+        "memory_limit_mb": limit_mb,
+        "processing_seconds": round(time.perf_counter() - started, 3)
+    }
+
 @app.post("/api/analyze")
-async def analyze_audio(file: UploadFile = File(...)):
-    """Analyze uploaded audio file"""
+async def analyze_audio(file: UploadFile = File(...), mode: str = "first"):
+    """Analyze uploaded audio file (mode=full: every window of the whole file)"""
     try:
         if model is None:
             return JSONResponse({"error": "Model not loaded"}, status_code=500)
 
-        # Read audio file
-        audio_bytes = await file.read()
-        audio_data, sr = librosa.load(io.BytesIO(audio_bytes), sr=SAMPLE_RATE, duration=DURATION)
+        if mode == "full":
+            # Starlette spools the upload to disk; decode it from there in a worker thread
+            result = await run_in_threadpool(analyze_full_length, file.file, file.filename or "")
+            logger.info(f"📊 Full analysis: {result['duration']:.1f}s, {result['detections']}/{result['windows']} "
+                        f"windows detected, max {result['probability']*100:.1f}% "
+                        f"({result['processing_seconds']:.2f}s)")
+            result["timestamp"] = datetime.now().isoformat()
+            return result
 
-        # Pad or trim
-        target_length = int(SAMPLE_RATE * DURATION)
-        if len(audio_data) < target_length:
-            audio_data = np.pad(audio_data, (0, target_length - len(audio_data)))
-        else:
-            audio_data = audio_data[:target_length]
-
-        # Mel-spectrogram
-        mel_spec = librosa.feature.melspectrogram(
-            y=audio_data,
-            sr=SAMPLE_RATE,
-            n_mels=N_MELS,
-            fmax=8000
-        )
+        if mode != "first":
+            return JSONResponse({"error": f"Unknown mode '{mode}' (first | full)"}, status_code=400)
 
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-        mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (
-            mel_spec_db.max() - mel_spec_db.min() + 1e-8
-        )
+        # Read audio file
+        audio_bytes = await file.read()
+        try:
+            audio_data, sr = librosa.load(io.BytesIO(audio_bytes), sr=SAMPLE_RATE, duration=DURATION)
+        except (RuntimeError, EOFError) as e:
+            # soundfile (LibsndfileError is a RuntimeError) cannot read the format
+            raise ValueError(f"Cannot decode '{file.filename or 'upload'}' as audio ({e})") from e
+        if len(audio_data) == 0:
+            raise ValueError(f"'{file.filename or 'upload'}' contains no audio samples")
+        mel_spec_norm = compute_mel_spectrogram(audio_data)
 
         # Predict
         model_input = mel_spec_norm[np.newaxis, ..., np.newaxis]
@@ -108,6 +420,11 @@ async def analyze_audio(file: UploadFile = File(...)):
             "timestamp": datetime.now().isoformat()
         }
 
+    except ValueError as e:
+        # Empty or undecodable upload - the client's file, not a server fault
+        logger.warning(f"⚠️ Rejected upload: {e}")
+        return JSONResponse({"error": str(e)}, status_code=400)
+
     except Exception as e:
         logger.error(f"❌ Analysis error: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -262,6 +579,11 @@ HTML = """
             <span class="stat-value" id="confidence-val">0%</span>
         </div>
 
+        <div class="stat">
+            <span>Okna s detekcí:</span>
+            <span class="stat-value" id="windows-val">—</span>
+        </div>
+
         <div class="stat">
             <span>Přehráno zvuků:</span>
             <span class="stat-value" id="sounds-played">0</span>
@@ -282,6 +604,7 @@ HTML = """
         const responseMode = document.getElementById("response-mode");
         const fill = document.getElementById("confidence-fill");
         const confidenceVal = document.getElementById("confidence-val");
+        const windowsVal = document.getElementById("windows-val");
         const soundsPlayed = document.getElementById("sounds-played");
         const lastSound = document.getElementById("last-sound");
 
@@ -331,18 +654,19 @@ HTML = """
         uploadBtn.addEventListener("click", () => fileInput.click());
         fileInput.addEventListener("change", async (e) => {
             if (e.target.files.length > 0) {
-                await analyzeAudio(e.target.files[0]);
+                // Whole file, window by window
+                await analyzeAudio(e.target.files[0], "full");
             }
         });
 
         // Analyze audio
-        async function analyzeAudio(blob) {
+        async function analyzeAudio(blob, mode = "first") {
             statusText.textContent = "ANALYZING";
             const formData = new FormData();
             formData.append("file", blob);
 
             try {
-                const response = await fetch("/api/analyze", {
+                const response = await fetch(`/api/analyze?mode=${mode}`, {
                     method: "POST",
                     body: formData
                 });
@@ -353,6 +677,13 @@ HTML = """
                 fill.style.width = (prob * 100) + "%";
                 confidenceVal.textContent = (prob * 100).toFixed(1) + "%";
 
+                if (data.mode === "full") {
+                    const first = data.segments.length ? ` (od ${data.segments[0].start.toFixed(0)}s)` : "";
+                    windowsVal.textContent = `${data.detections}/${data.windows}${first}`;
+                } else {
+                    windowsVal.textContent = "—";
+                }
+
                 if (data.detected) {
                     indicator.classList.add("active");
                     statusText.textContent = "DATEL!";
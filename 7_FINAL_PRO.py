@@ -4,16 +4,27 @@
 Real-time audio detection with professional features
 """
 import numpy as np
-import librosa
-import tensorflow as tf
+import soxr
 import asyncio
 import json
+import math
 import os
 import random
 import base64
+import bisect
+import collections
+import functools
+import hashlib
+import struct
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 import logging
 
@@ -26,53 +37,429 @@ SAMPLE_RATE = 22050
 N_MELS = 64
 CONFIDENCE_THRESHOLD = 0.40  # SNÍŽENO pro vyšší citlivost!
 SOUNDS_DIR = "static/sounds"
+SOUND_INDEX_POLL_S = 2.0  # How often the sound index checks folder and file mtimes for changes
+SOUND_CACHE_BYTES = 32 * 1024 * 1024  # Memory budget for sound file bytes (LRU eviction)
+SOUND_MAX_AGE = 3600                  # Cache-Control max-age for sound files (s), then ETag revalidation
+SERVICE_WORKER_TEMPLATE = "static/service-worker.js"  # Served at /service-worker.js with the precache manifest
+PRECACHE_SOUND_BYTES = 50 * 1024 * 1024               # Sound bytes the service worker stores on install
+
+# Runtime profile: "onset" never imports TensorFlow or librosa (fast cold start,
+# small RSS); "full" also loads the Keras model; "cascade" runs CASCADE_STAGES
+# and loads the CNN / BirdNET when the first chunk reaches them; "ensemble"
+# scores every chunk with all ENSEMBLE_DETECTORS in parallel
+DETECTOR_PROFILE = os.environ.get("WOODPECKER_PROFILE", "onset")
+MODEL_INPUT_SHAPE = (N_MELS, 44, 1)  # Mel bands x frames of a 1 s window x channel
+MODEL_JIT_COMPILE = False            # True = XLA (compiled separately for each batch size)
+
+# Detection cascade ("cascade" profile): each stage scores the chunk and rejects
+# it (score < reject), accepts it (score >= accept) or passes it to the next stage.
+# A chunk still undecided after the last stage is detected if score > CONFIDENCE_THRESHOLD.
+CASCADE_STAGES = tuple(os.environ.get("WOODPECKER_CASCADE", "gate,onset,cnn,birdnet").split(","))
+CASCADE_THRESHOLDS = {           # stage: (reject below, accept at or above; None = never accepts)
+    "gate": (0.2, None),         # Share of spectral energy in CASCADE_GATE_BAND
+    "onset": (0.0, 0.5),         # Onset confidence: a pattern (>= 0.5) is a detection as in "full", 0 falls through
+    "cnn": (0.2, 0.8),           # CNN probability
+    "birdnet": (0.25, 0.25),     # Best woodpecker confidence (decides everything left)
+}
+CASCADE_GATE_RMS = 0.015         # Same RMS pre-check as the onset detector (after the 15x gain)
+CASCADE_GATE_BAND = (300, 8000)  # Hz - wind and traffic rumble sit below
+CASCADE_WINDOW_S = 3.0           # Audio kept per session (BirdNET needs 3 s, the CNN uses the last 1 s)
+
+# Detector ensemble ("ensemble" profile): each chunk goes to every detector at
+# once, each on its own executor. A detector that misses its deadline is left
+# out of that chunk's fusion (its job still finishes, the next chunk skips it).
+ENSEMBLE_DETECTORS = tuple(os.environ.get("WOODPECKER_ENSEMBLE", "onset,cnn,birdnet").split(","))
+ENSEMBLE_FUSION = os.environ.get("WOODPECKER_FUSION", "max")  # "max" | "weighted" | "logistic"
+ENSEMBLE_DEADLINES_S = {"onset": 0.05, "cnn": 0.1, "birdnet": 0.3}  # From dispatch; chunks arrive every 0.36 s
+ENSEMBLE_WORKERS = {"onset": 2, "cnn": 1, "birdnet": 1}
+ENSEMBLE_WEIGHTS = {"onset": 0.4, "cnn": 0.2, "birdnet": 0.4}  # "weighted": renormalized over detectors in time
+ENSEMBLE_LOGISTIC_PATH = "ensemble_logistic.json"              # "logistic": written by --fit-ensemble
+ENSEMBLE_LOGISTIC_DEFAULT = {"bias": -3.0, "weights": {"onset": 4.0, "cnn": 2.0, "birdnet": 6.0}}
+
+# Binary audio frame: 12-byte header + raw PCM (little-endian)
+#   magic "WP" | version u8 | format u8 | seq u32 | sample_rate u32
+FRAME_HEADER = struct.Struct("<2sBBII")
+FRAME_MAGIC = b"WP"
+FRAME_VERSION = 1
+FRAME_FORMATS = {1: np.int16, 2: np.float32}
+FRAME_SAMPLE_RATES = (8000, 192000)  # Accepted header sample_rate range (Hz)
+
+# Streaming onset detector (one per WebSocket session)
+ONSET_N_FFT = 2048
+ONSET_HOP = 512
+ONSET_N_MELS = 64
+ONSET_FMAX = 8000
+ONSET_WINDOW_S = 1.0  # Rolling window for rate/regularity statistics
+ONSET_PEAK_PARAMS = dict(pre_max=5, post_max=5, pre_avg=10, post_avg=10, delta=0.6, wait=8)
+
+# Analysis worker pool (keeps onset analysis off the asyncio event loop)
+ANALYSIS_EXECUTOR = "thread"   # "thread" | "process"
+ANALYSIS_WORKERS = 4
+ANALYSIS_QUEUE_PER_WORKER = 2  # Max in-flight chunks per worker before callers wait
+
+# Client-side energy gate (sent to the page as "gate_config", change with POST /api/gate).
+# RMS is the raw microphone level, before the 15x gain applied on the server.
+GATE_ENABLED = True
+GATE_RMS_MIN = 0.001        # = onset pre-check 0.015 / 15x: quieter chunks can never be detections
+GATE_NOISE_RATIO = 3.0      # Candidate also needs RMS > noise floor * ratio (~10 dB)
+GATE_HANGOVER_CHUNKS = 3    # Keep sending after a candidate (~1 s onset window)
+GATE_HEARTBEAT_S = 10.0     # Noise-floor stats interval while chunks are gated
+
+# Metrics (/metrics, Prometheus text format)
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRICS_STAGES = ("decode", "gate", "features", "onset", "cnn", "birdnet", "send")
+
+unknown_stages = set(CASCADE_STAGES) - set(CASCADE_THRESHOLDS)
+if unknown_stages:
+    raise ValueError(f"Unknown cascade stages {sorted(unknown_stages)}, expected {list(CASCADE_THRESHOLDS)}")
+unknown_detectors = set(ENSEMBLE_DETECTORS) - set(ENSEMBLE_DEADLINES_S)
+if unknown_detectors or ENSEMBLE_FUSION not in ("max", "weighted", "logistic"):
+    raise ValueError(f"Bad ensemble config: detectors {list(ENSEMBLE_DETECTORS)}, fusion {ENSEMBLE_FUSION!r}")
+
+class CompiledModel:
+    """Keras model as a tf.function with a fixed input signature, behind model.predict(x, verbose=0)"""
+
+    def __init__(self, keras_model, jit_compile=MODEL_JIT_COMPILE):
+        import tensorflow as tf
+        self.keras_model = keras_model
+        # Plain forward pass, no Python control flow to convert (autograph=False)
+        self.serve = tf.function(
+            self._forward,
+            input_signature=[tf.TensorSpec((None,) + MODEL_INPUT_SHAPE, tf.float32)],
+            jit_compile=jit_compile,
+            autograph=False
+        )
 
-# Load AI model
-logger.info(f"🧠 Loading model: {MODEL_PATH}")
-try:
-    model = tf.keras.models.load_model(MODEL_PATH)
-    logger.info("✅ Model ready")
-except Exception as e:
-    logger.error(f"❌ Model error: {e}")
-    model = None
+    def _forward(self, x):
+        return self.keras_model(x, training=False)
+
+    def predict(self, x, verbose=0):
+        return self.serve(np.asarray(x, dtype=np.float32)).numpy()
+
+def load_model():
+    """Keras model for the "full" and "cascade" profiles (TensorFlow is only imported here)"""
+    import tensorflow as tf
+    return CompiledModel(tf.keras.models.load_model(MODEL_PATH))
+
+# AI model: loaded at startup in the "full" profile, on first use in "cascade"
+model = None
+model_failed = False
+model_lock = threading.Lock()
+
+def get_model():
+    """Loaded and warmed-up model, None if it cannot be loaded (tried once)"""
+    global model, model_failed
+    if model is not None:
+        return model
+    with model_lock:
+        if model is None and not model_failed:
+            logger.info(f"🧠 Loading model: {MODEL_PATH}")
+            try:
+                loaded = load_model()
+                loaded.predict(np.zeros((1,) + MODEL_INPUT_SHAPE, dtype=np.float32), verbose=0)  # Trace before use
+                model = loaded
+                logger.info("✅ Model ready")
+            except Exception as e:
+                model_failed = True
+                logger.error(f"❌ Model error: {e}")
+    return model
+
+if DETECTOR_PROFILE == "full":
+    get_model()
+elif DETECTOR_PROFILE == "cascade":
+    logger.info(f"🪜 Profile 'cascade': {' → '.join(CASCADE_STAGES)} (models load on first use)")
+elif DETECTOR_PROFILE == "ensemble":
+    logger.info(f"🎻 Profile 'ensemble': {', '.join(ENSEMBLE_DETECTORS)} in parallel, fusion '{ENSEMBLE_FUSION}'")
+else:
+    logger.info(f"⚡ Profile '{DETECTOR_PROFILE}': onset detection only, TensorFlow not loaded")
+
+gate_config = {
+    "enabled": GATE_ENABLED,
+    "rms_min": GATE_RMS_MIN,
+    "noise_ratio": GATE_NOISE_RATIO,
+    "hangover_chunks": GATE_HANGOVER_CHUNKS,
+    "heartbeat_s": GATE_HEARTBEAT_S
+}
 
 app = FastAPI(title="Woodpecker Detector PRO")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-def get_sound_categories():
-    categories = {}
-    if not os.path.exists(SOUNDS_DIR):
-        return categories
-    for category in os.listdir(SOUNDS_DIR):
-        cat_path = os.path.join(SOUNDS_DIR, category)
-        if os.path.isdir(cat_path):
-            files = [f for f in os.listdir(cat_path) if f.endswith('.mp3')]
+def probe_duration(path):
+    """Duration in seconds from the file header (None if unreadable)"""
+    try:
+        import soundfile as sf  # Lazy: only needed when the index is (re)built
+        return round(sf.info(path).duration, 3)
+    except Exception:
+        return None
+
+class SoundIndex:
+    """
+    In-memory catalog of SOUNDS_DIR: category -> mp3 files with size and duration.
+
+    Requests never list directories. At most every poll_s seconds the mtimes
+    of SOUNDS_DIR, its category folders and the (size, mtime) of every mp3 are
+    compared with the last build, and the index is rebuilt when a file was
+    added, removed, renamed or overwritten in place.
+    Durations are cached per (path, size, mtime), so a rebuild only probes
+    new files. The version hash changes whenever the catalog does (ETags).
+    """
+
+    def __init__(self, root, poll_s=SOUND_INDEX_POLL_S):
+        self.root = root
+        self.poll_s = poll_s
+        self.signature = None
+        self.checked = None    # time.monotonic() of the last mtime check
+        self.categories = {}   # category -> [filename, ...] (the /api/sounds format)
+        self.entries = {}      # (category, filename) -> {"path", "size", "duration", "etag"}
+        self.durations = {}    # (path, size, mtime_ns) -> seconds
+        self.version = None
+
+    def _signature(self):
+        try:
+            folders = []
+            with os.scandir(self.root) as entries:
+                for folder in sorted((e for e in entries if e.is_dir()), key=lambda e: e.name):
+                    with os.scandir(folder.path) as files:
+                        # File mtimes: an in-place overwrite leaves the folder mtime unchanged
+                        stats = sorted((f.name, f.stat().st_size, f.stat().st_mtime_ns)
+                                       for f in files if f.name.endswith('.mp3'))
+                    folders.append((folder.name, folder.stat().st_mtime_ns, tuple(stats)))
+            return os.stat(self.root).st_mtime_ns, tuple(folders)
+        except OSError:
+            return None
+
+    def refresh(self, force=False):
+        """Rebuild if SOUNDS_DIR changed (checked at most every poll_s seconds)"""
+        now = time.monotonic()
+        if not force and self.checked is not None and now - self.checked < self.poll_s:
+            return
+        self.checked = now
+
+        signature = self._signature()
+        if signature != self.signature or self.version is None:
+            self._rebuild()
+            self.signature = signature
+
+    def _rebuild(self):
+        categories, entries, durations = {}, {}, {}
+        folders = sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []
+        for category in folders:
+            cat_path = os.path.join(self.root, category)
+            if not os.path.isdir(cat_path):
+                continue
+            files = []
+            for filename in sorted(os.listdir(cat_path)):
+                if not filename.endswith('.mp3'):
+                    continue
+                path = os.path.join(cat_path, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # Removed while listing
+                key = (path, st.st_size, st.st_mtime_ns)
+                durations[key] = self.durations[key] if key in self.durations else probe_duration(path)
+                entries[(category, filename)] = {"path": path, "size": st.st_size, "duration": durations[key],
+                                                 "etag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"'}
+                files.append(filename)
             if files:
                 categories[category] = files
-    return categories
+
+        self.categories, self.entries, self.durations = categories, entries, durations
+        etags = sorted(entry["etag"] for entry in entries.values())
+        self.version = hashlib.sha1(json.dumps([self.index(), etags], sort_keys=True).encode()).hexdigest()[:16]
+        logger.info(f"📚 Sound index: {len(entries)} files in {len(categories)} categories")
+
+    def index(self):
+        """Catalog with sizes and durations (for client-side prefetch)"""
+        return {
+            category: [{"file": f, "size": self.entries[(category, f)]["size"],
+                        "duration": self.entries[(category, f)]["duration"]} for f in files]
+            for category, files in self.categories.items()
+        }
+
+    def etag(self, variant):
+        return f'"{self.version}-{variant}"'
+
+    def get(self, category, filename):
+        return self.entries.get((category, filename))
+
+class SoundCache:
+    """
+    LRU cache of sound file bytes bounded by max_bytes. Entries are keyed by
+    path and validated by the file's ETag, so a replaced file is read again.
+    Only used from the event loop (file reads run in a thread).
+    """
+
+    def __init__(self, max_bytes=SOUND_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.items = collections.OrderedDict()  # path -> (etag, bytes), oldest first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path, etag):
+        item = self.items.get(path)
+        if item is None or item[0] != etag:
+            self.misses += 1
+            return None
+        self.items.move_to_end(path)
+        self.hits += 1
+        return item[1]
+
+    def put(self, path, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self.items.pop(path, None)
+        if old is not None:
+            self.nbytes -= len(old[1])
+        self.items[path] = (etag, data)
+        self.nbytes += len(data)
+
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self.items.popitem(last=False)
+            self.nbytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "files": len(self.items),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+sound_index = SoundIndex(SOUNDS_DIR)
+sound_cache = SoundCache(SOUND_CACHE_BYTES)
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def parse_range(header, size):
+    """
+    Single-range "bytes=a-b" / "bytes=a-" / "bytes=-n" -> inclusive (start, end).
+    None = serve the whole file (no, malformed or multi-range header),
+    False = unsatisfiable (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            return (max(0, size - suffix), size - 1) if suffix > 0 and size else False
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+def get_sound_categories():
+    sound_index.refresh()
+    return sound_index.categories
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check (weak comparison, "*" matches anything)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def cached_json(request, payload, etag):
+    """JSON response that phones can revalidate with If-None-Match (304, no body)"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
 
 @app.get("/api/sounds")
-async def list_sounds():
-    return get_sound_categories()
+async def list_sounds(request: Request):
+    sound_index.refresh()
+    return cached_json(request, sound_index.categories, sound_index.etag("list"))
+
+@app.get("/api/sounds/index")
+async def sounds_index(request: Request):
+    sound_index.refresh()
+    return cached_json(request, sound_index.index(), sound_index.etag("index"))
 
 @app.get("/api/sound/{category}/{filename}")
-async def serve_sound(category: str, filename: str):
-    file_path = os.path.join(SOUNDS_DIR, category, filename)
-    if not os.path.exists(file_path):
-        return {"error": "Not found"}
-    return FileResponse(file_path, media_type="audio/mpeg")
+async def serve_sound(category: str, filename: str, request: Request):
+    """Sound bytes from the in-memory LRU cache, with ETag and Range support"""
+    sound_index.refresh()
+    entry = sound_index.get(category, filename)
+    if entry is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+
+    headers = {
+        "ETag": entry["etag"],
+        "Cache-Control": f"public, max-age={SOUND_MAX_AGE}",
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    data = sound_cache.get(entry["path"], entry["etag"])
+    if data is None:
+        if entry["size"] > sound_cache.max_bytes:
+            return FileResponse(entry["path"], media_type="audio/mpeg", headers=headers)
+        data = await asyncio.to_thread(read_file, entry["path"])
+        sound_cache.put(entry["path"], entry["etag"], data)
+
+    # If-Range: a stale client copy gets the whole file instead of a mismatched slice
+    if_range = request.headers.get("if-range")
+    byte_range = parse_range(request.headers.get("range"), len(data))
+    if byte_range is None or (if_range and if_range != entry["etag"]):
+        return Response(data, media_type="audio/mpeg", headers=headers)
+    if byte_range is False:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+
+    start, end = byte_range
+    return Response(data[start:end + 1], status_code=206, media_type="audio/mpeg",
+                    headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(data)}"})
 
 @app.get("/api/status")
 async def status():
     return {
         "status": "running",
+        "profile": DETECTOR_PROFILE,
         "model_loaded": model is not None,
         "threshold": CONFIDENCE_THRESHOLD,
-        "sound_categories": list(get_sound_categories().keys())
+        "sound_categories": list(get_sound_categories().keys()),
+        "worker_pool": analysis_pool.stats(),
+        "sound_cache": sound_cache.stats(),
+        "gate": gate_config,
+        "cascade": cascade_stats() if DETECTOR_PROFILE == "cascade" else None,
+        "ensemble": ensemble_stats() if DETECTOR_PROFILE == "ensemble" else None
     }
 
+def classify_drumming(rate, regularity, rms):
+    """Map onset rate (hits/s) and regularity to (detected, confidence)"""
+    # DRUMMING (teritoriální): 10-38 hits/s, může být nepravidelné (research-based)
+    if 10 <= rate <= 38:
+        if regularity <= 0.40:  # Allow irregularities as per research
+            confidence = min(0.95, 0.6 + (1.0 - regularity) * 0.4)
+            logger.info(f"🥁 DRUMMING: {rate:.1f} hits/s, reg={regularity:.2f}, rms={rms:.4f}")
+            return True, confidence
+
+    # FORAGING (pomalé klepání): 3-9 hits/s (narrowed from 2-10)
+    if 3 <= rate <= 9:
+        # Must have some regularity (not completely random)
+        if regularity <= 0.50:  # Allow more irregularity than drumming
+            confidence = min(0.75, 0.5 + (rate / 20.0))
+            logger.info(f"🔨 FORAGING: {rate:.1f} hits/s, reg={regularity:.2f}, rms={rms:.4f}")
+            return True, confidence
+
+    return False, 0.0
+
 def detect_drumming_onset(audio_float32, sr=SAMPLE_RATE):
     """Fast onset-based drumming detection - detects both drumming & foraging (< 0.1s)"""
+    import librosa  # Stateless path only (batch tools); the server streams without librosa
+
     try:
         duration = len(audio_float32) / sr
 
@@ -107,52 +494,247 @@ def detect_drumming_onset(audio_float32, sr=SAMPLE_RATE):
         # Calculate rate
         rate = len(peaks) / duration
 
-        # Calculate regularity (if enough peaks)
-        if len(peaks) >= 2:
-            peak_times = librosa.frames_to_time(peaks, sr=sr, hop_length=512)
-            intervals = np.diff(peak_times)
-            if len(intervals) > 0:
-                regularity = np.std(intervals) / np.mean(intervals)
-            else:
-                regularity = 1.0
-        else:
-            regularity = 1.0
-
-        # DRUMMING (teritoriální): 10-38 hits/s, může být nepravidelné (research-based)
-        if 10 <= rate <= 38:
-            if regularity <= 0.40:  # Allow irregularities as per research
-                confidence = min(0.95, 0.6 + (1.0 - regularity) * 0.4)
-                logger.info(f"🥁 DRUMMING: {rate:.1f} hits/s, reg={regularity:.2f}, rms={rms:.4f}")
-                return True, confidence
-
-        # FORAGING (pomalé klepání): 3-9 hits/s (narrowed from 2-10)
-        # Requires at least 2 peaks in 0.36s window
-        if 3 <= rate <= 9 and len(peaks) >= 2:
-            # Must have some regularity (not completely random)
-            if regularity <= 0.50:  # Allow more irregularity than drumming
-                confidence = min(0.75, 0.5 + (rate / 20.0))
-                logger.info(f"🔨 FORAGING: {rate:.1f} hits/s, reg={regularity:.2f}, rms={rms:.4f}")
-                return True, confidence
+        # Calculate regularity
+        peak_times = librosa.frames_to_time(peaks, sr=sr, hop_length=512)
+        intervals = np.diff(peak_times)
+        regularity = np.std(intervals) / np.mean(intervals)
 
-        return False, 0.0
+        return classify_drumming(rate, regularity, rms)
 
     except Exception as e:
         return False, 0.0
 
-def analyze_audio(audio_float32):
-    """Professional onset-based woodpecker drumming detection"""
+# NumPy equivalents of the few librosa helpers the streaming path needs.
+# librosa.util / librosa.filters pull in numba and scipy (~1.5 s, ~150 MB),
+# so the live server never touches librosa at all.
+
+def hz_to_mel(freqs):
+    """Slaney mel scale (librosa.hz_to_mel, htk=False)"""
+    freqs = np.asanyarray(freqs, dtype=np.float64)
+    mels = freqs / (200.0 / 3)
+    log_region = freqs >= 1000.0
+    mels = np.where(log_region, 15.0 + np.log(np.maximum(freqs, 1000.0) / 1000.0) / (np.log(6.4) / 27.0), mels)
+    return mels
+
+def mel_to_hz(mels):
+    """Inverse of hz_to_mel"""
+    mels = np.asanyarray(mels, dtype=np.float64)
+    freqs = mels * (200.0 / 3)
+    log_region = mels >= 15.0
+    return np.where(log_region, 1000.0 * np.exp((np.log(6.4) / 27.0) * (mels - 15.0)), freqs)
+
+def mel_filterbank(sr, n_fft, n_mels, fmax):
+    """Slaney-normalized mel basis (librosa.filters.mel with fmin=0)"""
+    fft_freqs = np.fft.rfftfreq(n_fft, 1.0 / sr)
+    mel_f = mel_to_hz(np.linspace(hz_to_mel(0.0), hz_to_mel(fmax), n_mels + 2))
+
+    fdiff = np.diff(mel_f)
+    ramps = np.subtract.outer(mel_f, fft_freqs)
+    lower = -ramps[:-2] / fdiff[:-1, np.newaxis]
+    upper = ramps[2:] / fdiff[1:, np.newaxis]
+    weights = np.maximum(0.0, np.minimum(lower, upper))
+
+    weights *= (2.0 / (mel_f[2:] - mel_f[:-2]))[:, np.newaxis]
+    return weights.astype(np.float32)
+
+def peak_pick(x, pre_max, post_max, pre_avg, post_avg, delta, wait):
+    """
+    Indices of onset peaks, same rules as librosa.util.peak_pick:
+    x[n] is the max of x[n-pre_max:n+post_max], at least delta above the
+    mean of x[n-pre_avg:n+post_avg], and more than wait frames after the
+    previous peak. Windows are truncated at the edges.
+    """
+    n = len(x)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp)
+
+    padded = np.concatenate((np.full(pre_max, -np.inf, dtype=x.dtype), x,
+                             np.full(post_max - 1, -np.inf, dtype=x.dtype)))
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, pre_max + post_max).max(axis=1)
+
+    idx = np.arange(n)
+    lo = np.maximum(0, idx - pre_avg)
+    hi = np.minimum(n, idx + post_avg)
+    csum = np.concatenate(([0.0], np.cumsum(x, dtype=np.float64)))
+    # float32 threshold like librosa's numba kernel (matters only for exact ties)
+    threshold = ((csum[hi] - csum[lo]) / (hi - lo)).astype(np.float32) + np.float32(delta)
+
+    candidates = np.flatnonzero((x == local_max) & (x >= threshold))
+
+    # Greedy left-to-right, each peak blocks the next `wait` frames
+    peaks = []
+    next_allowed = 0
+    for c in candidates:
+        if c >= next_allowed:
+            peaks.append(c)
+            next_allowed = c + wait + 1
+    return np.asarray(peaks, dtype=np.intp)
+
+@functools.lru_cache(maxsize=None)
+def onset_filters(sr):
+    """STFT window (periodic Hann) and mel basis shared by all streaming detectors"""
+    window = (0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(ONSET_N_FFT) / ONSET_N_FFT)).astype(np.float32)
+    mel_basis = mel_filterbank(sr, ONSET_N_FFT, ONSET_N_MELS, ONSET_FMAX)
+    return window, mel_basis
+
+class StreamingOnsetDetector:
+    """
+    Onset-based drumming detector that carries state across chunks.
+
+    Keeps the STFT overlap tail, the previous mel frame, the onset envelope
+    history and confirmed peak times, so each chunk only computes its new
+    frames and a drum roll crossing a chunk boundary is not split. A peak is
+    confirmed once its post-context (post_max/post_avg frames) has arrived.
+    Rate and regularity are computed over the last ONSET_WINDOW_S seconds.
+    """
+
+    def __init__(self, sr=SAMPLE_RATE):
+        self.sr = sr
+
+        params = ONSET_PEAK_PARAMS
+        self.post_context = max(params["post_max"], params["post_avg"])
+        self.window_frames = int(np.ceil(ONSET_WINDOW_S * sr / ONSET_HOP))
+        self.history_frames = self.window_frames + max(params["pre_max"], params["pre_avg"]) + self.post_context
+        self.reset()
+
+    def reset(self):
+        """Forget all stream state (e.g. after a gap in the audio)"""
+        self.tail = np.zeros(0, dtype=np.float32)  # Samples not yet covered by a full frame
+        self.prev_db = None                        # Last mel frame (dB) for the onset diff
+        self.envelope = np.zeros(0, dtype=np.float32)
+        self.env_start = 0                         # Absolute frame index of envelope[0]
+        self.n_frames = 0                          # Total frames computed so far
+        self.checked = -1                          # Last absolute frame checked for peaks
+        self.peaks = collections.deque()           # Absolute frame indices of confirmed peaks
+        self.last_timings = (0.0, 0.0)             # (features, onset) seconds of the last chunk
+
+    @property
+    def nbytes(self):
+        return self.tail.nbytes + self.envelope.nbytes
+
+    def _mel_frames(self, audio_float32):
+        """Log-mel frames (dB) for the samples completed by this chunk"""
+        buf = np.concatenate((self.tail, audio_float32.astype(np.float32, copy=False)))
+        if len(buf) < ONSET_N_FFT:
+            self.tail = buf
+            return np.zeros((ONSET_N_MELS, 0), dtype=np.float32)
+
+        n = 1 + (len(buf) - ONSET_N_FFT) // ONSET_HOP
+        frames = np.lib.stride_tricks.sliding_window_view(buf, ONSET_N_FFT)[::ONSET_HOP][:n]
+        self.tail = buf[n * ONSET_HOP:].copy()
+
+        window, mel_basis = onset_filters(self.sr)
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+        mel = mel_basis @ power.T
+        mel_db = 10.0 * np.log10(np.maximum(mel, 1e-10))
+        # top_db=80 as in librosa.power_to_db: floor at 80 dB below this block's loudest bin
+        return np.maximum(mel_db, mel_db.max() - 80.0)
+
+    def _update_envelope(self, mel_db):
+        ref = mel_db[:, :1] if self.prev_db is None else self.prev_db
+        diff = mel_db - np.concatenate((ref, mel_db[:, :-1]), axis=1)
+        onset = np.median(np.maximum(0.0, diff), axis=0).astype(np.float32)
+        self.prev_db = mel_db[:, -1:]
+
+        self.envelope = np.concatenate((self.envelope, onset))
+        self.n_frames += len(onset)
+
+        excess = len(self.envelope) - self.history_frames
+        if excess > 0:
+            self.envelope = self.envelope[excess:]
+            self.env_start += excess
+
+    def _pick_peaks(self):
+        # Only frames with complete post-context can be confirmed
+        final = self.n_frames - 1 - self.post_context
+        if final <= self.checked:
+            return
+
+        wait = ONSET_PEAK_PARAMS["wait"]
+        for frame in peak_pick(self.envelope, **ONSET_PEAK_PARAMS) + self.env_start:
+            if self.checked < frame <= final and (not self.peaks or frame - self.peaks[-1] > wait):
+                self.peaks.append(int(frame))
+        self.checked = final
+
+        while self.peaks and self.peaks[0] < final - self.window_frames:
+            self.peaks.popleft()
+
+    def process(self, audio_float32):
+        """Feed one chunk, returns (detected, confidence) over the rolling window"""
+        try:
+            started = time.perf_counter()
+            mel_db = self._mel_frames(audio_float32)
+            features_done = time.perf_counter()
+            if mel_db.shape[1]:
+                self._update_envelope(mel_db)
+                self._pick_peaks()
+            self.last_timings = (features_done - started, time.perf_counter() - features_done)
+
+            # PRE-CHECK: Minimum RMS to avoid detecting noise
+            rms = np.sqrt(np.mean(audio_float32**2))
+            if rms < 0.015 or len(self.peaks) < 2:
+                return False, 0.0
+
+            peak_times = np.asarray(self.peaks) * ONSET_HOP / self.sr
+            intervals = np.diff(peak_times)
+            rate = len(intervals) / (peak_times[-1] - peak_times[0])
+            regularity = np.std(intervals) / np.mean(intervals)
+
+            return classify_drumming(rate, regularity, rms)
+
+        except Exception as e:
+            logger.error(f"❌ Streaming onset error: {e}")
+            return False, 0.0
+
+def decode_audio_frame(frame):
+    """Parse binary audio frame -> (seq, sample_rate, audio_float32)"""
+    if len(frame) < FRAME_HEADER.size:
+        raise ValueError(f"frame too short ({len(frame)} bytes)")
+
+    magic, version, fmt, seq, sample_rate = FRAME_HEADER.unpack_from(frame)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"bad header (magic={magic!r}, version={version})")
+
+    dtype = FRAME_FORMATS.get(fmt)
+    if dtype is None:
+        raise ValueError(f"unknown sample format {fmt}")
+
+    low, high = FRAME_SAMPLE_RATES
+    if not low <= sample_rate <= high:
+        raise ValueError(f"sample rate {sample_rate} Hz outside {low}-{high} Hz")
+
+    payload = len(frame) - FRAME_HEADER.size
+    itemsize = np.dtype(dtype).itemsize
+    if payload == 0:
+        raise ValueError("empty payload (header only)")
+    if payload % itemsize:
+        raise ValueError(f"payload of {payload} bytes is not a whole number of {itemsize}-byte samples")
+
+    pcm = np.frombuffer(frame, dtype=dtype, offset=FRAME_HEADER.size)
+    if dtype is np.int16:
+        return seq, sample_rate, pcm.astype(np.float32) / 32768.0
+    return seq, sample_rate, pcm.astype(np.float32)
+
+def analyze_audio(audio_float32, onset_detector=None):
+    """Professional onset-based woodpecker drumming detection
+    (stateful per session when onset_detector is given)"""
     try:
         rms = np.sqrt(np.mean(audio_float32**2))
         max_amp = np.max(np.abs(audio_float32))
 
-        # Ignore silence
+        # Ignore silence (still feed the stream so its state stays continuous)
         if rms < 0.001:
+            if onset_detector is not None:
+                onset_detector.process(audio_float32)
             return 0.0
 
         logger.info(f"🎵 Audio: len={len(audio_float32)}, RMS={rms:.4f}, max={max_amp:.4f}")
 
         # ONLY onset detection - AI model was overfitted garbage
-        onset_detected, onset_conf = detect_drumming_onset(audio_float32)
+        if onset_detector is not None:
+            onset_detected, onset_conf = onset_detector.process(audio_float32)
+        else:
+            onset_detected, onset_conf = detect_drumming_onset(audio_float32)
         if onset_detected:
             logger.info(f"🥁 WOODPECKER DRUMMING: {onset_conf*100:.1f}%")
             return float(onset_conf)
@@ -163,6 +745,570 @@ def analyze_audio(audio_float32):
         logger.error(f"❌ Analysis error: {e}")
         return 0.0
 
+def analyze_chunk(audio_float32, onset_detector):
+    """
+    Worker entry point: returns (probability, onset_detector).
+    In process mode the detector state travels to the worker and back.
+    """
+    return analyze_audio(audio_float32, onset_detector), onset_detector
+
+class CascadeDetector(StreamingOnsetDetector):
+    """
+    Per-session state of the "cascade" and "ensemble" profiles: the streaming
+    onset detector plus the last CASCADE_WINDOW_S of audio for the CNN and
+    BirdNET. When the onset stage is skipped (gate rejected the chunk, or the
+    previous ensemble job is still running), its stream is interrupted; the
+    next onset run first replays enough of the window to rebuild the onset
+    history, on the same frame grid as an uninterrupted stream. In the
+    ensemble the event loop owns the flags and hands the replay to the job.
+    """
+
+    def reset(self):
+        super().reset()
+        self.window = np.zeros(0, dtype=np.float32)
+        self.samples_pushed = 0    # Stream position of the window end (onset frame grid origin = 0)
+        self.interrupted = False   # Onset stage skipped chunks since its last run
+        self.detected = False      # Decision for the last chunk
+        self.trace = []            # (stage, outcome, seconds) for the last chunk
+
+    def restart(self):
+        """Seq gap while an onset job may still be running (ensemble): drop the
+        window now, the next onset run starts over with empty history"""
+        self.window = np.zeros(0, dtype=np.float32)
+        self.samples_pushed = 0
+        self.interrupted = True
+        self.detected = False
+        self.trace = []
+
+    @property
+    def nbytes(self):
+        return super().nbytes + self.window.nbytes
+
+    def push(self, audio_float32):
+        self.window = np.concatenate((self.window, audio_float32))[-int(CASCADE_WINDOW_S * self.sr):]
+        self.samples_pushed += len(audio_float32)
+
+    def replay(self, current):
+        """Audio before the newest `current` samples that covers the onset history, grid-aligned"""
+        end = len(self.window) - current
+        start = max(0, end - ((self.history_frames + 2) * ONSET_HOP + ONSET_N_FFT))
+        window_origin = self.samples_pushed - len(self.window)
+        start += -(window_origin + start) % ONSET_HOP
+        return self.window[start:end].copy()
+
+    def take_replay(self, current):
+        """Replay for the next onset run, None when the stream was not interrupted"""
+        if not self.interrupted:
+            return None
+        self.interrupted = False
+        return self.replay(current)
+
+    def recent(self, n):
+        """Last n samples, zero-padded at the start while the session is younger"""
+        window = self.window[-n:]
+        return np.pad(window, (n - len(window), 0)) if len(window) < n else window
+
+def compute_mel_spectrogram(audio_float32):
+    """Normalized mel spectrogram (N_MELS, 44) of a 1 s window, as used in training"""
+    import librosa  # CNN stage only
+
+    mel_spec = librosa.feature.melspectrogram(y=audio_float32, sr=SAMPLE_RATE, n_mels=N_MELS, fmax=8000)
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    mel_spec_norm = (mel_spec_db - mel_spec_db.min()) / (mel_spec_db.max() - mel_spec_db.min() + 1e-8)
+    return mel_spec_norm.astype(np.float32)
+
+def is_woodpecker(common_name):
+    """Check if it's ANY woodpecker (European or American)"""
+    woodpecker_keywords = ['woodpecker', 'sapsucker', 'wryneck', 'dendrocopos', 'picoides']
+    return any(keyword in common_name.lower() for keyword in woodpecker_keywords)
+
+# Per-thread BirdNET analyzer (the interpreter is not thread-safe)
+_birdnet_state = threading.local()
+
+def get_birdnet():
+    if not hasattr(_birdnet_state, "analyzer"):
+        try:
+            from birdnetlib.analyzer import Analyzer
+            _birdnet_state.analyzer = Analyzer()
+            logger.info("✅ BirdNET ready")
+        except Exception as e:
+            logger.error(f"❌ BirdNET initialization error: {e}")
+            _birdnet_state.analyzer = None
+    return _birdnet_state.analyzer
+
+# Cascade stage scorers: (chunk, detector) -> score, or None when the stage
+# is unavailable (model missing) and the chunk moves on unscored
+def gate_score(audio_float32, detector):
+    """RMS pre-check, then the share of energy in the drumming band"""
+    if np.sqrt(np.mean(audio_float32**2)) < CASCADE_GATE_RMS:
+        return 0.0
+    power = np.abs(np.fft.rfft(audio_float32)) ** 2
+    freqs = np.fft.rfftfreq(len(audio_float32), 1.0 / SAMPLE_RATE)
+    low, high = CASCADE_GATE_BAND
+    return float(power[(freqs >= low) & (freqs < high)].sum() / (power.sum() + 1e-12))
+
+def onset_score(audio_float32, detector):
+    return onset_resume(audio_float32, detector, detector.take_replay(len(audio_float32)))
+
+def onset_resume(audio_float32, detector, replay):
+    """Onset confidence; after an interruption the replay rebuilds the history first"""
+    if replay is not None:
+        StreamingOnsetDetector.reset(detector)
+        if len(replay):
+            detector.process(replay)
+    _, confidence = detector.process(audio_float32)
+    return float(confidence)
+
+def cnn_probability(window):
+    """CNN probability for a 1 s window, None without a model"""
+    cnn = get_model()
+    if cnn is None:
+        return None
+    mel = compute_mel_spectrogram(window)
+    return float(cnn.predict(mel[np.newaxis, ..., np.newaxis], verbose=0)[0][0])
+
+def birdnet_confidence(window):
+    """Best woodpecker confidence for a 3 s window, None without BirdNET"""
+    analyzer = get_birdnet()
+    if analyzer is None:
+        return None
+    try:
+        from birdnetlib import RecordingBuffer
+        recording = RecordingBuffer(analyzer, window, SAMPLE_RATE, min_conf=0.10)
+        recording.analyze()
+        return max((d.get('confidence', 0.0) for d in recording.detections
+                    if is_woodpecker(d.get('common_name', ''))), default=0.0)
+    except Exception as e:
+        logger.error(f"❌ BirdNET analysis error: {e}")
+        return None
+
+def cnn_score(audio_float32, detector):
+    return cnn_probability(detector.recent(SAMPLE_RATE))
+
+def birdnet_score(audio_float32, detector):
+    return birdnet_confidence(detector.recent(int(CASCADE_WINDOW_S * SAMPLE_RATE)))
+
+CASCADE_SCORERS = {"gate": gate_score, "onset": onset_score, "cnn": cnn_score, "birdnet": birdnet_score}
+
+def analyze_cascade(audio_float32, detector):
+    """
+    Worker entry point of the "cascade" profile: returns (probability, detector)
+    with detector.detected and detector.trace set for this chunk.
+    """
+    detector.push(audio_float32)
+    detector.detected = False
+    detector.trace = []
+    prob = 0.0
+    outcome = None
+
+    for stage in CASCADE_STAGES:
+        started = time.perf_counter()
+        score = CASCADE_SCORERS[stage](audio_float32, detector)
+        if score is None:
+            detector.trace.append((stage, "skipped", time.perf_counter() - started))
+            continue
+
+        reject, accept = CASCADE_THRESHOLDS[stage]
+        if score < reject:
+            outcome = "rejected"
+        elif accept is not None and score >= accept:
+            outcome = "accepted"
+        else:
+            outcome = "passed"
+        detector.trace.append((stage, outcome, time.perf_counter() - started))
+        if stage != "gate":
+            prob = score  # The gate score is an energy share, not a probability
+        if outcome != "passed":
+            break
+
+    if outcome == "accepted" or (outcome == "passed" and prob > CONFIDENCE_THRESHOLD):
+        detector.detected = True
+        logger.info(f"🪜 Cascade: {' → '.join(f'{stage} {result}' for stage, result, _ in detector.trace)}")
+    if "onset" in CASCADE_STAGES and not any(stage == "onset" for stage, _, _ in detector.trace):
+        detector.interrupted = True
+    return prob, detector
+
+def _init_analysis_worker():
+    """Build the onset filters before the first real chunk"""
+    StreamingOnsetDetector().process(np.zeros(ONSET_N_FFT * 2, dtype=np.float32))
+
+def _timed_call(fn, *args):
+    """Run fn in a worker and report how long it was busy"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+class AnalysisPool:
+    """
+    Bounded thread/process pool for CPU-bound analysis.
+
+    At most workers * queue_per_worker jobs are in flight; further callers
+    wait on an asyncio semaphore (backpressure) instead of queueing without
+    limit, so the event loop only does I/O.
+    """
+
+    def __init__(self, kind, workers, queue_per_worker, initializer=None):
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis",
+                                               initializer=initializer)
+        self.kind = kind
+        self.workers = workers
+        self.capacity = workers * queue_per_worker
+        self.slots = None      # asyncio.Semaphore, created in the running loop
+        self.waiting = 0       # Callers blocked by backpressure
+        self.in_flight = 0     # Jobs submitted to the executor
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.started = time.perf_counter()
+
+    async def run(self, fn, *args):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.capacity)
+
+        self.waiting += 1
+        async with self.slots:
+            self.waiting -= 1
+            self.in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                result, busy = await loop.run_in_executor(self.executor, _timed_call, fn, *args)
+                self.busy_seconds += busy
+                self.completed += 1
+                return result
+            finally:
+                self.in_flight -= 1
+
+    def stats(self):
+        uptime = time.perf_counter() - self.started
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "running": min(self.in_flight, self.workers),
+            "queue_depth": max(0, self.in_flight - self.workers) + self.waiting,
+            "waiting_for_slot": self.waiting,
+            "completed": self.completed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "utilization": self.busy_seconds / (self.workers * uptime) if uptime > 0 else 0.0
+        }
+
+analysis_pool = AnalysisPool(ANALYSIS_EXECUTOR, ANALYSIS_WORKERS, ANALYSIS_QUEUE_PER_WORKER,
+                             initializer=_init_analysis_worker)
+
+# ===== METRICS =====
+# Metrics are only written and rendered on the event loop thread, so plain
+# attribute and preallocated list updates need no locks and allocate nothing.
+
+class Counter:
+    """Monotonic counter"""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Histogram:
+    """Fixed-bucket latency histogram (preallocated, last bucket is +Inf)"""
+    __slots__ = ("buckets", "counts", "count", "total")
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+stage_latency = {stage: Histogram() for stage in METRICS_STAGES}
+chunks_total = Counter()
+detections_total = Counter()
+dropped_frames_total = Counter()  # Invalid frames and seqs lost in transit
+gated_frames_total = Counter()    # Seqs the client declared gated
+errors_total = Counter()
+
+# Outcomes per cascade stage ("cascade" profile)
+CASCADE_OUTCOMES = ("passed", "accepted", "rejected", "skipped")
+cascade_outcomes = {stage: {outcome: Counter() for outcome in CASCADE_OUTCOMES} for stage in CASCADE_STAGES}
+
+def observe_cascade(detector):
+    for stage, outcome, seconds in detector.trace:
+        cascade_outcomes[stage][outcome].inc()
+        if stage == "onset":
+            features_seconds, onset_seconds = detector.last_timings
+            stage_latency["features"].observe(features_seconds)
+            stage_latency["onset"].observe(onset_seconds)
+        else:
+            stage_latency[stage].observe(seconds)
+
+def cascade_stats():
+    """Per-stage counts, share of chunks reaching the stage and pass rate"""
+    total = sum(counter.value for counter in cascade_outcomes[CASCADE_STAGES[0]].values())
+    stats = {}
+    for stage in CASCADE_STAGES:
+        counts = {outcome: counter.value for outcome, counter in cascade_outcomes[stage].items()}
+        entered = sum(counts.values())
+        stats[stage] = {
+            **counts,
+            "thresholds": CASCADE_THRESHOLDS[stage],
+            "reached": entered / total if total else 0.0,
+            "pass_rate": counts["passed"] / entered if entered else 0.0
+        }
+    return stats
+
+# Onset detectors of connected clients (for the per-session buffer gauge)
+session_detectors = {}
+# Sockets (for gate_config pushes) and last gate heartbeat of connected clients
+session_sockets = {}
+session_gate_stats = {}
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("woodpecker_stage_seconds", "histogram", "Per-chunk latency of each pipeline stage.")
+    for stage, hist in stage_latency.items():
+        cumulative = 0
+        for i, count in enumerate(hist.counts):
+            cumulative += count
+            le = repr(hist.buckets[i]) if i < len(hist.buckets) else "+Inf"
+            lines.append(f'woodpecker_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+        lines.append(f'woodpecker_stage_seconds_sum{{stage="{stage}"}} {hist.total!r}')
+        lines.append(f'woodpecker_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+    for name, counter, help_text in (
+        ("woodpecker_chunks_total", chunks_total, "Audio chunks analyzed."),
+        ("woodpecker_detections_total", detections_total, "Chunks above the confidence threshold."),
+        ("woodpecker_dropped_frames_total", dropped_frames_total, "Invalid audio frames and seqs missing without a gated declaration."),
+        ("woodpecker_gated_frames_total", gated_frames_total, "Quiet chunks the client energy gate did not send."),
+        ("woodpecker_errors_total", errors_total, "Malformed messages and failed analysis jobs."),
+    ):
+        family(name, "counter", help_text)
+        lines.append(f"{name} {counter.value}")
+
+    if DETECTOR_PROFILE == "cascade":
+        family("woodpecker_cascade_chunks_total", "counter", "Chunks per cascade stage and outcome.")
+        for stage, outcomes in cascade_outcomes.items():
+            for outcome, counter in outcomes.items():
+                lines.append(f'woodpecker_cascade_chunks_total{{stage="{stage}",outcome="{outcome}"}} {counter.value}')
+
+    if DETECTOR_PROFILE == "ensemble":
+        family("woodpecker_ensemble_chunks_total", "counter", "Chunks per ensemble detector and deadline outcome.")
+        for name, outcomes in ensemble_outcomes.items():
+            for outcome, counter in outcomes.items():
+                lines.append(f'woodpecker_ensemble_chunks_total{{detector="{name}",outcome="{outcome}"}} {counter.value}')
+
+    family("woodpecker_active_sessions", "gauge", "Connected WebSocket clients.")
+    lines.append(f"woodpecker_active_sessions {len(session_detectors)}")
+
+    family("woodpecker_worker_queue_depth", "gauge", "Analysis jobs waiting for a worker.")
+    lines.append(f"woodpecker_worker_queue_depth {analysis_pool.stats()['queue_depth']}")
+
+    family("woodpecker_session_buffer_bytes", "gauge", "Audio and onset history held per session.")
+    for client_id, detector in session_detectors.items():
+        lines.append(f'woodpecker_session_buffer_bytes{{session="{client_id}"}} {detector.nbytes}')
+
+    family("woodpecker_gate_noise_floor_rms", "gauge", "Noise floor from the last client gate heartbeat.")
+    for client_id, stats in session_gate_stats.items():
+        lines.append(f'woodpecker_gate_noise_floor_rms{{session="{client_id}"}} {stats["noise_floor"]!r}')
+
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def metrics():
+    # async: rendered on the event loop, so it never races the handlers
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# ===== ENSEMBLE =====
+def load_logistic(path=ENSEMBLE_LOGISTIC_PATH):
+    """Fitted logistic fusion coefficients, the defaults until --fit-ensemble has run"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return ENSEMBLE_LOGISTIC_DEFAULT
+
+ensemble_logistic = load_logistic() if DETECTOR_PROFILE == "ensemble" else ENSEMBLE_LOGISTIC_DEFAULT
+
+def fuse_scores(scores, rule=ENSEMBLE_FUSION):
+    """Fused probability from {detector: score} of the detectors that met their deadline"""
+    if not scores:
+        return 0.0
+    if rule == "max":
+        return max(scores.values())
+    if rule == "weighted":
+        total = sum(ENSEMBLE_WEIGHTS[name] for name in scores)
+        return sum(ENSEMBLE_WEIGHTS[name] * score for name, score in scores.items()) / total if total else 0.0
+    # Logistic: a detector that is missing contributes nothing to the logit
+    z = ensemble_logistic["bias"] + sum(ensemble_logistic["weights"].get(name, 0.0) * score
+                                        for name, score in scores.items())
+    return float(1.0 / (1.0 + np.exp(-z)))
+
+def ensemble_job(name, audio_float32, detector):
+    """(fn, *args) for one detector. Windows and the onset replay are taken on
+    the event loop, so a late job never sees audio pushed for the next chunk
+    and never writes the session's flags."""
+    if name == "onset":
+        return onset_resume, audio_float32, detector, detector.take_replay(len(audio_float32))
+    if name == "cnn":
+        return cnn_probability, detector.recent(SAMPLE_RATE).copy()
+    return birdnet_confidence, detector.recent(int(CASCADE_WINDOW_S * SAMPLE_RATE)).copy()
+
+# One executor per detector: a slow BirdNET never queues in front of the onset detector.
+# Initializers load the models in the worker before its first chunk.
+ENSEMBLE_INITIALIZERS = {"onset": _init_analysis_worker, "cnn": get_model, "birdnet": get_birdnet}
+ensemble_pools = {}
+if DETECTOR_PROFILE == "ensemble":
+    for name in ENSEMBLE_DETECTORS:
+        ensemble_pools[name] = AnalysisPool("thread", ENSEMBLE_WORKERS[name], ANALYSIS_QUEUE_PER_WORKER,
+                                            initializer=ENSEMBLE_INITIALIZERS[name])
+        ensemble_pools[name].executor.submit(int)  # Start a worker now (runs the initializer)
+
+ENSEMBLE_OUTCOMES = ("met", "missed", "busy", "skipped")
+ensemble_outcomes = {name: {outcome: Counter() for outcome in ENSEMBLE_OUTCOMES} for name in ENSEMBLE_DETECTORS}
+
+async def run_ensemble(audio_float32, detector, running):
+    """
+    Score one chunk with every detector in parallel and fuse the scores that
+    arrived within their deadlines. running holds the session's last job per
+    detector; while it is still going, that detector sits this chunk out
+    ("busy"). Returns (probability, {detector: score}).
+    """
+    detector.push(audio_float32)
+
+    async def within_deadline(name, task):
+        started = time.perf_counter()
+        try:
+            score = await asyncio.wait_for(asyncio.shield(task), ENSEMBLE_DEADLINES_S[name])
+        except asyncio.TimeoutError:
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Late errors are not unhandled
+            return name, "missed", None, time.perf_counter() - started
+        except Exception as e:
+            logger.error(f"❌ Ensemble detector {name} failed: {e}")
+            score = None
+        return name, "met" if score is not None else "skipped", score, time.perf_counter() - started
+
+    waits = []
+    for name in ENSEMBLE_DETECTORS:
+        previous = running.get(name)
+        if previous is not None and not previous.done():
+            ensemble_outcomes[name]["busy"].inc()
+            if name == "onset":
+                detector.interrupted = True
+            continue
+        fn, *args = ensemble_job(name, audio_float32, detector)
+        running[name] = asyncio.ensure_future(ensemble_pools[name].run(fn, *args))
+        waits.append(within_deadline(name, running[name]))
+
+    scores = {}
+    for name, outcome, score, seconds in await asyncio.gather(*waits):
+        ensemble_outcomes[name][outcome].inc()
+        if outcome != "met":
+            continue
+        scores[name] = score
+        if name == "onset":
+            features_seconds, onset_seconds = detector.last_timings
+            stage_latency["features"].observe(features_seconds)
+            stage_latency["onset"].observe(onset_seconds)
+        else:
+            stage_latency[name].observe(seconds)
+    return fuse_scores(scores), scores
+
+def ensemble_stats():
+    stats = {}
+    for name in ENSEMBLE_DETECTORS:
+        counts = {outcome: counter.value for outcome, counter in ensemble_outcomes[name].items()}
+        total = sum(counts.values())
+        stats[name] = {
+            **counts,
+            "deadline_s": ENSEMBLE_DEADLINES_S[name],
+            "met_rate": counts["met"] / total if total else 0.0,
+            "worker_pool": ensemble_pools[name].stats() if name in ensemble_pools else None
+        }
+    return {"fusion": ENSEMBLE_FUSION, "logistic": ensemble_logistic if ENSEMBLE_FUSION == "logistic" else None,
+            "detectors": stats}
+
+def fit_ensemble(dataset_dir="dataset", path=ENSEMBLE_LOGISTIC_PATH, steps=2000, lr=0.5, l2=1e-3):
+    """
+    Fit the logistic fusion on dataset/woodpecker and dataset/noise: every
+    chunk of every file is scored by all ENSEMBLE_DETECTORS (no deadlines,
+    same 15x gain as the server) and labelled with its folder.
+    """
+    import librosa
+
+    rows, labels = [], []
+    for label_name, label in (("noise", 0), ("woodpecker", 1)):
+        folder = os.path.join(dataset_dir, label_name)
+        for filename in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            if not filename.endswith(('.mp3', '.wav')):
+                continue
+            audio, _ = librosa.load(os.path.join(folder, filename), sr=SAMPLE_RATE)
+            detector = CascadeDetector()
+            for start in range(0, len(audio) - 8000 + 1, 8000):
+                chunk = np.clip(audio[start:start + 8000] * 15.0, -1.0, 1.0).astype(np.float32)
+                detector.push(chunk)
+                scores = [ensemble_job(name, chunk, detector) for name in ENSEMBLE_DETECTORS]
+                rows.append([fn(*args) or 0.0 for fn, *args in scores])
+                labels.append(label)
+        print(f"📁 {label_name}: {labels.count(label)} chunks")
+
+    if len(set(labels)) < 2:
+        raise SystemExit(f"❌ Need chunks of both classes in {dataset_dir}/noise and {dataset_dir}/woodpecker")
+
+    X, y = np.asarray(rows, dtype=np.float64), np.asarray(labels, dtype=np.float64)
+    w, b = np.zeros(X.shape[1]), 0.0
+    for _ in range(steps):
+        p = 1.0 / (1.0 + np.exp(-(X @ w + b)))
+        w -= lr * (X.T @ (p - y) / len(y) + l2 * w)
+        b -= lr * float(np.mean(p - y))
+
+    accuracy = float(np.mean(((X @ w + b) > 0) == (y == 1)))
+    coefficients = {"bias": b, "weights": dict(zip(ENSEMBLE_DETECTORS, w.tolist())),
+                    "chunks": len(y), "accuracy": accuracy}
+    with open(path, "w") as f:
+        json.dump(coefficients, f, indent=2)
+    print(f"✅ Logistic fusion ({accuracy*100:.1f}% chunk accuracy) saved to {path}: {coefficients['weights']}")
+    return coefficients
+
+def gate_config_message():
+    return json.dumps({"type": "gate_config", "gate": gate_config})
+
+@app.post("/api/gate")
+async def update_gate(request: Request):
+    """Change energy gate settings and push them to every connected client"""
+    try:
+        changes = await request.json()
+        update = {}
+        for key, value in changes.items():
+            current = gate_config[key]
+            if (isinstance(current, bool) != isinstance(value, bool) or not isinstance(value, (int, float))
+                    or not math.isfinite(value) or value < 0):
+                raise ValueError(f"{key}={value!r}")
+            update[key] = type(current)(value)
+    except (ValueError, KeyError, AttributeError) as e:
+        return JSONResponse({"error": f"Invalid gate setting: {e}"}, status_code=400)
+
+    gate_config.update(update)
+    logger.info(f"🔇 Energy gate updated: {gate_config}")
+
+    message = gate_config_message()
+    for websocket in list(session_sockets.values()):
+        try:
+            await websocket.send_text(message)
+        except Exception as e:
+            logger.warning(f"⚠️ Gate push failed: {e}")
+    return {"gate": gate_config, "sessions": len(session_sockets)}
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """Professional WebSocket handler with error recovery"""
@@ -172,54 +1318,133 @@ async def websocket_endpoint(websocket: WebSocket):
 
     chunk_count = 0
     detection_count = 0
+    last_seq = None
+    gated_seqs = range(0)  # Last seq run the client declared gated
+    onset_detector = CascadeDetector() if DETECTOR_PROFILE in ("cascade", "ensemble") else StreamingOnsetDetector()
+    ensemble_running = {}  # Detector -> last job of this session ("ensemble" profile)
+    scores = None
+    session_detectors[client_id] = onset_detector
+    session_sockets[client_id] = websocket
 
     try:
+        await websocket.send_text(gate_config_message())
+
         while True:
             try:
-                # Receive audio data
-                data = await asyncio.wait_for(
-                    websocket.receive_text(),
+                # Receive audio data (binary frame or legacy JSON text)
+                message = await asyncio.wait_for(
+                    websocket.receive(),
                     timeout=30.0  # Increased timeout for stable connection
                 )
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
+                audio_float32 = None
+                seq = None
+
+                if message.get("bytes") is not None:
+                    # Binary frame - raw PCM, no base64/JSON parsing
+                    decode_started = time.perf_counter()
+                    try:
+                        seq, frame_rate, audio_float32 = decode_audio_frame(message["bytes"])
+                    except ValueError as e:
+                        logger.warning(f"⚠️ Invalid audio frame from {client_id}: {e}")
+                        dropped_frames_total.inc()
+                        continue
+
+                    if frame_rate != SAMPLE_RATE:
+                        audio_float32 = soxr.resample(audio_float32, frame_rate, SAMPLE_RATE)
+                    stage_latency["decode"].observe(time.perf_counter() - decode_started)
+
+                    if last_seq is not None and seq > last_seq + 1:
+                        # Gated or lost audio: the onset history no longer matches
+                        gap = range(last_seq + 1, seq)
+                        gated = len(range(max(gap.start, gated_seqs.start), min(gap.stop, gated_seqs.stop)))
+                        gated_frames_total.inc(gated)
+                        dropped_frames_total.inc(len(gap) - gated)
+                        if DETECTOR_PROFILE == "ensemble":
+                            # The onset job of an earlier chunk may still use the detector
+                            onset_detector.restart()
+                        else:
+                            onset_detector.reset()
+                    last_seq = seq
+                else:
+                    message = json.loads(message["text"])
+
+                    if message.get("type") == "audio":
+                        # Legacy client: base64 int16 in JSON
+                        decode_started = time.perf_counter()
+                        audio_b64 = message.get("audio")
+                        audio_bytes = base64.b64decode(audio_b64)
+                        audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
+                        audio_float32 = audio_int16.astype(np.float32) / 32768.0
+                        stage_latency["decode"].observe(time.perf_counter() - decode_started)
+
+                    elif message.get("type") == "ping":
+                        await websocket.send_text(json.dumps({"type": "pong"}))
+
+                    elif message.get("type") == "gated":
+                        # Sent before the first frame after a gated run: seqs first..last never leave the phone
+                        first, last = message.get("first"), message.get("last")
+                        if isinstance(first, int) and isinstance(last, int) and 0 <= first <= last:
+                            gated_seqs = range(first, last + 1)
+
+                    elif message.get("type") == "gate_stats":
+                        session_gate_stats[client_id] = {
+                            key: float(message.get(key, 0))
+                            for key in ("gated", "sent", "noise_floor", "threshold", "rms_mean", "rms_max")
+                        }
+                        logger.info(f"🔇 Gate {client_id}: sent {message.get('sent')}, gated {message.get('gated')}, "
+                                    f"noise floor {session_gate_stats[client_id]['noise_floor']:.5f}")
 
-                message = json.loads(data)
-
-                if message.get("type") == "audio":
+                if audio_float32 is not None:
                     chunk_count += 1
-
-                    # Decode base64 audio
-                    audio_b64 = message.get("audio")
-                    audio_bytes = base64.b64decode(audio_b64)
-                    audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
-                    audio_float32 = audio_int16.astype(np.float32) / 32768.0
+                    chunks_total.inc()
 
                     # AMPLIFY 15x for Android microphone (AI model should handle this)
                     audio_float32 = np.clip(audio_float32 * 15.0, -1.0, 1.0)
 
-                    # AI analysis
-                    prob = analyze_audio(audio_float32)
-                    detected = prob > CONFIDENCE_THRESHOLD
+                    # AI analysis (in the worker pool, event loop stays free)
+                    if DETECTOR_PROFILE == "ensemble":
+                        prob, scores = await run_ensemble(audio_float32, onset_detector, ensemble_running)
+                        detected = prob > CONFIDENCE_THRESHOLD
+                    elif DETECTOR_PROFILE == "cascade":
+                        prob, onset_detector = await analysis_pool.run(analyze_cascade, audio_float32, onset_detector)
+                        session_detectors[client_id] = onset_detector  # New object in process mode
+                        observe_cascade(onset_detector)
+                        detected = onset_detector.detected
+                    else:
+                        prob, onset_detector = await analysis_pool.run(analyze_chunk, audio_float32, onset_detector)
+                        session_detectors[client_id] = onset_detector  # New object in process mode
+                        features_seconds, onset_seconds = onset_detector.last_timings
+                        stage_latency["features"].observe(features_seconds)
+                        stage_latency["onset"].observe(onset_seconds)
+                        detected = prob > CONFIDENCE_THRESHOLD
 
                     if detected:
                         detection_count += 1
+                        detections_total.inc()
                         logger.info(f"🦜 DETECTION #{detection_count}! Confidence: {prob*100:.1f}%")
 
                     # Send result (convert numpy types to Python types for JSON)
-                    await websocket.send_text(json.dumps({
+                    send_started = time.perf_counter()
+                    result = {
                         "detected": bool(detected),
                         "probability": float(prob),
                         "chunk": chunk_count,
+                        "seq": seq,
                         "detections": detection_count,
                         "timestamp": datetime.now().isoformat()
-                    }))
+                    }
+                    if scores is not None:
+                        result["scores"] = scores  # Ensemble: detectors that met their deadline
+                    await websocket.send_text(json.dumps(result))
+                    stage_latency["send"].observe(time.perf_counter() - send_started)
 
                     # Log every 20 chunks
                     if chunk_count % 20 == 0:
                         logger.info(f"📊 Processed {chunk_count} chunks, {detection_count} detections")
 
-                elif message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
-
             except asyncio.TimeoutError:
                 logger.warning(f"⏱️  Timeout for client {client_id} - no data for 30s")
                 await websocket.send_text(json.dumps({"type": "timeout"}))
@@ -228,8 +1453,12 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         logger.info(f"📱 Client disconnected: {client_id} ({chunk_count} chunks, {detection_count} detections)")
     except Exception as e:
+        errors_total.inc()
         logger.error(f"❌ WebSocket error: {e}")
     finally:
+        session_detectors.pop(client_id, None)
+        session_sockets.pop(client_id, None)
+        session_gate_stats.pop(client_id, None)
         logger.info(f"📱 Session ended: {client_id}")
 
 # ===== PROFESSIONAL HTML INTERFACE =====
@@ -494,6 +1723,196 @@ HTML = """<!DOCTYPE html>
         let muteUntil = 0;  // Timestamp to mute detection after playback
         let pingInterval = null;
 
+        // Binary audio frame: 12-byte header + raw int16 PCM (see decode_audio_frame)
+        const FRAME_HEADER_SIZE = 12;
+        const FRAME_FORMAT_INT16 = 1;
+        let frameSeq = 0;
+
+        function writeFrameHeader(frame, sampleRate) {
+            const view = new DataView(frame);
+            view.setUint8(0, 0x57);  // 'W'
+            view.setUint8(1, 0x50);  // 'P'
+            view.setUint8(2, 1);     // version
+            view.setUint8(3, FRAME_FORMAT_INT16);
+            view.setUint32(4, frameSeq, true);
+            view.setUint32(8, sampleRate, true);
+            frameSeq = (frameSeq + 1) >>> 0;
+        }
+
+        const CHUNK_SAMPLES = 8000;  // 0.36s chunks - AI model trained on this
+        let chunksSent = 0;
+
+        // Energy gate: quiet chunks stay on the phone. The server sends the
+        // thresholds ("gate_config") on connect and whenever they change.
+        let gateConfig = { enabled: false };
+        let noiseFloor = null;       // Running RMS of chunks below the threshold
+        let hangoverLeft = 0;        // Chunks still sent after the last candidate
+        let prerollFrame = null;     // Last gated frame, sent in front of the next candidate
+        let gatedFrom = null;        // First seq of the current gated run
+        let lastHeartbeat = 0;
+        let gateStats = { gated: 0, sent: 0, rmsSum: 0, rmsMax: 0 };
+
+        function resetGate() {
+            noiseFloor = null;
+            hangoverLeft = 0;
+            prerollFrame = null;
+            lastHeartbeat = Date.now();
+            gateStats = { gated: 0, sent: 0, rmsSum: 0, rmsMax: 0 };
+        }
+
+        function gateThreshold() {
+            return Math.max(gateConfig.rms_min, (noiseFloor || 0) * gateConfig.noise_ratio);
+        }
+
+        function passesGate(rms) {
+            if (!gateConfig.enabled) return true;
+
+            if (rms >= gateThreshold()) {
+                hangoverLeft = gateConfig.hangover_chunks;
+                return true;
+            }
+            noiseFloor = noiseFloor === null ? rms : noiseFloor + 0.05 * (rms - noiseFloor);
+            if (hangoverLeft > 0) {
+                hangoverLeft--;
+                return true;
+            }
+            return false;
+        }
+
+        // Noise-floor stats while chunks are gated (also tells the server the stream is alive)
+        function sendHeartbeat() {
+            const now = Date.now();
+            if (!gateConfig.enabled || now - lastHeartbeat < gateConfig.heartbeat_s * 1000) return;
+            lastHeartbeat = now;
+
+            const total = gateStats.gated + gateStats.sent;
+            ws.send(JSON.stringify({
+                type: "gate_stats",
+                seq: (frameSeq - 1) >>> 0,
+                gated: gateStats.gated,
+                sent: gateStats.sent,
+                noise_floor: noiseFloor || 0,
+                threshold: gateThreshold(),
+                rms_mean: total ? gateStats.rmsSum / total : 0,
+                rms_max: gateStats.rmsMax
+            }));
+            gateStats = { gated: 0, sent: 0, rmsSum: 0, rmsMax: 0 };
+        }
+
+        // Called with a complete frame (payload already int16) and its RMS;
+        // adds the header and sends it unless the energy gate holds it back
+        function sendFrame(frame, rms) {
+            if (!isRecording) return;
+            if (!ws || ws.readyState !== WebSocket.OPEN) {
+                console.log("⚠️ WebSocket not ready, state:", ws ? ws.readyState : "null");
+                return;
+            }
+
+            // Gated frames still use a seq number, so the server sees the gap
+            writeFrameHeader(frame, audioContext.sampleRate);
+            gateStats.rmsSum += rms;
+            gateStats.rmsMax = Math.max(gateStats.rmsMax, rms);
+
+            const seq = (frameSeq - 1) >>> 0;
+            if (!passesGate(rms)) {
+                gateStats.gated++;
+                prerollFrame = frame;
+                if (gatedFrom === null) gatedFrom = seq;
+                sendHeartbeat();
+                return;
+            }
+
+            try {
+                if (gatedFrom !== null) {
+                    // Tell the server which seqs were gated, so it does not count them as lost
+                    const last = prerollFrame ? seq - 2 : seq - 1;
+                    if (last >= gatedFrom) {
+                        ws.send(JSON.stringify({ type: "gated", first: gatedFrom, last: last }));
+                    }
+                    gatedFrom = null;
+                }
+                if (prerollFrame) {
+                    // Onset context from just before the candidate
+                    ws.send(prerollFrame);
+                    prerollFrame = null;
+                    gateStats.sent++;
+                }
+                ws.send(frame);
+                gateStats.sent++;
+
+                chunksSent++;
+                if (chunksSent === 1) {
+                    console.log("🎵 First audio chunk sent to server!");
+                }
+                if (chunksSent % 10 === 0) {
+                    console.log(`📊 Sent ${chunksSent} chunks`);
+                }
+            } catch (err) {
+                console.error("❌ Failed to send audio chunk:", err);
+            }
+        }
+
+        // Capture node: AudioWorklet (conversion and chunking on the audio thread,
+        // frames transferred without copying), ScriptProcessor on older browsers
+        async function createCaptureNode(source) {
+            if (audioContext.audioWorklet && window.AudioWorkletNode) {
+                try {
+                    await audioContext.audioWorklet.addModule("/static/capture-worklet.js");
+                    const node = new AudioWorkletNode(audioContext, "capture-processor", {
+                        numberOfInputs: 1,
+                        numberOfOutputs: 0,
+                        channelCount: 1,
+                        channelCountMode: "explicit",
+                        processorOptions: { chunkSize: CHUNK_SAMPLES, headerSize: FRAME_HEADER_SIZE }
+                    });
+                    node.port.onmessage = (e) => sendFrame(e.data.frame, e.data.rms);
+                    source.connect(node);
+                    console.log("🎛️ Audio capture: AudioWorklet");
+                    return node;
+                } catch (err) {
+                    console.warn("⚠️ AudioWorklet unavailable, using ScriptProcessor:", err);
+                }
+            }
+
+            // Fallback: fill the frame payload directly, no intermediate JS array
+            const processor = audioContext.createScriptProcessor(4096, 1, 1);
+            let frame = null;
+            let int16 = null;
+            let filled = 0;
+            let sumSquares = 0;
+
+            processor.onaudioprocess = (e) => {
+                const inputData = e.inputBuffer.getChannelData(0);
+                let offset = 0;
+                while (offset < inputData.length) {
+                    if (!frame) {
+                        frame = new ArrayBuffer(FRAME_HEADER_SIZE + CHUNK_SAMPLES * 2);
+                        int16 = new Int16Array(frame, FRAME_HEADER_SIZE, CHUNK_SAMPLES);
+                        filled = 0;
+                        sumSquares = 0;
+                    }
+                    const n = Math.min(inputData.length - offset, CHUNK_SAMPLES - filled);
+                    for (let i = 0; i < n; i++) {
+                        const x = inputData[offset + i];
+                        sumSquares += x * x;
+                        int16[filled + i] = Math.max(-32768, Math.min(32767, x * 32768));
+                    }
+                    offset += n;
+                    filled += n;
+
+                    if (filled === CHUNK_SAMPLES) {
+                        sendFrame(frame, Math.sqrt(sumSquares / CHUNK_SAMPLES));
+                        frame = null;
+                    }
+                }
+            };
+
+            source.connect(processor);
+            processor.connect(audioContext.destination);
+            console.log("🎛️ Audio capture: ScriptProcessor (fallback)");
+            return processor;
+        }
+
         // Show HTTPS warning if on HTTP
         if (window.location.protocol === 'http:') {
             document.getElementById('https-warning').style.display = 'block';
@@ -523,6 +1942,22 @@ HTML = """<!DOCTYPE html>
                 console.log("✅ Sounds loaded:", Object.keys(soundCategories));
             });
 
+        // Offline sound library: the service worker precaches every sound and the page,
+        // and only re-downloads when the server publishes a new precache version
+        if ("serviceWorker" in navigator) {
+            navigator.serviceWorker.register("/service-worker.js")
+                .then(registration => fetch("/api/precache")
+                    .then(r => r.json())
+                    .then(manifest => {
+                        if (localStorage.getItem("precacheVersion") !== manifest.version) {
+                            localStorage.setItem("precacheVersion", manifest.version);
+                            console.log("📦 Sound library changed, updating precache:", manifest.version);
+                            return registration.update();
+                        }
+                    }))
+                .catch(err => console.warn("⚠️ Service worker unavailable:", err));
+        }
+
         function showError(msg) {
             errorText.textContent = msg;
             errorMsg.classList.add("show");
@@ -544,6 +1979,8 @@ HTML = """<!DOCTYPE html>
             ws.onopen = () => {
                 statusDot.classList.add("connected");
                 statusLabel.textContent = "Connected";
+                frameSeq = 0;
+                resetGate();
                 console.log("✅ WebSocket connected successfully");
 
                 // Send initial ping immediately to confirm connection
@@ -583,6 +2020,12 @@ HTML = """<!DOCTYPE html>
             ws.onmessage = (event) => {
                 const data = JSON.parse(event.data);
 
+                if (data.type === "gate_config") {
+                    gateConfig = data.gate;
+                    console.log("🔇 Energy gate:", gateConfig);
+                    return;
+                }
+
                 if (data.chunk) {
                     chunksCount.textContent = data.chunk;
                 }
@@ -689,66 +2132,8 @@ HTML = """<!DOCTYPE html>
                 audioContext = new (window.AudioContext || window.webkitAudioContext)({ sampleRate: 22050 });
                 const source = audioContext.createMediaStreamSource(stream);
 
-                // Use ScriptProcessor for real-time
-                const processor = audioContext.createScriptProcessor(4096, 1, 1);
-                let buffer = [];
-                const targetLength = 8000;  // 0.36s chunks - AI model trained on this
-
-                let firstChunkSent = false;
-                let chunksSent = 0;
-
-                processor.onaudioprocess = (e) => {
-                    if (!isRecording) {
-                        console.log("⚠️ Not recording anymore, stopping processor");
-                        return;
-                    }
-
-                    if (ws && ws.readyState === WebSocket.OPEN) {
-                        const inputData = e.inputBuffer.getChannelData(0);
-                        buffer.push(...inputData);
-
-                        if (buffer.length >= targetLength) {
-                            const chunk = buffer.slice(0, targetLength);
-                            buffer = buffer.slice(targetLength);
-
-                            const int16 = new Int16Array(chunk.length);
-                            for (let i = 0; i < chunk.length; i++) {
-                                int16[i] = Math.max(-32768, Math.min(32767, chunk[i] * 32768));
-                            }
-
-                            const bytes = new Uint8Array(int16.buffer);
-                            // Convert bytes to base64 safely (avoid stack overflow on large arrays)
-                            let binary = '';
-                            for (let i = 0; i < bytes.length; i++) {
-                                binary += String.fromCharCode(bytes[i]);
-                            }
-                            const b64 = btoa(binary);
-
-                            try {
-                                ws.send(JSON.stringify({
-                                    type: "audio",
-                                    audio: b64
-                                }));
-
-                                chunksSent++;
-                                if (!firstChunkSent) {
-                                    firstChunkSent = true;
-                                    console.log("🎵 First audio chunk sent to server!");
-                                }
-                                if (chunksSent % 10 === 0) {
-                                    console.log(`📊 Sent ${chunksSent} chunks`);
-                                }
-                            } catch (err) {
-                                console.error("❌ Failed to send audio chunk:", err);
-                            }
-                        }
-                    } else {
-                        console.log("⚠️ WebSocket not ready, state:", ws ? ws.readyState : "null");
-                    }
-                };
-
-                source.connect(processor);
-                processor.connect(audioContext.destination);
+                chunksSent = 0;
+                const processor = await createCaptureNode(source);
 
                 isRecording = true;
                 statusDot.classList.add("recording");
@@ -864,10 +2249,101 @@ HTML = """<!DOCTYPE html>
 async def get():
     return HTMLResponse(HTML)
 
+# Manifest and worker script, rebuilt only when their inputs change
+_precache = {"key": None, "manifest": None, "script": None}
+
+def precache_bundle():
+    """
+    (manifest, service worker script). The manifest lists the URLs the
+    service worker stores on install: the page, the sound list and the
+    sound files (up to PRECACHE_SOUND_BYTES). Its version hashes the sound
+    index, the HTML and the worker template, so clients only re-download
+    when one of them changes. Rebuilt per sound index version and template
+    mtime, so requests normally only stat the template.
+    """
+    sound_index.refresh()
+    key = (sound_index.version, os.stat(SERVICE_WORKER_TEMPLATE).st_mtime_ns)
+    if _precache["key"] == key:
+        return _precache["manifest"], _precache["script"]
+
+    urls, total = ["/", "/api/sounds"], 0
+    for category, files in sound_index.categories.items():
+        for filename in files:
+            size = sound_index.get(category, filename)["size"]
+            if total + size > PRECACHE_SOUND_BYTES:
+                continue
+            total += size
+            urls.append(f"/api/sound/{urllib.parse.quote(category)}/{urllib.parse.quote(filename)}")
+
+    template = read_file(SERVICE_WORKER_TEMPLATE)
+    digest = hashlib.sha1(sound_index.version.encode())
+    digest.update(HTML.encode())
+    digest.update(template)
+    digest.update("\n".join(urls).encode())
+    manifest = {"version": digest.hexdigest()[:16], "urls": urls, "bytes": total}
+    script = f"self.PRECACHE_MANIFEST = {json.dumps(manifest)};\n".encode() + template
+
+    _precache.update(key=key, manifest=manifest, script=script)
+    return manifest, script
+
+@app.get("/api/precache")
+async def precache(request: Request):
+    manifest, _ = precache_bundle()
+    return cached_json(request, manifest, f'"{manifest["version"]}"')
+
+@app.get("/service-worker.js")
+async def service_worker():
+    """Worker script at the root path (scope "/") with the manifest inlined"""
+    _, script = precache_bundle()
+    return Response(script, media_type="application/javascript", headers={"Cache-Control": "no-cache"})
+
+def import_report(top=15):
+    """Print where startup time goes (python -X importtime on this module)"""
+    code = (
+        "import importlib.util, json, resource, sys, time\n"
+        "started = time.perf_counter()\n"
+        f"spec = importlib.util.spec_from_file_location('server', {os.path.abspath(__file__)!r})\n"
+        "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+        "print(json.dumps({'seconds': time.perf_counter() - started,\n"
+        "                  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,\n"
+        "                  'heavy': [m for m in ('tensorflow', 'librosa', 'numba', 'scipy') if m in sys.modules]}))\n"
+    )
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        return
+
+    # "import time: self [us] | cumulative | imported package", nesting = indentation
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if len(name) - len(name.lstrip()) == 1:
+            top_level.append((int(cumulative) / 1e6, name.strip()))
+
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"\n⏱️  Module load: {summary['seconds']:.2f} s, peak RSS {summary['rss_mb']:.0f} MB "
+          f"(profile: {DETECTOR_PROFILE})")
+    print(f"   Heavy packages loaded: {', '.join(summary['heavy']) or 'none'}\n")
+    for seconds, name in sorted(top_level, reverse=True)[:top]:
+        print(f"   {seconds:7.3f} s  {name}")
+
 if __name__ == "__main__":
     import uvicorn
     import os.path
 
+    if "--import-report" in sys.argv:
+        import_report()
+        sys.exit(0)
+
+    if "--fit-ensemble" in sys.argv:
+        # python 7_FINAL_PRO.py --fit-ensemble [dataset_dir]
+        args = sys.argv[sys.argv.index("--fit-ensemble") + 1:]
+        fit_ensemble(args[0] if args else "dataset")
+        sys.exit(0)
+
     # Check for SSL certificates
     ssl_keyfile = "ssl/key.pem"
     ssl_certfile = "ssl/cert.pem"
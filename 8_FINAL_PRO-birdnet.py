@@ -10,14 +10,21 @@ import json
 import os
 import random
 import base64
-import tempfile
-import soundfile as sf
+import bisect
+import collections
+import hashlib
+import struct
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import librosa
 from datetime import datetime
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 import logging
-from birdnetlib import Recording
+from birdnetlib import RecordingBuffer
 from birdnetlib.analyzer import Analyzer
 
 logging.basicConfig(level=logging.INFO)
@@ -27,8 +34,31 @@ logger = logging.getLogger(__name__)
 SAMPLE_RATE = 22050
 BUFFER_DURATION = 3.0  # BirdNET requires 3-second chunks
 BUFFER_SIZE = int(SAMPLE_RATE * BUFFER_DURATION)  # 66150 samples
+RING_BUFFER_CAPACITY = 2 * BUFFER_SIZE  # Per-session float32 ring buffer (~517 KB)
 CONFIDENCE_THRESHOLD = 0.25  # Minimum confidence for woodpecker detection
 SOUNDS_DIR = "static/sounds"
+SOUND_INDEX_POLL_S = 2.0  # How often the sound index checks folder and file mtimes for changes
+SOUND_CACHE_BYTES = 32 * 1024 * 1024  # Memory budget for sound file bytes (LRU eviction)
+SOUND_MAX_AGE = 3600                  # Cache-Control max-age for sound files (s), then ETag revalidation
+SERVICE_WORKER_TEMPLATE = "static/service-worker.js"  # Served at /service-worker.js with the precache manifest
+PRECACHE_SOUND_BYTES = 50 * 1024 * 1024               # Sound bytes the service worker stores on install
+
+# Analysis worker pool (BirdNET runs off the asyncio event loop)
+ANALYSIS_EXECUTOR = "thread"   # "thread" | "process"
+ANALYSIS_WORKERS = 2           # Each worker loads its own BirdNET analyzer
+ANALYSIS_QUEUE_PER_WORKER = 2  # Max in-flight windows per worker before callers wait
+
+# Metrics (/metrics, Prometheus text format)
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRICS_STAGES = ("decode", "birdnet", "send")
+
+# Binary audio frame: 12-byte header + raw PCM (little-endian)
+#   magic "WP" | version u8 | format u8 | seq u32 | sample_rate u32
+FRAME_HEADER = struct.Struct("<2sBBII")
+FRAME_MAGIC = b"WP"
+FRAME_VERSION = 1
+FRAME_FORMATS = {1: np.int16, 2: np.float32}
+FRAME_SAMPLE_RATES = (8000, 192000)  # Accepted header sample_rate range (Hz)
 
 # Target woodpecker species (Czech Great Spotted Woodpecker)
 WOODPECKER_SPECIES = [
@@ -42,58 +72,365 @@ WOODPECKER_SPECIES = [
     "Eurasian Wryneck"
 ]
 
-# Initialize BirdNET analyzer
-logger.info("🧠 Initializing BirdNET analyzer...")
-try:
-    analyzer = Analyzer()
-    logger.info("✅ BirdNET ready")
-except Exception as e:
-    logger.error(f"❌ BirdNET initialization error: {e}")
-    analyzer = None
+# Per-thread BirdNET analyzer (the interpreter is not thread-safe). Nothing is
+# loaded at import: each analysis worker loads its own, batch tools load one
+# in the thread that calls analyze_with_birdnet.
+_worker_state = threading.local()
+
+def get_analyzer():
+    """This thread's BirdNET analyzer, loaded on first use (None if BirdNET failed)"""
+    if not hasattr(_worker_state, "analyzer"):
+        logger.info("🧠 Initializing BirdNET analyzer...")
+        try:
+            _worker_state.analyzer = Analyzer()
+            logger.info("✅ BirdNET ready")
+        except Exception as e:
+            logger.error(f"❌ BirdNET initialization error: {e}")
+            _worker_state.analyzer = None
+    return _worker_state.analyzer
+
+def _init_analysis_worker():
+    """Load a private BirdNET analyzer for this worker thread/process"""
+    get_analyzer()
+
+def _worker_analyzer_loaded():
+    """Runs in an analysis worker - True if its analyzer loaded"""
+    return get_analyzer() is not None
+
+analyzer_loaded = None  # Worker analyzer state, probed by the first /api/status
+
+class AudioRingBuffer:
+    """
+    Fixed-capacity float32 ring buffer for accumulating audio windows.
+    Oldest samples are dropped when a write would overflow the capacity.
+    """
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.start = 0  # Index of the oldest sample
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def write(self, samples):
+        """Append samples, returns number of dropped (overwritten) samples"""
+        if len(samples) > self.capacity:
+            samples = samples[-self.capacity:]
+        n = len(samples)
+
+        dropped = max(0, self.size + n - self.capacity)
+        if dropped:
+            self.start = (self.start + dropped) % self.capacity
+            self.size -= dropped
+
+        end = (self.start + self.size) % self.capacity
+        first = min(n, self.capacity - end)
+        self.data[end:end + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.size += n
+        return dropped
+
+    def read(self, n):
+        """
+        Pop the n oldest samples. Returns a zero-copy view when the window
+        does not wrap (valid until the next write), otherwise a single copy.
+        """
+        if n > self.size:
+            raise ValueError(f"only {self.size} samples buffered, {n} requested")
+
+        if self.start + n <= self.capacity:
+            window = self.data[self.start:self.start + n]
+        else:
+            head = self.data[self.start:]
+            window = np.concatenate((head, self.data[:n - len(head)]))
+
+        self.start = (self.start + n) % self.capacity
+        self.size -= n
+        return window
+
+# Ring buffers of connected clients (for /api/status)
+session_buffers = {}
 
 app = FastAPI(title="Woodpecker Detector BirdNET")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-def get_sound_categories():
-    categories = {}
-    if not os.path.exists(SOUNDS_DIR):
-        return categories
-    for category in os.listdir(SOUNDS_DIR):
-        cat_path = os.path.join(SOUNDS_DIR, category)
-        if os.path.isdir(cat_path):
-            files = [f for f in os.listdir(cat_path) if f.endswith('.mp3')]
+def probe_duration(path):
+    """Duration in seconds from the file header (None if unreadable)"""
+    try:
+        import soundfile as sf  # Lazy: only needed when the index is (re)built
+        return round(sf.info(path).duration, 3)
+    except Exception:
+        return None
+
+class SoundIndex:
+    """
+    In-memory catalog of SOUNDS_DIR: category -> mp3 files with size and duration.
+
+    Requests never list directories. At most every poll_s seconds the mtimes
+    of SOUNDS_DIR, its category folders and the (size, mtime) of every mp3 are
+    compared with the last build, and the index is rebuilt when a file was
+    added, removed, renamed or overwritten in place.
+    Durations are cached per (path, size, mtime), so a rebuild only probes
+    new files. The version hash changes whenever the catalog does (ETags).
+    """
+
+    def __init__(self, root, poll_s=SOUND_INDEX_POLL_S):
+        self.root = root
+        self.poll_s = poll_s
+        self.signature = None
+        self.checked = None    # time.monotonic() of the last mtime check
+        self.categories = {}   # category -> [filename, ...] (the /api/sounds format)
+        self.entries = {}      # (category, filename) -> {"path", "size", "duration", "etag"}
+        self.durations = {}    # (path, size, mtime_ns) -> seconds
+        self.version = None
+
+    def _signature(self):
+        try:
+            folders = []
+            with os.scandir(self.root) as entries:
+                for folder in sorted((e for e in entries if e.is_dir()), key=lambda e: e.name):
+                    with os.scandir(folder.path) as files:
+                        # File mtimes: an in-place overwrite leaves the folder mtime unchanged
+                        stats = sorted((f.name, f.stat().st_size, f.stat().st_mtime_ns)
+                                       for f in files if f.name.endswith('.mp3'))
+                    folders.append((folder.name, folder.stat().st_mtime_ns, tuple(stats)))
+            return os.stat(self.root).st_mtime_ns, tuple(folders)
+        except OSError:
+            return None
+
+    def refresh(self, force=False):
+        """Rebuild if SOUNDS_DIR changed (checked at most every poll_s seconds)"""
+        now = time.monotonic()
+        if not force and self.checked is not None and now - self.checked < self.poll_s:
+            return
+        self.checked = now
+
+        signature = self._signature()
+        if signature != self.signature or self.version is None:
+            self._rebuild()
+            self.signature = signature
+
+    def _rebuild(self):
+        categories, entries, durations = {}, {}, {}
+        folders = sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []
+        for category in folders:
+            cat_path = os.path.join(self.root, category)
+            if not os.path.isdir(cat_path):
+                continue
+            files = []
+            for filename in sorted(os.listdir(cat_path)):
+                if not filename.endswith('.mp3'):
+                    continue
+                path = os.path.join(cat_path, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # Removed while listing
+                key = (path, st.st_size, st.st_mtime_ns)
+                durations[key] = self.durations[key] if key in self.durations else probe_duration(path)
+                entries[(category, filename)] = {"path": path, "size": st.st_size, "duration": durations[key],
+                                                 "etag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"'}
+                files.append(filename)
             if files:
                 categories[category] = files
-    return categories
+
+        self.categories, self.entries, self.durations = categories, entries, durations
+        etags = sorted(entry["etag"] for entry in entries.values())
+        self.version = hashlib.sha1(json.dumps([self.index(), etags], sort_keys=True).encode()).hexdigest()[:16]
+        logger.info(f"📚 Sound index: {len(entries)} files in {len(categories)} categories")
+
+    def index(self):
+        """Catalog with sizes and durations (for client-side prefetch)"""
+        return {
+            category: [{"file": f, "size": self.entries[(category, f)]["size"],
+                        "duration": self.entries[(category, f)]["duration"]} for f in files]
+            for category, files in self.categories.items()
+        }
+
+    def etag(self, variant):
+        return f'"{self.version}-{variant}"'
+
+    def get(self, category, filename):
+        return self.entries.get((category, filename))
+
+class SoundCache:
+    """
+    LRU cache of sound file bytes bounded by max_bytes. Entries are keyed by
+    path and validated by the file's ETag, so a replaced file is read again.
+    Only used from the event loop (file reads run in a thread).
+    """
+
+    def __init__(self, max_bytes=SOUND_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.items = collections.OrderedDict()  # path -> (etag, bytes), oldest first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path, etag):
+        item = self.items.get(path)
+        if item is None or item[0] != etag:
+            self.misses += 1
+            return None
+        self.items.move_to_end(path)
+        self.hits += 1
+        return item[1]
+
+    def put(self, path, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self.items.pop(path, None)
+        if old is not None:
+            self.nbytes -= len(old[1])
+        self.items[path] = (etag, data)
+        self.nbytes += len(data)
+
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self.items.popitem(last=False)
+            self.nbytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "files": len(self.items),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+sound_index = SoundIndex(SOUNDS_DIR)
+sound_cache = SoundCache(SOUND_CACHE_BYTES)
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def parse_range(header, size):
+    """
+    Single-range "bytes=a-b" / "bytes=a-" / "bytes=-n" -> inclusive (start, end).
+    None = serve the whole file (no, malformed or multi-range header),
+    False = unsatisfiable (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            return (max(0, size - suffix), size - 1) if suffix > 0 and size else False
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+def get_sound_categories():
+    sound_index.refresh()
+    return sound_index.categories
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check (weak comparison, "*" matches anything)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def cached_json(request, payload, etag):
+    """JSON response that phones can revalidate with If-None-Match (304, no body)"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
 
 @app.get("/api/sounds")
-async def list_sounds():
-    return get_sound_categories()
+async def list_sounds(request: Request):
+    sound_index.refresh()
+    return cached_json(request, sound_index.categories, sound_index.etag("list"))
+
+@app.get("/api/sounds/index")
+async def sounds_index(request: Request):
+    sound_index.refresh()
+    return cached_json(request, sound_index.index(), sound_index.etag("index"))
 
 @app.get("/api/sound/{category}/{filename}")
-async def serve_sound(category: str, filename: str):
-    file_path = os.path.join(SOUNDS_DIR, category, filename)
-    if not os.path.exists(file_path):
-        return {"error": "Not found"}
-    return FileResponse(file_path, media_type="audio/mpeg")
+async def serve_sound(category: str, filename: str, request: Request):
+    """Sound bytes from the in-memory LRU cache, with ETag and Range support"""
+    sound_index.refresh()
+    entry = sound_index.get(category, filename)
+    if entry is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+
+    headers = {
+        "ETag": entry["etag"],
+        "Cache-Control": f"public, max-age={SOUND_MAX_AGE}",
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    data = sound_cache.get(entry["path"], entry["etag"])
+    if data is None:
+        if entry["size"] > sound_cache.max_bytes:
+            return FileResponse(entry["path"], media_type="audio/mpeg", headers=headers)
+        data = await asyncio.to_thread(read_file, entry["path"])
+        sound_cache.put(entry["path"], entry["etag"], data)
+
+    # If-Range: a stale client copy gets the whole file instead of a mismatched slice
+    if_range = request.headers.get("if-range")
+    byte_range = parse_range(request.headers.get("range"), len(data))
+    if byte_range is None or (if_range and if_range != entry["etag"]):
+        return Response(data, media_type="audio/mpeg", headers=headers)
+    if byte_range is False:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+
+    start, end = byte_range
+    return Response(data[start:end + 1], status_code=206, media_type="audio/mpeg",
+                    headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(data)}"})
 
 @app.get("/api/status")
 async def status():
+    global analyzer_loaded
+    if analyzer_loaded is None:
+        # Asked of a worker: in process mode the analyzers live in the child processes
+        analyzer_loaded = await analysis_pool.run(_worker_analyzer_loaded)
     return {
         "status": "running",
         "model": "BirdNET",
-        "analyzer_loaded": analyzer is not None,
+        "analyzer_loaded": analyzer_loaded,
         "threshold": CONFIDENCE_THRESHOLD,
         "buffer_duration": BUFFER_DURATION,
+        "active_sessions": len(session_buffers),
+        "buffer_bytes_per_session": RING_BUFFER_CAPACITY * np.dtype(np.float32).itemsize,
+        "buffer_bytes_total": sum(buf.nbytes for buf in session_buffers.values()),
+        "worker_pool": analysis_pool.stats(),
+        "sound_cache": sound_cache.stats(),
         "sound_categories": list(get_sound_categories().keys())
     }
 
+def is_woodpecker(common_name):
+    """Check if it's ANY woodpecker (European or American)"""
+    # Keywords: woodpecker, sapsucker (woodpecker family), wryneck
+    woodpecker_keywords = ['woodpecker', 'sapsucker', 'wryneck', 'dendrocopos', 'picoides']
+    return any(keyword in common_name.lower() for keyword in woodpecker_keywords)
+
 def analyze_with_birdnet(audio_float32, sr=SAMPLE_RATE):
     """
     Analyze audio using BirdNET for species identification
     Returns: (is_woodpecker, confidence, species_name)
     """
-    if analyzer is None:
+    active_analyzer = get_analyzer()
+    if active_analyzer is None:
         return False, 0.0, None
 
     try:
@@ -102,60 +439,223 @@ def analyze_with_birdnet(audio_float32, sr=SAMPLE_RATE):
         if rms < 0.015:  # Too quiet
             return False, 0.0, None
 
-        # Save audio to temporary file (BirdNET requires file input)
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-            tmp_path = tmp_file.name
-            sf.write(tmp_path, audio_float32, sr)
+        # Analyze numpy buffer directly (no temp WAV, no second decode)
+        recording = RecordingBuffer(
+            active_analyzer,
+            audio_float32,
+            sr,
+            min_conf=0.10  # Low threshold to see all detections
+        )
+        recording.analyze()
 
-        try:
-            # Analyze with BirdNET
-            recording = Recording(
-                analyzer,
-                tmp_path,
-                min_conf=0.10  # Low threshold to see all detections
-            )
-            recording.analyze()
-
-            # Check for woodpecker detections
-            best_woodpecker = None
-            best_confidence = 0.0
-
-            if recording.detections:
-                logger.info(f"🐦 BirdNET found {len(recording.detections)} bird(s)")
-
-                for detection in recording.detections:
-                    common_name = detection.get('common_name', '')
-                    confidence = detection.get('confidence', 0.0)
-
-                    logger.info(f"   - {common_name}: {confidence*100:.1f}%")
-
-                    # Check if it's ANY woodpecker (European or American)
-                    # Keywords: woodpecker, sapsucker (woodpecker family), wryneck
-                    woodpecker_keywords = ['woodpecker', 'sapsucker', 'wryneck', 'dendrocopos', 'picoides']
-                    if any(keyword in common_name.lower() for keyword in woodpecker_keywords):
-                        if confidence > best_confidence:
-                            best_confidence = confidence
-                            best_woodpecker = common_name
-
-            # Cleanup temp file
-            os.unlink(tmp_path)
-
-            if best_woodpecker and best_confidence > CONFIDENCE_THRESHOLD:
-                logger.info(f"🥁 WOODPECKER DETECTED: {best_woodpecker} ({best_confidence*100:.1f}%)")
-                return True, best_confidence, best_woodpecker
+        # Check for woodpecker detections
+        best_woodpecker = None
+        best_confidence = 0.0
 
-            return False, 0.0, None
+        if recording.detections:
+            logger.info(f"🐦 BirdNET found {len(recording.detections)} bird(s)")
 
-        except Exception as e:
-            logger.error(f"❌ BirdNET analysis error: {e}")
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-            return False, 0.0, None
+            for detection in recording.detections:
+                common_name = detection.get('common_name', '')
+                confidence = detection.get('confidence', 0.0)
+
+                logger.info(f"   - {common_name}: {confidence*100:.1f}%")
+
+                if is_woodpecker(common_name):
+                    if confidence > best_confidence:
+                        best_confidence = confidence
+                        best_woodpecker = common_name
+
+        if best_woodpecker and best_confidence > CONFIDENCE_THRESHOLD:
+            logger.info(f"🥁 WOODPECKER DETECTED: {best_woodpecker} ({best_confidence*100:.1f}%)")
+            return True, best_confidence, best_woodpecker
+
+        return False, 0.0, None
 
     except Exception as e:
-        logger.error(f"❌ Audio processing error: {e}")
+        logger.error(f"❌ BirdNET analysis error: {e}")
         return False, 0.0, None
 
+def _timed_call(fn, *args):
+    """Run fn in a worker and report how long it was busy"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+class AnalysisPool:
+    """
+    Bounded thread/process pool for CPU-bound analysis.
+
+    At most workers * queue_per_worker jobs are in flight; further callers
+    wait on an asyncio semaphore (backpressure) instead of queueing without
+    limit, so the event loop only does I/O.
+    """
+
+    def __init__(self, kind, workers, queue_per_worker, initializer=None):
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis",
+                                               initializer=initializer)
+        self.kind = kind
+        self.workers = workers
+        self.capacity = workers * queue_per_worker
+        self.slots = None      # asyncio.Semaphore, created in the running loop
+        self.waiting = 0       # Callers blocked by backpressure
+        self.in_flight = 0     # Jobs submitted to the executor
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.started = time.perf_counter()
+
+    async def run(self, fn, *args):
+        result, _ = await self.run_timed(fn, *args)
+        return result
+
+    async def run_timed(self, fn, *args):
+        """Like run(), but returns (result, seconds the worker was busy)"""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.capacity)
+
+        self.waiting += 1
+        async with self.slots:
+            self.waiting -= 1
+            self.in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                result, busy = await loop.run_in_executor(self.executor, _timed_call, fn, *args)
+                self.busy_seconds += busy
+                self.completed += 1
+                return result, busy
+            finally:
+                self.in_flight -= 1
+
+    def stats(self):
+        uptime = time.perf_counter() - self.started
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "running": min(self.in_flight, self.workers),
+            "queue_depth": max(0, self.in_flight - self.workers) + self.waiting,
+            "waiting_for_slot": self.waiting,
+            "completed": self.completed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "utilization": self.busy_seconds / (self.workers * uptime) if uptime > 0 else 0.0
+        }
+
+analysis_pool = AnalysisPool(ANALYSIS_EXECUTOR, ANALYSIS_WORKERS, ANALYSIS_QUEUE_PER_WORKER,
+                             initializer=_init_analysis_worker)
+
+# ===== METRICS =====
+# Metrics are only written and rendered on the event loop thread, so plain
+# attribute and preallocated list updates need no locks and allocate nothing.
+
+class Counter:
+    """Monotonic counter"""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Histogram:
+    """Fixed-bucket latency histogram (preallocated, last bucket is +Inf)"""
+    __slots__ = ("buckets", "counts", "count", "total")
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+stage_latency = {stage: Histogram() for stage in METRICS_STAGES}
+chunks_total = Counter()
+detections_total = Counter()
+dropped_frames_total = Counter()   # Invalid frames and seq gaps
+dropped_samples_total = Counter()  # Ring buffer overflow
+errors_total = Counter()
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("woodpecker_stage_seconds", "histogram", "Per-chunk latency of each pipeline stage.")
+    for stage, hist in stage_latency.items():
+        cumulative = 0
+        for i, count in enumerate(hist.counts):
+            cumulative += count
+            le = repr(hist.buckets[i]) if i < len(hist.buckets) else "+Inf"
+            lines.append(f'woodpecker_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+        lines.append(f'woodpecker_stage_seconds_sum{{stage="{stage}"}} {hist.total!r}')
+        lines.append(f'woodpecker_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+    for name, counter, help_text in (
+        ("woodpecker_chunks_total", chunks_total, "Audio chunks received."),
+        ("woodpecker_detections_total", detections_total, "BirdNET windows with a woodpecker above the threshold."),
+        ("woodpecker_dropped_frames_total", dropped_frames_total, "Invalid audio frames and frames missing from the seq sequence."),
+        ("woodpecker_dropped_samples_total", dropped_samples_total, "Samples overwritten by ring buffer overflow."),
+        ("woodpecker_errors_total", errors_total, "Malformed messages and failed analysis jobs."),
+    ):
+        family(name, "counter", help_text)
+        lines.append(f"{name} {counter.value}")
+
+    family("woodpecker_active_sessions", "gauge", "Connected WebSocket clients.")
+    lines.append(f"woodpecker_active_sessions {len(session_buffers)}")
+
+    family("woodpecker_worker_queue_depth", "gauge", "Analysis jobs waiting for a worker.")
+    lines.append(f"woodpecker_worker_queue_depth {analysis_pool.stats()['queue_depth']}")
+
+    family("woodpecker_session_buffer_bytes", "gauge", "Audio buffered per session, waiting for a full BirdNET window.")
+    for client_id, buf in session_buffers.items():
+        lines.append(f'woodpecker_session_buffer_bytes{{session="{client_id}"}} {len(buf) * buf.data.itemsize}')
+
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def metrics():
+    # async: rendered on the event loop, so it never races the handlers
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def decode_audio_frame(frame):
+    """Parse binary audio frame -> (seq, sample_rate, audio_float32)"""
+    if len(frame) < FRAME_HEADER.size:
+        raise ValueError(f"frame too short ({len(frame)} bytes)")
+
+    magic, version, fmt, seq, sample_rate = FRAME_HEADER.unpack_from(frame)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"bad header (magic={magic!r}, version={version})")
+
+    dtype = FRAME_FORMATS.get(fmt)
+    if dtype is None:
+        raise ValueError(f"unknown sample format {fmt}")
+
+    low, high = FRAME_SAMPLE_RATES
+    if not low <= sample_rate <= high:
+        raise ValueError(f"sample rate {sample_rate} Hz outside {low}-{high} Hz")
+
+    payload = len(frame) - FRAME_HEADER.size
+    itemsize = np.dtype(dtype).itemsize
+    if payload == 0:
+        raise ValueError("empty payload (header only)")
+    if payload % itemsize:
+        raise ValueError(f"payload of {payload} bytes is not a whole number of {itemsize}-byte samples")
+
+    pcm = np.frombuffer(frame, dtype=dtype, offset=FRAME_HEADER.size)
+    if dtype is np.int16:
+        return seq, sample_rate, pcm.astype(np.float32) / 32768.0
+    return seq, sample_rate, pcm.astype(np.float32)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket handler with 3-second audio buffering for BirdNET"""
@@ -165,61 +665,101 @@ async def websocket_endpoint(websocket: WebSocket):
 
     chunk_count = 0
     detection_count = 0
-    audio_buffer = []  # Buffer to accumulate 3 seconds of audio
+    audio_buffer = AudioRingBuffer(RING_BUFFER_CAPACITY)  # Accumulates 3 seconds of audio
+    session_buffers[client_id] = audio_buffer
     last_species = None
+    last_seq = None
 
     try:
         while True:
             try:
-                # Receive audio data
-                data = await asyncio.wait_for(
-                    websocket.receive_text(),
+                # Receive audio data (binary frame or legacy JSON text)
+                message = await asyncio.wait_for(
+                    websocket.receive(),
                     timeout=30.0
                 )
-
-                message = json.loads(data)
-
-                if message.get("type") == "audio":
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
+                audio_float32 = None
+                seq = None
+
+                if message.get("bytes") is not None:
+                    # Binary frame - raw PCM, no base64/JSON parsing
+                    decode_started = time.perf_counter()
+                    try:
+                        seq, frame_rate, audio_float32 = decode_audio_frame(message["bytes"])
+                    except ValueError as e:
+                        logger.warning(f"⚠️ Invalid audio frame from {client_id}: {e}")
+                        dropped_frames_total.inc()
+                        continue
+
+                    if frame_rate != SAMPLE_RATE:
+                        audio_float32 = librosa.resample(audio_float32, orig_sr=frame_rate, target_sr=SAMPLE_RATE)
+                    stage_latency["decode"].observe(time.perf_counter() - decode_started)
+
+                    if last_seq is not None and seq > last_seq + 1:
+                        dropped_frames_total.inc(seq - last_seq - 1)
+                    last_seq = seq
+                else:
+                    message = json.loads(message["text"])
+
+                    if message.get("type") == "audio":
+                        # Legacy client: base64 int16 in JSON
+                        decode_started = time.perf_counter()
+                        audio_b64 = message.get("audio")
+                        audio_bytes = base64.b64decode(audio_b64)
+                        audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
+                        audio_float32 = audio_int16.astype(np.float32) / 32768.0
+                        stage_latency["decode"].observe(time.perf_counter() - decode_started)
+
+                    elif message.get("type") == "ping":
+                        await websocket.send_text(json.dumps({"type": "pong"}))
+
+                if audio_float32 is not None:
                     chunk_count += 1
-
-                    # Decode base64 audio
-                    audio_b64 = message.get("audio")
-                    audio_bytes = base64.b64decode(audio_b64)
-                    audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
-                    audio_float32 = audio_int16.astype(np.float32) / 32768.0
+                    chunks_total.inc()
 
                     # AMPLIFY 15x for Android microphone
                     audio_float32 = np.clip(audio_float32 * 15.0, -1.0, 1.0)
 
                     # Add to buffer
-                    audio_buffer.extend(audio_float32)
+                    dropped = audio_buffer.write(audio_float32)
+                    if dropped:
+                        dropped_samples_total.inc(dropped)
+                        logger.warning(f"⚠️ Ring buffer overflow for {client_id}: dropped {dropped} samples")
 
                     # Check if we have 3 seconds of audio
                     if len(audio_buffer) >= BUFFER_SIZE:
-                        # Extract 3-second chunk
-                        chunk_3s = np.array(audio_buffer[:BUFFER_SIZE])
-                        audio_buffer = audio_buffer[BUFFER_SIZE:]  # Remove processed audio
+                        # Extract 3-second chunk (view into the ring buffer when not wrapped)
+                        chunk_3s = audio_buffer.read(BUFFER_SIZE)
 
                         logger.info(f"🎵 Analyzing 3s chunk (buffer: {len(audio_buffer)} samples remaining)")
 
-                        # Analyze with BirdNET
-                        is_woodpecker, confidence, species = analyze_with_birdnet(chunk_3s)
+                        # Analyze with BirdNET (in the worker pool, event loop stays free)
+                        (is_woodpecker, confidence, species), busy = await analysis_pool.run_timed(
+                            analyze_with_birdnet, chunk_3s)
+                        stage_latency["birdnet"].observe(busy)
 
                         if is_woodpecker:
                             detection_count += 1
+                            detections_total.inc()
                             last_species = species
                             logger.info(f"🦜 DETECTION #{detection_count}! {species}: {confidence*100:.1f}%")
 
                         # Send result
+                        send_started = time.perf_counter()
                         await websocket.send_text(json.dumps({
                             "detected": bool(is_woodpecker),
                             "probability": float(confidence) if confidence else 0.0,
                             "species": species if species else "—",
                             "chunk": chunk_count,
+                            "seq": seq,
                             "detections": detection_count,
                             "buffer_size": len(audio_buffer),
                             "timestamp": datetime.now().isoformat()
                         }))
+                        stage_latency["send"].observe(time.perf_counter() - send_started)
                     else:
                         # Still buffering, send status update
                         buffer_progress = (len(audio_buffer) / BUFFER_SIZE) * 100
@@ -228,6 +768,7 @@ async def websocket_endpoint(websocket: WebSocket):
                             "probability": 0.0,
                             "species": "Buffering...",
                             "chunk": chunk_count,
+                            "seq": seq,
                             "detections": detection_count,
                             "buffer_progress": buffer_progress,
                             "buffer_size": len(audio_buffer),
@@ -238,9 +779,6 @@ async def websocket_endpoint(websocket: WebSocket):
                     if chunk_count % 20 == 0:
                         logger.info(f"📊 Processed {chunk_count} chunks, {detection_count} detections, buffer: {len(audio_buffer)}")
 
-                elif message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
-
             except asyncio.TimeoutError:
                 logger.warning(f"⏱️  Timeout for client {client_id}")
                 await websocket.send_text(json.dumps({"type": "timeout"}))
@@ -248,8 +786,10 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         logger.info(f"📱 Client disconnected: {client_id} ({chunk_count} chunks, {detection_count} detections)")
     except Exception as e:
+        errors_total.inc()
         logger.error(f"❌ WebSocket error: {e}")
     finally:
+        session_buffers.pop(client_id, None)
         logger.info(f"📱 Session ended: {client_id}")
 
 # ===== HTML INTERFACE =====
@@ -517,6 +1057,22 @@ HTML = """<!DOCTYPE html>
         let muteUntil = 0;
         let pingInterval = null;
 
+        // Binary audio frame: 12-byte header + raw int16 PCM (see decode_audio_frame)
+        const FRAME_HEADER_SIZE = 12;
+        const FRAME_FORMAT_INT16 = 1;
+        let frameSeq = 0;
+
+        function writeFrameHeader(frame, sampleRate) {
+            const view = new DataView(frame);
+            view.setUint8(0, 0x57);  // 'W'
+            view.setUint8(1, 0x50);  // 'P'
+            view.setUint8(2, 1);     // version
+            view.setUint8(3, FRAME_FORMAT_INT16);
+            view.setUint32(4, frameSeq, true);
+            view.setUint32(8, sampleRate, true);
+            frameSeq = (frameSeq + 1) >>> 0;
+        }
+
         const indicator = document.getElementById("indicator");
         const statusText = document.getElementById("status-text");
         const speciesText = document.getElementById("species-text");
@@ -541,6 +1097,22 @@ HTML = """<!DOCTYPE html>
                 console.log("✅ Sounds loaded:", Object.keys(soundCategories));
             });
 
+        // Offline sound library: the service worker precaches every sound and the page,
+        // and only re-downloads when the server publishes a new precache version
+        if ("serviceWorker" in navigator) {
+            navigator.serviceWorker.register("/service-worker.js")
+                .then(registration => fetch("/api/precache")
+                    .then(r => r.json())
+                    .then(manifest => {
+                        if (localStorage.getItem("precacheVersion") !== manifest.version) {
+                            localStorage.setItem("precacheVersion", manifest.version);
+                            console.log("📦 Sound library changed, updating precache:", manifest.version);
+                            return registration.update();
+                        }
+                    }))
+                .catch(err => console.warn("⚠️ Service worker unavailable:", err));
+        }
+
         function connectWebSocket() {
             const wsUrl = wsProtocol + "//" + window.location.host + "/ws";
             console.log("🔗 Connecting to:", wsUrl);
@@ -550,6 +1122,7 @@ HTML = """<!DOCTYPE html>
             ws.onopen = () => {
                 statusDot.classList.add("connected");
                 statusLabel.textContent = "Connected";
+                frameSeq = 0;
                 console.log("✅ WebSocket connected");
 
                 // Periodic ping
@@ -671,22 +1244,15 @@ HTML = """<!DOCTYPE html>
                             const chunk = buffer.slice(0, targetLength);
                             buffer = buffer.slice(targetLength);
 
-                            const int16 = new Int16Array(chunk.length);
+                            // Write int16 PCM straight into the frame payload
+                            const frame = new ArrayBuffer(FRAME_HEADER_SIZE + chunk.length * 2);
+                            const int16 = new Int16Array(frame, FRAME_HEADER_SIZE, chunk.length);
                             for (let i = 0; i < chunk.length; i++) {
                                 int16[i] = Math.max(-32768, Math.min(32767, chunk[i] * 32768));
                             }
+                            writeFrameHeader(frame, audioContext.sampleRate);
 
-                            const bytes = new Uint8Array(int16.buffer);
-                            let binary = '';
-                            for (let i = 0; i < bytes.length; i++) {
-                                binary += String.fromCharCode(bytes[i]);
-                            }
-                            const b64 = btoa(binary);
-
-                            ws.send(JSON.stringify({
-                                type: "audio",
-                                audio: b64
-                            }));
+                            ws.send(frame);
                         }
                     }
                 };
@@ -774,6 +1340,54 @@ HTML = """<!DOCTYPE html>
 async def get():
     return HTMLResponse(HTML)
 
+# Manifest and worker script, rebuilt only when their inputs change
+_precache = {"key": None, "manifest": None, "script": None}
+
+def precache_bundle():
+    """
+    (manifest, service worker script). The manifest lists the URLs the
+    service worker stores on install: the page, the sound list and the
+    sound files (up to PRECACHE_SOUND_BYTES). Its version hashes the sound
+    index, the HTML and the worker template, so clients only re-download
+    when one of them changes. Rebuilt per sound index version and template
+    mtime, so requests normally only stat the template.
+    """
+    sound_index.refresh()
+    key = (sound_index.version, os.stat(SERVICE_WORKER_TEMPLATE).st_mtime_ns)
+    if _precache["key"] == key:
+        return _precache["manifest"], _precache["script"]
+
+    urls, total = ["/", "/api/sounds"], 0
+    for category, files in sound_index.categories.items():
+        for filename in files:
+            size = sound_index.get(category, filename)["size"]
+            if total + size > PRECACHE_SOUND_BYTES:
+                continue
+            total += size
+            urls.append(f"/api/sound/{urllib.parse.quote(category)}/{urllib.parse.quote(filename)}")
+
+    template = read_file(SERVICE_WORKER_TEMPLATE)
+    digest = hashlib.sha1(sound_index.version.encode())
+    digest.update(HTML.encode())
+    digest.update(template)
+    digest.update("\n".join(urls).encode())
+    manifest = {"version": digest.hexdigest()[:16], "urls": urls, "bytes": total}
+    script = f"self.PRECACHE_MANIFEST = {json.dumps(manifest)};\n".encode() + template
+
+    _precache.update(key=key, manifest=manifest, script=script)
+    return manifest, script
+
+@app.get("/api/precache")
+async def precache(request: Request):
+    manifest, _ = precache_bundle()
+    return cached_json(request, manifest, f'"{manifest["version"]}"')
+
+@app.get("/service-worker.js")
+async def service_worker():
+    """Worker script at the root path (scope "/") with the manifest inlined"""
+    _, script = precache_bundle()
+    return Response(script, media_type="application/javascript", headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
     import uvicorn
 
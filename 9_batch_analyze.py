@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+🦜 WOODPECKER DETECTOR - BATCH ANALYSIS
+Offline detection over directories of long field recordings
+
+Walks WAV/FLAC/MP3 files, streams each one through sliding windows and runs
+one of the live detectors on them in a process pool:
+
+    onset    detect_drumming_onset from 7_FINAL_PRO.py
+    cnn      the CNN behind process_audio_chunk in 5_main_app_FIXED.py (batched)
+    birdnet  BirdNET from 8_FINAL_PRO-birdnet.py (batched)
+
+Detections are appended to a CSV (file, offset, detector, confidence). Finished
+files are recorded in a checkpoint next to the CSV, so re-running the same
+command after an interruption continues with the remaining files. A run with
+different settings (detector, hop, threshold, --all-windows) refuses to resume
+into the same CSV.
+
+Usage:
+    python 9_batch_analyze.py recordings/ --detector onset --output detections.csv
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import soundfile as sf
+import soxr
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ===== CONFIG =====
+SAMPLE_RATE = 22050
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3")
+DECODE_BLOCK_S = 60.0      # Audio decoded per read (bounds memory for multi-hour files)
+SCORE_BATCH_SIZE = 64      # Windows per CNN / BirdNET call
+WORKERS = os.cpu_count() or 1
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Detector -> server module it comes from, window length and input gain.
+# Gain mirrors what the live server applies before analysis (15x in 7 and 8).
+DETECTORS = {
+    "onset": {"module": "7_FINAL_PRO.py", "window": 1.0, "gain": 15.0},
+    "cnn": {"module": "5_main_app_FIXED.py", "window": 1.0, "gain": 1.0},
+    "birdnet": {"module": "8_FINAL_PRO-birdnet.py", "window": 3.0, "gain": 15.0},
+}
+
+CSV_FIELDS = ["file", "offset", "detector", "confidence"]
+
+# ===== AUDIO STREAMING =====
+def _audioread_blocks(path, block_seconds):
+    """Fallback decoder (ffmpeg/GStreamer/CoreAudio) for files libsndfile can't open"""
+    import audioread
+
+    with audioread.audio_open(path) as f:
+        block_len = int(f.samplerate * block_seconds) * f.channels
+        pending = []
+        pending_len = 0
+        for buf in f.read_data():
+            samples = np.frombuffer(buf, dtype=np.int16)
+            pending.append(samples)
+            pending_len += len(samples)
+            if pending_len >= block_len:
+                block = np.concatenate(pending).astype(np.float32) / 32768.0
+                pending, pending_len = [], 0
+                yield f.samplerate, block.reshape(-1, f.channels).mean(axis=1)
+        if pending:
+            block = np.concatenate(pending).astype(np.float32) / 32768.0
+            yield f.samplerate, block.reshape(-1, f.channels).mean(axis=1)
+
+def iter_audio_blocks(path, block_seconds=DECODE_BLOCK_S):
+    """Yield mono float32 blocks at SAMPLE_RATE without loading the whole file"""
+    try:
+        info = sf.info(path)
+    except RuntimeError:
+        info = None
+
+    if info is not None:
+        # Downmix as a matrix-vector product (much faster than mean(axis=1))
+        mix = np.full(info.channels, 1.0 / info.channels, dtype=np.float32)
+        raw = ((info.samplerate, block @ mix)
+               for block in sf.blocks(path, blocksize=int(info.samplerate * block_seconds),
+                                      dtype="float32", always_2d=True))
+    else:
+        raw = _audioread_blocks(path, block_seconds)
+
+    # Streaming resampler keeps filter state across blocks (no seams at block edges)
+    resampler = None
+    for sr, block in raw:
+        if sr != SAMPLE_RATE:
+            if resampler is None:
+                resampler = soxr.ResampleStream(sr, SAMPLE_RATE, 1, dtype="float32")
+            block = resampler.resample_chunk(block)
+        yield block
+
+    if resampler is not None:
+        yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+def iter_windows(blocks, window, hop):
+    """
+    Slide a window over a stream of blocks -> (offset_samples, window).
+    The last partial window is zero-padded so the tail of the file is covered.
+    """
+    buf = np.zeros(0, dtype=np.float32)
+    buf_offset = 0   # Absolute sample index of buf[0]
+    covered = 0      # Samples covered by windows so far
+
+    for block in blocks:
+        buf = np.concatenate([buf, block]) if len(buf) else block
+        pos = 0
+        while len(buf) - pos >= window:
+            yield buf_offset + pos, buf[pos:pos + window]
+            covered = buf_offset + pos + window
+            pos += hop
+        buf = buf[pos:]
+        buf_offset += pos
+
+    if buf_offset + len(buf) > covered and len(buf):
+        yield buf_offset, np.pad(buf[:window], (0, max(0, window - len(buf))))
+
+# ===== DETECTORS (run inside worker processes) =====
+_worker = {}
+
+def load_server_module(filename, name):
+    """Import a numbered server script (e.g. 7_FINAL_PRO.py) by file path"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BASE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _init_worker(detector, hop_s, threshold, all_windows):
+    """Load the detector's server module once per worker process"""
+    # Server scripts use relative paths (model file, static/)
+    os.chdir(BASE_DIR)
+    config = DETECTORS[detector]
+    module = load_server_module(config["module"], f"woodpecker_{detector}")
+    # Per-detection INFO logs from the servers would flood the batch output
+    logging.getLogger(module.__name__).setLevel(logging.WARNING)
+
+    _worker.update(
+        detector=detector,
+        module=module,
+        window=int(SAMPLE_RATE * config["window"]),
+        hop=int(SAMPLE_RATE * (hop_s or config["window"])),
+        gain=config["gain"],
+        threshold=module.CONFIDENCE_THRESHOLD if threshold is None else threshold,
+        all_windows=all_windows,
+    )
+
+    # Warm-up (librosa filters, numba JIT, TF graph) so it isn't billed to the first file
+    try:
+        SCORERS[detector]([np.random.default_rng(0).normal(0, 0.1, _worker["window"]).astype(np.float32)])
+    except Exception as e:
+        logger.warning(f"⚠️ Detector warm-up failed: {e}")
+
+def score_onset(windows):
+    """Onset rate/regularity detector, one window at a time (stateless)"""
+    module = _worker["module"]
+    return [module.detect_drumming_onset(w)[1] for w in windows]
+
+def score_cnn(windows):
+    """All windows of a batch through the CNN in a single predict call"""
+    module = _worker["module"]
+    if module.model is None:
+        raise RuntimeError(f"model not loaded ({module.MODEL_PATH})")
+    specs = np.stack([module.compute_mel_spectrogram(w) for w in windows])
+    return module.model.predict(specs[..., np.newaxis], verbose=0)[:, 0].tolist()
+
+def score_birdnet(windows):
+    """
+    Windows are 3 s long, so concatenating them lines up with BirdNET's own
+    3 s segments - one RecordingBuffer call scores the whole batch.
+    """
+    module = _worker["module"]
+    analyzer = module.get_analyzer()
+    if analyzer is None:
+        raise RuntimeError("BirdNET analyzer not available")
+
+    scores = [0.0] * len(windows)
+    # Same silence pre-check as analyze_with_birdnet
+    loud = [i for i, w in enumerate(windows) if np.sqrt(np.mean(w**2)) >= 0.015]
+    if not loud:
+        return scores
+
+    recording = module.RecordingBuffer(analyzer, np.concatenate([windows[i] for i in loud]),
+                                       SAMPLE_RATE, min_conf=0.10)
+    recording.analyze()
+
+    segment = module.BUFFER_DURATION
+    for detection in recording.detections:
+        if not module.is_woodpecker(detection.get("common_name", "")):
+            continue
+        k = int(round(detection["start_time"] / segment))
+        if k < len(loud):
+            scores[loud[k]] = max(scores[loud[k]], float(detection["confidence"]))
+    return scores
+
+SCORERS = {"onset": score_onset, "cnn": score_cnn, "birdnet": score_birdnet}
+
+def analyze_file(path):
+    """Stream one file through the detector -> detection rows + timing stats"""
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    detector = _worker["detector"]
+    score = SCORERS[detector]
+    batch_size = 1 if detector == "onset" else SCORE_BATCH_SIZE
+
+    rows = []
+    n_windows = 0
+    n_samples = 0
+
+    def flush(offsets, windows):
+        for offset, conf in zip(offsets, score(windows)):
+            if _worker["all_windows"] or conf > _worker["threshold"]:
+                rows.append([path, round(offset / SAMPLE_RATE, 3), detector, round(float(conf), 4)])
+
+    def blocks():
+        nonlocal n_samples
+        for block in iter_audio_blocks(path):
+            n_samples += len(block)
+            yield block
+
+    try:
+        offsets, windows = [], []
+        for offset, window in iter_windows(blocks(), _worker["window"], _worker["hop"]):
+            if _worker["gain"] != 1.0:
+                window = np.clip(window * _worker["gain"], -1.0, 1.0)
+            offsets.append(offset)
+            windows.append(window)
+            n_windows += 1
+            if len(windows) >= batch_size:
+                flush(offsets, windows)
+                offsets, windows = [], []
+        if windows:
+            flush(offsets, windows)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "file": path,
+        "rows": rows,
+        "windows": n_windows,
+        "audio_seconds": n_samples / SAMPLE_RATE,
+        "busy_seconds": time.perf_counter() - started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "error": error,
+    }
+
+# ===== CHECKPOINT =====
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def run_settings(args):
+    """Settings that shape the CSV rows - a checkpoint only resumes under the same ones"""
+    return {"detector": args.detector, "hop": args.hop, "threshold": args.threshold,
+            "all_windows": args.all_windows}
+
+def load_checkpoint(checkpoint_path):
+    """Finished files -> checkpoint entry (a torn last line is ignored)"""
+    done = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[entry["file"]] = entry
+    return done
+
+def drop_unfinished_rows(output_path, finished):
+    """
+    Keep only CSV rows of finished files: rows of a run interrupted mid-write
+    and stale rows of files that changed since (and are analyzed again) go
+    """
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, newline="") as f:
+        rows = [row for row in csv.DictReader(f) if row["file"] in finished]
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, output_path)
+
+def find_audio_files(inputs):
+    """All audio files under the given files/directories (absolute, sorted)"""
+    files = []
+    for item in inputs:
+        if os.path.isfile(item):
+            files.append(os.path.abspath(item))
+            continue
+        for root, _, names in os.walk(item):
+            files.extend(os.path.abspath(os.path.join(root, name)) for name in names
+                         if name.lower().endswith(AUDIO_EXTENSIONS))
+    return sorted(set(files))
+
+# ===== MAIN =====
+def main():
+    parser = argparse.ArgumentParser(description="Woodpecker Detector - batch analysis of recordings")
+    parser.add_argument("inputs", nargs="+", help="audio files or directories (searched recursively)")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="onset")
+    parser.add_argument("--output", default="detections.csv", help="detection table (CSV)")
+    parser.add_argument("--hop", type=float, default=None,
+                        help="window hop in seconds (default: window length, no overlap)")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="min confidence (default: the server's CONFIDENCE_THRESHOLD)")
+    parser.add_argument("--all-windows", action="store_true",
+                        help="write every window's score, not just detections")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"processes (default {WORKERS})")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    checkpoint_path = output_path + ".checkpoint.jsonl"
+
+    if args.restart:
+        for path in (output_path, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    done = load_checkpoint(checkpoint_path)
+    settings = run_settings(args)
+    for entry in done.values():
+        previous = {key: entry.get(key) for key in settings}
+        if previous != settings:
+            raise SystemExit(f"❌ {os.path.relpath(checkpoint_path)} was written with {previous}, "
+                             f"this run uses {settings} - pass --restart or a different --output")
+
+    files = find_audio_files(args.inputs)
+    todo = [f for f in files
+            if f not in done or {k: done[f].get(k) for k in ("size", "mtime")} != file_fingerprint(f)]
+    drop_unfinished_rows(output_path, done.keys() - set(todo))
+
+    logger.info(f"🔍 {len(files)} audio files, {len(files) - len(todo)} already done (checkpoint), "
+                f"{len(todo)} to analyze with '{args.detector}' on {args.workers} workers")
+    if not todo:
+        return
+
+    # Largest files first - keeps all workers busy until the end
+    todo.sort(key=os.path.getsize, reverse=True)
+
+    new_file = not os.path.exists(output_path)
+    audio_total = cpu_total = 0.0
+    detections_total = 0
+    started = time.perf_counter()
+
+    with open(output_path, "a", newline="") as out, open(checkpoint_path, "a") as checkpoint:
+        writer = csv.writer(out)
+        if new_file:
+            writer.writerow(CSV_FIELDS)
+
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(args.detector, args.hop, args.threshold, args.all_windows),
+        )
+        try:
+            futures = [executor.submit(analyze_file, path) for path in todo]
+            for i, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                name = os.path.relpath(result["file"])
+
+                if result["error"]:
+                    # Not checkpointed - retried on the next run
+                    logger.error(f"❌ [{i}/{len(todo)}] {name}: {result['error']}")
+                    continue
+
+                # Rows first, then the checkpoint entry (rows without an entry are dropped on resume)
+                writer.writerows(result["rows"])
+                out.flush()
+                checkpoint.write(json.dumps({
+                    "file": result["file"],
+                    **file_fingerprint(result["file"]),
+                    **settings,
+                    "windows": result["windows"],
+                    "detections": len(result["rows"]),
+                    "audio_seconds": round(result["audio_seconds"], 3),
+                }) + "\n")
+                checkpoint.flush()
+
+                audio_total += result["audio_seconds"]
+                cpu_total += result["cpu_seconds"]
+                detections_total += len(result["rows"])
+                # Per-core speed from CPU time (wall time is inflated when workers > cores)
+                speed = result["audio_seconds"] / result["cpu_seconds"] if result["cpu_seconds"] else 0.0
+                logger.info(f"✅ [{i}/{len(todo)}] {name}: {result['audio_seconds']/60:.1f} min, "
+                            f"{len(result['rows'])} rows, {speed:.0f}x realtime per core")
+        except KeyboardInterrupt:
+            logger.warning("⏹️ Interrupted - run the same command again to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"📊 {audio_total/3600:.2f} h of audio in {elapsed:.1f}s: "
+                f"{audio_total/elapsed:.0f}x realtime overall, "
+                f"{audio_total/cpu_total if cpu_total else 0:.0f}x realtime per core, "
+                f"{detections_total} rows → {os.path.relpath(output_path)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+// AudioWorklet capture for 7_FINAL_PRO.py
+//
+// Runs on the audio rendering thread: converts the mono float input to int16
+// and fills complete binary frames (12-byte header + int16 PCM, see
+// decode_audio_frame) and measures their RMS for the energy gate. Each full
+// frame is transferred to the main thread, which only writes the header and
+// decides whether to send it.
+class CaptureProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    const opts = options.processorOptions || {};
+    this.chunkSize = opts.chunkSize || 8000;
+    this.headerSize = opts.headerSize || 12;
+    this.newFrame();
+  }
+
+  newFrame() {
+    this.frame = new ArrayBuffer(this.headerSize + this.chunkSize * 2);
+    this.samples = new Int16Array(this.frame, this.headerSize, this.chunkSize);
+    this.filled = 0;
+    this.sumSquares = 0;
+  }
+
+  process(inputs) {
+    const input = inputs[0];
+    if (!input || input.length === 0) {
+      return true;  // No input connected yet
+    }
+
+    const channel = input[0];
+    let offset = 0;
+    while (offset < channel.length) {
+      const n = Math.min(channel.length - offset, this.chunkSize - this.filled);
+      for (let i = 0; i < n; i++) {
+        const x = channel[offset + i];
+        this.sumSquares += x * x;
+        const s = x * 32768;
+        this.samples[this.filled + i] = s > 32767 ? 32767 : (s < -32768 ? -32768 : s);
+      }
+      offset += n;
+      this.filled += n;
+
+      if (this.filled === this.chunkSize) {
+        // Transfer, not copy: the buffer is detached here and a new one is started
+        const rms = Math.sqrt(this.sumSquares / this.chunkSize);
+        this.port.postMessage({ frame: this.frame, rms }, [this.frame]);
+        this.newFrame();
+      }
+    }
+    return true;
+  }
+}
+
+registerProcessor('capture-processor', CaptureProcessor);
@@ -1,16 +1,106 @@
 // Service Worker for PWA
-const CACHE_NAME = 'woodpecker-detector-v1';
+//
+// Served by the detector servers at /service-worker.js (scope "/") with the
+// precache manifest prepended as self.PRECACHE_MANIFEST = {version, urls}.
+// The version hash changes only when the sound library, the HTML shell or
+// this file change, so the browser reinstalls the worker only then.
+const PRECACHE = self.PRECACHE_MANIFEST || { version: 'dev', urls: [] };
+const CACHE_PREFIX = 'woodpecker-detector-';
+const CACHE_NAME = CACHE_PREFIX + PRECACHE.version;
+const SHELL_URLS = ['/', '/api/sounds'];
 
 self.addEventListener('install', (event) => {
-  console.log('Service Worker installing...');
-  self.skipWaiting();
+  console.log(`Service Worker installing (precache ${PRECACHE.version}, ${PRECACHE.urls.length} URLs)...`);
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      // cache: 'reload' - take fresh bytes from the server, not the HTTP cache
+      .then((cache) => cache.addAll(PRECACHE.urls.map((url) => new Request(url, { cache: 'reload' }))))
+      .then(() => self.skipWaiting())
+  );
 });
 
 self.addEventListener('activate', (event) => {
+  // Drop precaches of older library versions
+  event.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(names
+        .filter((name) => name.startsWith(CACHE_PREFIX) && name !== CACHE_NAME)
+        .map((name) => caches.delete(name))))
+      .then(() => self.clients.claim())
+  );
   console.log('Service Worker activated');
 });
 
+// Serve a Range request (audio elements send "bytes=0-") from a cached full response
+async function rangeResponse(response, rangeHeader) {
+  const match = /^bytes=(\d*)-(\d*)$/.exec(rangeHeader.trim());
+  if (!match || (match[1] === '' && match[2] === '')) {
+    return response;
+  }
+
+  const body = await response.arrayBuffer();
+  const size = body.byteLength;
+  let start;
+  let end;
+  if (match[1] === '') {
+    start = Math.max(0, size - Number(match[2]));
+    end = size - 1;
+  } else {
+    start = Number(match[1]);
+    end = match[2] === '' ? size - 1 : Math.min(Number(match[2]), size - 1);
+  }
+
+  if (start >= size || end < start) {
+    return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${size}` } });
+  }
+
+  const headers = new Headers(response.headers);
+  headers.set('Content-Range', `bytes ${start}-${end}/${size}`);
+  headers.set('Content-Length', String(end - start + 1));
+  return new Response(body.slice(start, end + 1), { status: 206, statusText: 'Partial Content', headers });
+}
+
+// Deterrent sounds: cache first - no network round trip once cached
+async function soundResponse(request) {
+  const cache = await caches.open(CACHE_NAME);
+  let response = await cache.match(request.url);
+
+  if (!response) {
+    // Not precached (library changed or over budget): fetch the whole file once
+    response = await fetch(request.url);
+    if (!response.ok) {
+      return response;
+    }
+    await cache.put(request.url, response.clone());
+  }
+
+  const range = request.headers.get('range');
+  return range ? rangeResponse(response, range) : response;
+}
+
+// App shell and sound list: network first so updates show up, cached copy offline
+async function shellResponse(request, path) {
+  try {
+    return await fetch(request);
+  } catch (err) {
+    const cached = await caches.match(path);
+    if (cached) {
+      return cached;
+    }
+    throw err;
+  }
+}
+
 self.addEventListener('fetch', (event) => {
-  // Let requests go through to server
-  event.respondWith(fetch(event.request));
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== self.location.origin) {
+    return;
+  }
+
+  if (url.pathname.startsWith('/api/sound/')) {
+    event.respondWith(soundResponse(event.request));
+  } else if (SHELL_URLS.includes(url.pathname)) {
+    event.respondWith(shellResponse(event.request, url.pathname));
+  }
+  // Everything else (status, WebSocket, static files) goes to the network as usual
 });
@@ -0,0 +1,47 @@
+"""Binary /ws audio frames: malformed frames are dropped, the session goes on"""
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="module")
+def server():
+    # Onset profile: no TensorFlow; the server uses relative paths (static/)
+    os.environ["WOODPECKER_PROFILE"] = "onset"
+    os.chdir(BASE_DIR)
+    spec = importlib.util.spec_from_file_location("woodpecker_server", os.path.join(BASE_DIR, "7_FINAL_PRO.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def frame(server, seq, payload, fmt=1):
+    return server.FRAME_HEADER.pack(server.FRAME_MAGIC, server.FRAME_VERSION, fmt, seq, server.SAMPLE_RATE) + payload
+
+def test_decode_rejects_empty_and_partial_payloads(server):
+    with pytest.raises(ValueError):
+        server.decode_audio_frame(frame(server, 0, b""))
+    with pytest.raises(ValueError):
+        server.decode_audio_frame(frame(server, 0, b"\x00" * 3))           # 1.5 int16 samples
+    with pytest.raises(ValueError):
+        server.decode_audio_frame(frame(server, 0, b"\x00" * 6, fmt=2))    # 1.5 float32 samples
+
+    seq, rate, audio = server.decode_audio_frame(frame(server, 7, b"\x00\x40" * 4))
+    assert (seq, rate) == (7, server.SAMPLE_RATE)
+    np.testing.assert_allclose(audio, 0.5)
+
+def test_empty_frame_is_dropped_and_session_continues(server):
+    from fastapi.testclient import TestClient
+
+    chunk = (np.random.default_rng(0).normal(0, 0.05, 8000) * 32767).astype("<i2").tobytes()
+    dropped = server.dropped_frames_total.value
+    with TestClient(server.app) as client, client.websocket_connect("/ws") as ws:
+        ws.receive_json()  # gate_config
+        ws.send_bytes(frame(server, 0, b""))
+        ws.send_bytes(frame(server, 0, chunk))
+        assert ws.receive_json()["seq"] == 0
+    assert server.dropped_frames_total.value == dropped + 1
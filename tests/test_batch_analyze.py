@@ -0,0 +1,40 @@
+"""Checkpoint/resume behaviour of 9_batch_analyze.py (onset detector, no TensorFlow)"""
+import csv
+import os
+import subprocess
+import sys
+
+import numpy as np
+import soundfile as sf
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(BASE_DIR, "9_batch_analyze.py")
+SAMPLE_RATE = 22050
+
+def run_batch(recordings, output):
+    # --all-windows: every window writes a row, so row counts don't depend on detections
+    subprocess.run([sys.executable, SCRIPT, str(recordings), "--output", str(output),
+                    "--all-windows", "--workers", "1"], check=True, capture_output=True)
+    with open(output, newline="") as f:
+        return list(csv.DictReader(f))
+
+def test_changed_file_replaces_its_rows(tmp_path):
+    recordings = tmp_path / "recordings"
+    recordings.mkdir()
+    rng = np.random.default_rng(0)
+    for name in ("a.wav", "b.wav"):
+        sf.write(recordings / name, rng.normal(0, 0.05, 3 * SAMPLE_RATE).astype(np.float32), SAMPLE_RATE)
+    output = tmp_path / "detections.csv"
+
+    first = run_batch(recordings, output)
+    assert len(first) > 0
+
+    # Changed mtime: the file is analyzed again and its old rows must go
+    touched = recordings / "a.wav"
+    st = os.stat(touched)
+    os.utime(touched, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    second = run_batch(recordings, output)
+
+    assert len(second) == len(first)
+    key = lambda row: (row["file"], row["offset"])
+    assert sorted(map(key, second)) == sorted(map(key, first))